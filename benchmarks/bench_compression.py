@@ -0,0 +1,98 @@
+"""
+Compare throughput of parsing compressed and plain activity files.
+
+Usage: python bench_compression.py activity_file.csv [genotype_file]
+
+Each supported compression of the activity file is written to a
+temporary directory, and the time to sniff and parse it with
+fishact.parse._load_single_activity_file() is compared to that of the
+plain CSV file. If a genotype file is not given, one with all
+locations in the file labeled 'wt' is written.
+"""
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import fishact
+
+try:
+    import zstandard
+except:
+    zstandard = None
+
+
+def compress(fname, out_fname):
+    """
+    Compress a file according to the extension of `out_fname`.
+    """
+    ext = os.path.splitext(out_fname)[1]
+    with open(fname, 'rb') as f_in:
+        if ext == '.zst':
+            with open(out_fname, 'wb') as f_out:
+                zstandard.ZstdCompressor().copy_stream(f_in, f_out)
+        else:
+            opener = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+            with opener[ext](out_fname, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+
+
+def time_parse(fname, df_gt, n_reps=3):
+    """
+    Best time of sniffing and parsing a file.
+    """
+    times = []
+    for _ in range(n_reps):
+        start = time.time()
+        fishact.parse._load_single_activity_file(fname, df_gt)
+        times.append(time.time() - start)
+
+    return min(times)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    fname = sys.argv[1]
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        if len(sys.argv) > 2:
+            df_gt = fishact.parse.load_gtype(sys.argv[2], quiet=True)
+        else:
+            locs = pd.read_csv(fname, usecols=['location'])['location']
+            locs = sorted(set(int(loc[-3:]) for loc in locs.unique()))
+            df_gt = pd.DataFrame({'location': locs,
+                                  'genotype': ['wt'] * len(locs)})
+
+        size = os.path.getsize(fname) / 2**20
+        t_plain = time_parse(fname, df_gt)
+        print('{0:6s} {1:>10s} {2:>8s} {3:>10s} {4:>9s}'.format(
+                'format', 'size (MB)', 'time (s)', 'MB/s (raw)', 'slowdown'))
+        print('{0:6s} {1:10.1f} {2:8.2f} {3:10.1f} {4:9.2f}'.format(
+                'plain', size, t_plain, size / t_plain, 1.0))
+
+        exts = ['.gz', '.bz2', '.xz']
+        if zstandard is not None:
+            exts.append('.zst')
+        for ext in exts:
+            out_fname = os.path.join(tmpdir, os.path.basename(fname) + ext)
+            compress(fname, out_fname)
+            t = time_parse(out_fname, df_gt)
+            print('{0:6s} {1:10.1f} {2:8.2f} {3:10.1f} {4:9.2f}'.format(
+                    ext[1:], os.path.getsize(out_fname) / 2**20, t, size / t,
+                    t / t_plain))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
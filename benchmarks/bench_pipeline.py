@@ -0,0 +1,146 @@
+"""
+Benchmarks of the analysis pipeline on synthetic experiments.
+
+Usage: [BENCH_WELLS=96,384,1536] [BENCH_DAYS=1,7] [BENCH_ACQUISITIONS=1,2]
+       [BENCH_DATA_DIR=dir] python -m pytest benchmarks/bench_pipeline.py
+       [--benchmark-autosave]
+
+Requires pytest-benchmark. The environment variables give
+comma-separated numbers of wells (default 96), durations in days
+(default 1), and numbers of acquisitions (default 1), and every
+combination is benchmarked. Experiments are generated with
+synthetic.py on first use; set BENCH_DATA_DIR to keep them between
+runs. Slow functions are timed over a few rounds only.
+"""
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+import fishact
+
+from synthetic import write_experiment
+
+# Lights on of day 5 for the default start of synthetic experiments, so
+# that short experiments need not contain it
+zeitgeber_0 = '2017-03-31 09:00:00'
+
+sizes = list(itertools.product(
+        [int(x) for x in os.environ.get('BENCH_WELLS', '96').split(',')],
+        [float(x) for x in os.environ.get('BENCH_DAYS', '1').split(',')],
+        [int(x) for x in
+            os.environ.get('BENCH_ACQUISITIONS', '1').split(',')]))
+
+
+@pytest.fixture(scope='module')
+def data_dir(tmpdir_factory):
+    dirname = os.environ.get('BENCH_DATA_DIR', None)
+    if dirname is None:
+        return str(tmpdir_factory.mktemp('synthetic'))
+    return dirname
+
+
+@pytest.fixture(scope='module', params=sizes,
+                ids=['%dwells-%gdays-%dacq' % s for s in sizes])
+def experiment(request, data_dir):
+    """
+    Activity file names and genotype file name of a synthetic
+    experiment, reusing files already in `data_dir`.
+    """
+    n_wells, days, n_acquisitions = request.param
+    dirname = os.path.join(data_dir, '%d_%g_%d' % request.param)
+    prefix = os.path.join(dirname, 'sim_%dwells_%gdays' % (n_wells, days))
+    fnames = [prefix + '_%d.csv' % (i + 1) for i in range(n_acquisitions)]
+    genotype_fname = prefix + '_genotype.txt'
+    if all(os.path.isfile(fname) for fname in fnames + [genotype_fname]):
+        return fnames, genotype_fname
+
+    return write_experiment(dirname, n_wells=n_wells, days=days,
+                            n_acquisitions=n_acquisitions)
+
+
+@pytest.fixture(scope='module')
+def df(experiment):
+    """
+    Tidy DataFrame of the synthetic experiment.
+    """
+    return fishact.parse.load_activity(*experiment, zeitgeber_0=zeitgeber_0)
+
+
+@pytest.fixture(scope='module')
+def df_resampled(df):
+    """
+    Tidy DataFrame resampled to 10 minute windows.
+    """
+    return fishact.parse.resample(df, 10, quiet=True)
+
+
+def pedantic(benchmark, func, *args, **kwargs):
+    """
+    Time a slow function over a few rounds.
+    """
+    return benchmark.pedantic(func, args=args, kwargs=kwargs, rounds=3,
+                              iterations=1, warmup_rounds=0)
+
+
+def test_load_activity(benchmark, experiment):
+    df = pedantic(benchmark, fishact.parse.load_activity, *experiment,
+                  zeitgeber_0=zeitgeber_0)
+    benchmark.extra_info['rows'] = len(df)
+    benchmark.extra_info['bytes'] = sum(os.path.getsize(fname)
+                                        for fname in experiment[0])
+
+
+def test_resample(benchmark, df):
+    pedantic(benchmark, fishact.parse.resample, df, 10, quiet=True)
+    benchmark.extra_info['rows'] = len(df)
+
+
+def test_bouts(benchmark, df):
+    pedantic(benchmark, fishact.summarize.bouts, df, quiet=True)
+    benchmark.extra_info['rows'] = len(df)
+
+
+def test_daily_summary(benchmark, df):
+    pedantic(benchmark, fishact.summarize.daily_summary, df)
+    benchmark.extra_info['rows'] = len(df)
+
+
+def test_write_daily_summary(benchmark, df, tmpdir):
+    pedantic(benchmark, fishact.summarize.write_daily_summary, df,
+             str(tmpdir.join('summary.csv')))
+
+
+def test_merge_experiments(benchmark, df):
+    # Same experiment as though run on two instruments
+    dfs = [df.copy(), df.copy()]
+    dfs[0]['instrument'] = 'a'
+    dfs[1]['instrument'] = 'b'
+    df_merged = pedantic(benchmark, fishact.parse.merge_experiments, dfs)
+    benchmark.extra_info['rows'] = len(df_merged)
+
+
+def test_composite_locations(benchmark, df_resampled):
+    df = df_resampled.copy()
+    df['trial'] = np.where(df['location'] % 2 == 0, 1, 2)
+
+    # Clear cache so every round does the full computation
+    def composite():
+        fishact.visualize._composite_cache.clear()
+        return fishact.visualize._composite_locations(df)
+
+    pedantic(benchmark, composite)
+
+
+def test_decimate(benchmark, df):
+    pedantic(benchmark, fishact.visualize.decimate, df, max_points=1000)
+
+
+def test_actogram_raster(benchmark, df):
+    pedantic(benchmark, fishact.visualize._actogram_raster, df)
+
+
+def test_trace_aggregator(benchmark, df_resampled):
+    pedantic(benchmark,
+             lambda: fishact.summarize.TraceAggregator().update(df_resampled))
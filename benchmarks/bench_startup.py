@@ -0,0 +1,87 @@
+"""
+Measure cold startup time of the command line tools and of importing
+fishact, and the cost of compiling Numba kernels.
+
+Usage: python bench_startup.py [n_reps]
+
+Each command is run in a fresh Python process `n_reps` times (default
+5), and the best time is reported. The heavy modules imported by each
+command are listed, to check, e.g., that validation does not import
+the plotting stack. The first call of parse._resample_array() is timed
+in two fresh processes; the second loads the kernel from the on-disk
+Numba cache instead of compiling it.
+"""
+import os
+import subprocess
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+scripts = os.path.join(root, 'scripts')
+
+heavy_modules = ['pandas', 'numba', 'bokeh', 'tsplot', 'pyarrow']
+
+report_modules = ('import sys; print(",".join(m for m in %r if m in '
+                  'sys.modules))' % heavy_modules)
+
+commands = [
+    ('fishvalidate.py --help',
+        [os.path.join(scripts, 'fishvalidate.py'), '--help']),
+    ('fishviz.py --help',
+        [os.path.join(scripts, 'fishviz.py'), '--help']),
+    ('fishserve.py --help',
+        [os.path.join(scripts, 'fishserve.py'), '--help']),
+    ('import fishact',
+        ['-c', 'import fishact; ' + report_modules]),
+    ('import fishact.validate',
+        ['-c', 'import fishact.validate; ' + report_modules]),
+    ('import fishact.parse',
+        ['-c', 'import fishact.parse; ' + report_modules]),
+    ('import fishact.visualize',
+        ['-c', 'import fishact.visualize; ' + report_modules])]
+
+jit_code = ('import time, numpy as np, fishact.parse; '
+            't = time.time(); '
+            'fishact.parse._resample_array(np.ones(100), 10); '
+            'print(time.time() - t)')
+
+
+def run(args):
+    """
+    Run Python with arguments, returning wall time and stdout.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+            [root] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    start = time.time()
+    output = subprocess.check_output([sys.executable] + args, env=env,
+                                     stderr=subprocess.DEVNULL)
+
+    return time.time() - start, output.decode().strip()
+
+
+def main():
+    n_reps = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print('{0:26s} {1:>8s}  {2:s}'.format('command', 'time (s)',
+                                          'heavy modules imported'))
+    for name, args in commands:
+        times = []
+        for _ in range(n_reps):
+            t, output = run(args)
+            times.append(t)
+        modules = output if name.startswith('import') else ''
+        print('{0:26s} {1:8.3f}  {2:s}'.format(name, min(times), modules))
+
+    print()
+    _, t_first = run(['-c', jit_code])
+    _, t_cached = run(['-c', jit_code])
+    print('first call of _resample_array, compiling:  {0:.3f} s'.format(
+                float(t_first)))
+    print('first call of _resample_array, from cache: {0:.3f} s'.format(
+                float(t_cached)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Generate synthetic instrument activity files for benchmarking.
+
+Usage: python synthetic.py out_dir [--wells 96] [--days 1]
+                                   [--acquisitions 1] [--seed 0]
+
+Writes activity files with the column layout of the instrument's CSV
+export, ordered by time and then location, and a genotype file. The
+activity of each well switches between sleep and wake according to a
+two-state Markov chain whose transition probabilities depend on the
+light, so that sleep, bouts, and day/night summaries look like those of
+real experiments. No data need to be downloaded.
+"""
+import argparse
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+columns = ['location', 'animal', 'user', 'sn', 'an', 'datatype', 'start',
+           'end', 'startreason', 'endreason', 'frect', 'fredur', 'midct',
+           'middur', 'burct', 'burdur', 'stdate', 'sttime']
+
+# Per-minute probabilities of falling asleep and waking, (day, night)
+p_sleep = (0.02, 0.15)
+p_wake = (0.3, 0.08)
+
+
+def markov_activity(n_wells, light, interval=60, seed=None):
+    """
+    Seconds of activity per interval of wells switching between sleep
+    and wake.
+
+    Parameters
+    ----------
+    n_wells : int
+        Number of wells.
+    light : ndarray of bools
+        Whether the light is on at each time point.
+    interval : int, default 60
+        Length of each time point in seconds.
+    seed : int, default None
+        Seed for the random number generator.
+
+    Returns
+    -------
+    output : ndarray
+        Array of shape (len(light), n_wells) of 'middur' values, zero
+        when asleep and rounded to 0.1 seconds.
+    """
+    rg = np.random.RandomState(seed)
+    scale = interval / 60
+
+    asleep = rg.uniform(size=n_wells) < 0.1
+    middur = np.empty((len(light), n_wells))
+    for i, is_light in enumerate(light):
+        u = rg.uniform(size=n_wells)
+        fall = u < p_sleep[0 if is_light else 1] * scale
+        wake = u < p_wake[0 if is_light else 1] * scale
+        asleep = np.where(asleep, ~wake, fall)
+
+        active = rg.gamma(2.0, 4.0 if is_light else 1.5, size=n_wells)
+        middur[i] = np.where(asleep, 0.0, np.minimum(active, interval))
+
+    return np.round(middur, 1)
+
+
+def write_genotype_file(fname, n_wells, genotypes=['wt', 'het', 'mut']):
+    """
+    Write a genotype file with wells assigned to genotypes in turn.
+    """
+    wells = np.arange(1, n_wells+1)
+    df = pd.DataFrame({gtype: pd.Series(wells[i::len(genotypes)])
+                            for i, gtype in enumerate(genotypes)},
+                      columns=genotypes)
+    df.to_csv(fname, sep='\t', index=False, float_format='%.0f')
+
+
+def write_activity_file(fname, n_wells=96, days=1.0, interval=60,
+                        start='2017-03-30 14:00:00', lights_on='9:00:00',
+                        lights_off='23:00:00', chunk_times=1440, seed=None):
+    """
+    Write a synthetic activity file of the instrument.
+
+    Parameters
+    ----------
+    fname : str
+        Name of file to write.
+    n_wells : int, default 96
+        Number of wells. Locations are named 'c1-001', 'c1-002', ...
+    days : float, default 1.0
+        Duration of the acquisition in days.
+    interval : int, default 60
+        Time between measurements in seconds.
+    start : str, default '2017-03-30 14:00:00'
+        Clock time of the first measurement.
+    lights_on : str, default '9:00:00'
+        Clock time the lights come on.
+    lights_off : str, default '23:00:00'
+        Clock time the lights go off.
+    chunk_times : int, default 1440
+        Number of time points generated and written at a time, which
+        bounds memory use.
+    seed : int, default None
+        Seed for the random number generator.
+
+    Returns
+    -------
+    output : int
+        Number of rows written.
+    """
+    rg = np.random.RandomState(seed)
+    n_times = int(days * 86400 / interval)
+    time = pd.date_range(start, periods=n_times, freq='%dS' % interval)
+    clock = time.time
+    light = np.logical_and(clock >= pd.to_datetime(lights_on).time(),
+                           clock < pd.to_datetime(lights_off).time())
+    middur = markov_activity(n_wells, light, interval=interval,
+                             seed=rg.randint(2**31))
+
+    locations = np.array(['c1-%03d' % i for i in range(1, n_wells+1)])
+    with open(fname, 'w') as f:
+        for t0 in range(0, n_times, chunk_times):
+            t1 = min(t0 + chunk_times, n_times)
+            n = (t1 - t0) * n_wells
+            x = middur[t0:t1].ravel()
+            start_sec = np.repeat(np.arange(t0, t1) * float(interval),
+                                  n_wells)
+            moving = x > 0
+            df = pd.DataFrame(
+                {'location': np.tile(locations, t1 - t0),
+                 'animal': np.zeros(n, dtype=int),
+                 'user': ['user'] * n,
+                 'sn': np.zeros(n, dtype=int),
+                 'an': np.zeros(n, dtype=int),
+                 'datatype': ['Quantization'] * n,
+                 'start': start_sec,
+                 'end': start_sec + interval,
+                 'startreason': ['Period'] * n,
+                 'endreason': ['Period'] * n,
+                 'frect': rg.poisson(0.5, n),
+                 'fredur': np.round(rg.exponential(0.2, n), 1),
+                 'midct': np.where(moving, rg.poisson(2 * x + 1), 0),
+                 'middur': x,
+                 'burct': np.where(moving, rg.poisson(0.05 * x), 0),
+                 'burdur': np.round(np.where(moving, 0.05 * x, 0.0), 1),
+                 'stdate': np.repeat(time[t0:t1].strftime('%d/%m/%Y'),
+                                     n_wells),
+                 'sttime': np.repeat(time[t0:t1].strftime('%H:%M:%S'),
+                                     n_wells)},
+                columns=columns)
+            df.to_csv(f, index=False, header=(t0 == 0))
+
+    return n_times * n_wells
+
+
+def write_experiment(dirname, n_wells=96, days=1.0, n_acquisitions=1,
+                     interval=60, start='2017-03-30 14:00:00', seed=0):
+    """
+    Write the activity and genotype files of an experiment.
+
+    Parameters
+    ----------
+    dirname : str
+        Directory to write to. It is created if it does not exist.
+    n_wells : int, default 96
+        Number of wells.
+    days : float, default 1.0
+        Total duration of the experiment in days.
+    n_acquisitions : int, default 1
+        Number of acquisitions the experiment is split into, one
+        activity file each, with a five minute gap between them, as
+        when acquisition is restarted.
+    interval : int, default 60
+        Time between measurements in seconds.
+    start : str, default '2017-03-30 14:00:00'
+        Clock time of the first measurement.
+    seed : int, default 0
+        Seed for the random number generator.
+
+    Returns
+    -------
+    fnames : list of strings
+        Names of the activity files, in order.
+    genotype_fname : str
+        Name of the genotype file.
+    """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    prefix = os.path.join(dirname, 'sim_%dwells_%gdays' % (n_wells, days))
+    genotype_fname = prefix + '_genotype.txt'
+    write_genotype_file(genotype_fname, n_wells)
+
+    fnames = []
+    t_start = pd.to_datetime(start)
+    for i in range(n_acquisitions):
+        fname = prefix + '_%d.csv' % (i + 1)
+        write_activity_file(fname, n_wells=n_wells,
+                            days=days / n_acquisitions, interval=interval,
+                            start=str(t_start), seed=seed + i)
+        fnames.append(fname)
+        t_start += datetime.timedelta(days=days / n_acquisitions,
+                                      minutes=5)
+
+    return fnames, genotype_fname
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write synthetic activity and genotype files.')
+    parser.add_argument('out_dir', type=str,
+                        help='Directory to write files to.')
+    parser.add_argument('--wells', action='store', dest='n_wells', type=int,
+                        default=96, help='Number of wells (default 96).')
+    parser.add_argument('--days', action='store', dest='days', type=float,
+                        default=1.0, help='Duration in days (default 1).')
+    parser.add_argument('--acquisitions', action='store',
+                        dest='n_acquisitions', type=int, default=1,
+                        help='Number of acquisitions (default 1).')
+    parser.add_argument('--seed', action='store', dest='seed', type=int,
+                        default=0, help='Random seed (default 0).')
+    args = parser.parse_args()
+
+    fnames, genotype_fname = write_experiment(
+            args.out_dir, n_wells=args.n_wells, days=args.days,
+            n_acquisitions=args.n_acquisitions, seed=args.seed)
+    for fname in fnames + [genotype_fname]:
+        print(fname)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,28 @@
-from . import parse
-from . import summarize
-from . import validate
-from . import visualize
+import importlib
+import sys
+import types
 
-__all__ = [parse, summarize, validate, visualize]
+# Submodules are imported on first access, so that, e.g., validation
+# does not import the plotting stack or Numba
+_submodules = ['parse', 'summarize', 'validate', 'visualize', 'dataset',
+               'catalog', 'store', 'prefetch', 'monitor', 'app', 'profiling',
+               'progress']
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Package module that imports its submodules on attribute access.
+    """
+    def __getattr__(self, name):
+        if name in _submodules:
+            return importlib.import_module('.' + name, self.__name__)
+        raise AttributeError("module '%s' has no attribute '%s'"
+                                % (self.__name__, name))
+
+    def __dir__(self):
+        return sorted(set(list(self.__dict__.keys()) + _submodules))
+
+
+sys.modules[__name__].__class__ = _LazyModule
+
+__all__ = _submodules
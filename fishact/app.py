@@ -0,0 +1,413 @@
+import functools
+import os
+
+import numpy as np
+
+import bokeh.application
+import bokeh.application.handlers
+import bokeh.layouts
+import bokeh.models
+import bokeh.palettes
+import bokeh.plotting
+
+from . import parse
+from . import store
+from . import visualize
+
+
+class AppData(object):
+    """
+    Wells x time arrays served by the Bokeh app.
+
+    Parameters
+    ----------
+    wells : pandas DataFrame
+        One row per well with a 'genotype' column. Row i is row i of
+        each array.
+    zeit : ndarray
+        Zeitgeber time of each column of the arrays, sorted. If plates
+        were started at different times, the mean over wells.
+    arrays : dict
+        arrays[signal] is a 2D array or numpy.memmap of shape
+        (len(wells), len(zeit)). Missing points are NaN.
+    light : ndarray, default None
+        Whether the light is on at each column of the arrays, for
+        most wells.
+
+    Notes
+    -----
+    .. Use from_frame(), from_store(), or load() to make instances.
+       When made from a store, the arrays are memory-mapped, and only
+       the parts that are viewed are read from disk.
+    """
+    def __init__(self, wells, zeit, arrays, light=None):
+        self.wells = wells
+        self.zeit = zeit
+        self.arrays = arrays
+        self.light = light
+        self.signals = list(arrays.keys())
+        self.genotypes = sorted(wells['genotype'].unique())
+
+    @classmethod
+    def from_frame(cls, df, signals=['activity', 'sleep'],
+                   loc_name='location'):
+        """
+        Make AppData from a tidy DataFrame.
+        """
+        signals = [signal for signal in signals if signal in df.columns]
+        df_wells, zeit_ind, arrays, (_, time_code) = parse._wells_by_time(
+                                            df, signals, loc_name=loc_name)
+        df_axis = store._common_axis(df, zeit_ind, time_code)
+        light = df_axis['light'].values if 'light' in df_axis.columns \
+                    else None
+
+        return cls(df_wells, df_axis['zeit'].values, arrays, light=light)
+
+    @classmethod
+    def from_store(cls, activity_store):
+        """
+        Make AppData from a store.ActivityStore without reading the
+        signal arrays.
+        """
+        arrays = {signal: activity_store[signal]
+                    for signal in activity_store.signals}
+        light = activity_store.axis['light'].values \
+                    if 'light' in activity_store.axis.columns else None
+
+        return cls(activity_store.wells, activity_store.axis['zeit'].values,
+                   arrays, light=light)
+
+    @classmethod
+    def load(cls, fname, genotype_fname=None, **kwargs):
+        """
+        Load AppData from a store directory, a Parquet or Feather file
+        written by parse.write_tidy(), or an activity file.
+
+        Parameters
+        ----------
+        fname : str
+            Directory of a store written by store.write_store(), a
+            '.parquet' or '.feather' file, or an activity file.
+        genotype_fname : str, default None
+            Genotype file. If given, `fname` is an activity file;
+            otherwise a CSV `fname` is read as a tidy file.
+        **kwargs
+            Passed to parse.load_activity() for activity files.
+        """
+        if os.path.isdir(fname):
+            return cls.from_store(store.ActivityStore(fname))
+
+        # Without a genotype file, a CSV file is a tidy file
+        if parse._output_format(fname) != 'csv' or genotype_fname is None:
+            df = parse.read_tidy(fname)
+        else:
+            df = parse.load_activity(fname, genotype_fname, **kwargs)
+
+        return cls.from_frame(df)
+
+
+def view_data(data, signal='activity', genotype=None, zeit_range=None,
+              ind_win=1, max_points=1000):
+    """
+    Compute the traces for the current view of the app.
+
+    Parameters
+    ----------
+    data : AppData
+        Data being served.
+    signal : str, default 'activity'
+        Signal to show.
+    genotype : str, default None
+        Genotype to show. If None, all wells are shown.
+    zeit_range : 2-tuple, default None
+        Range of Zeitgeber time in view. If None, all times.
+    ind_win : int, default 1
+        Resampling window in units of time points. As in
+        parse.resample(), the signal is summed over each window.
+    max_points : int, default 1000
+        Maximum number of points per trace. Traces with more points
+        after resampling are decimated with the min/max envelope.
+
+    Returns
+    -------
+    traces : dict
+        Data for a multi_line ColumnDataSource with keys 'xs', 'ys',
+        and 'well' (index into data.wells).
+    summary : dict
+        Data for a line ColumnDataSource with keys 'x' and 'y', the
+        mean over the wells.
+
+    Notes
+    -----
+    .. Only the rows and columns of the arrays in view are read, so
+       memory-mapped arrays are not read in full.
+    """
+    if genotype is None:
+        wells = np.arange(len(data.wells))
+    else:
+        wells = np.where(data.wells['genotype'].values == genotype)[0]
+
+    # Columns in view, widened by a window so lines reach the edges
+    if zeit_range is None:
+        start, stop = 0, len(data.zeit)
+    else:
+        start = max(0, np.searchsorted(data.zeit, zeit_range[0]) - ind_win)
+        stop = min(len(data.zeit),
+                   np.searchsorted(data.zeit, zeit_range[1]) + ind_win)
+    start -= start % ind_win
+
+    # Read the view; fancy indexing of a memmap only reads these rows
+    y = np.asarray(data.arrays[signal][wells, start:stop], dtype=float)
+    x = data.zeit[start:stop]
+
+    # Resample by summing over windows
+    if ind_win > 1 and y.shape[1] >= ind_win:
+        n_win = y.shape[1] // ind_win
+        y = y[:, :n_win*ind_win].reshape((len(wells), n_win, ind_win))
+        with np.errstate(invalid='ignore'):
+            y = np.nanmean(y, axis=2) * ind_win
+        x = x[:n_win*ind_win:ind_win]
+
+    # Summary trace
+    with np.errstate(invalid='ignore'):
+        y_mean = np.nanmean(y, axis=0) if len(wells) > 0 else np.array([])
+    x_mean = x
+    if len(x_mean) > max_points:
+        inds = visualize._lttb_indices(y_mean[np.newaxis, :], max_points)[0]
+        x_mean, y_mean = x_mean[inds], y_mean[inds]
+
+    # Decimate traces
+    if y.shape[1] > max_points and len(wells) > 0:
+        inds = visualize._minmax_indices(y, max_points)
+        y = y[np.arange(len(wells))[:, np.newaxis], inds]
+        xs = list(x[inds])
+    else:
+        xs = [x] * len(wells)
+
+    traces = {'xs': xs, 'ys': list(y), 'well': list(wells)}
+    summary = {'x': x_mean, 'y': y_mean}
+
+    return traces, summary
+
+
+def make_document(doc, data, ind_win=1, max_points=1000, height=450,
+                  width=900):
+    """
+    Build the app in a Bokeh document.
+
+    Parameters
+    ----------
+    doc : bokeh.document.Document
+        Document of the session.
+    data : AppData
+        Data being served. It is shared by all sessions.
+    ind_win : int, default 1
+        Initial resampling window in units of time points.
+    max_points : int, default 1000
+        Maximum number of points per trace sent to the browser.
+    height : int, default 450
+        Height of plot in pixels.
+    width : int, default 900
+        Width of plot in pixels.
+    """
+    gtype_select = bokeh.models.Select(title='Genotype',
+                                       value=data.genotypes[0],
+                                       options=data.genotypes + ['all'])
+    signal_select = bokeh.models.Select(title='Signal',
+                                        value=data.signals[0],
+                                        options=data.signals)
+    win_slider = bokeh.models.Slider(title='Resampling window (time points)',
+                                     start=1, end=60, step=1, value=ind_win)
+
+    traces, summary = view_data(data, signal=signal_select.value,
+                                genotype=gtype_select.value, ind_win=ind_win,
+                                max_points=max_points)
+    traces_source = bokeh.models.ColumnDataSource(traces)
+    summary_source = bokeh.models.ColumnDataSource(summary)
+
+    p = bokeh.plotting.figure(
+            height=height, width=width, x_axis_label='time (hr)',
+            y_axis_label=signal_select.value,
+            tools='pan,box_zoom,xwheel_zoom,reset,save',
+            active_scroll='xwheel_zoom', output_backend='webgl')
+    for start, end in visualize._dark_intervals(data.zeit, data.light):
+        p.add_layout(bokeh.models.BoxAnnotation(left=start, right=end,
+                                                fill_color='gray',
+                                                fill_alpha=0.1))
+    p.multi_line('xs', 'ys', source=traces_source,
+                 line_color=bokeh.palettes.Category10[3][0], line_alpha=0.3)
+    p.line('x', 'y', source=summary_source, line_width=2,
+           line_color=bokeh.palettes.Category10[3][1])
+
+    # Coalesce bursts of range changes from zooming into one update
+    pending = {'update': False}
+
+    def update():
+        pending['update'] = False
+        if p.x_range.start is None or p.x_range.end is None:
+            zeit_range = None
+        else:
+            zeit_range = (p.x_range.start, p.x_range.end)
+        genotype = None if gtype_select.value == 'all' else gtype_select.value
+        traces, summary = view_data(
+                data, signal=signal_select.value, genotype=genotype,
+                zeit_range=zeit_range, ind_win=int(win_slider.value),
+                max_points=max_points)
+        traces_source.data = traces
+        summary_source.data = summary
+        p.yaxis.axis_label = signal_select.value
+
+    def schedule_update(attr, old, new):
+        if not pending['update']:
+            pending['update'] = True
+            doc.add_timeout_callback(update, 200)
+
+    for widget in [gtype_select, signal_select, win_slider]:
+        widget.on_change('value', schedule_update)
+    p.x_range.on_change('start', schedule_update)
+    p.x_range.on_change('end', schedule_update)
+
+    doc.add_root(bokeh.layouts.column(
+            bokeh.layouts.row(gtype_select, signal_select, win_slider), p))
+    doc.title = 'fish activity explorer'
+
+
+def make_monitor_document(doc, follower, interval=60.0, rollover=2000,
+                          height=300, width=900):
+    """
+    Build a live monitoring dashboard in a Bokeh document.
+
+    Parameters
+    ----------
+    doc : bokeh.document.Document
+        Document of the session.
+    follower : monitor.ActivityFollower
+        Follower of the activity file. It is shared by all sessions.
+    interval : float, default 60.0
+        Seconds between polls of the file.
+    rollover : int, default 2000
+        Maximum number of points per genotype kept in the browser.
+    height : int, default 300
+        Height of each plot in pixels.
+    width : int, default 900
+        Width of each plot in pixels.
+
+    Notes
+    -----
+    .. Only new summary points are sent to the browser, with
+       ColumnDataSource.stream(), which drops the oldest points beyond
+       `rollover`.
+    """
+    colors = bokeh.palettes.Category10[10]
+    cols = ['zeit', 'activity', 'sleep']
+
+    def initial_data():
+        df = follower.history
+        return {gtype: {col: df.loc[df['genotype'] == gtype, col]
+                                  .values[-rollover:] for col in cols}
+                    for gtype in follower.genotypes}
+
+    sources = {gtype: bokeh.models.ColumnDataSource(data)
+                    for gtype, data in initial_data().items()}
+    state = {'n_sent': len(follower.history)}
+
+    plots = []
+    for signal in ['activity', 'sleep']:
+        p = bokeh.plotting.figure(
+                height=height, width=width, x_axis_label='time (hr)',
+                y_axis_label=signal, tools='pan,box_zoom,xwheel_zoom,reset',
+                x_range=plots[0].x_range if plots else None)
+        for i, gtype in enumerate(follower.genotypes):
+            p.line('zeit', signal, source=sources[gtype],
+                   line_color=colors[i % len(colors)], legend_label=str(gtype))
+        p.legend.location = 'top_left'
+        p.legend.click_policy = 'hide'
+        plots.append(p)
+
+    def update():
+        follower.poll()
+        df = follower.history
+
+        # History was reset because the file was restarted
+        if len(df) < state['n_sent']:
+            for gtype, data in initial_data().items():
+                sources[gtype].data = data
+            state['n_sent'] = len(df)
+            return
+
+        df_new = df.iloc[state['n_sent']:]
+        state['n_sent'] = len(df)
+        for gtype, df_g in df_new.groupby('genotype'):
+            if gtype in sources:
+                sources[gtype].stream({col: df_g[col].values for col in cols},
+                                      rollover=rollover)
+
+    doc.add_periodic_callback(update, int(interval * 1000))
+    doc.add_root(bokeh.layouts.column(*plots))
+    doc.title = 'fish activity monitor'
+
+
+def _serve(func, port=5006, show=True):
+    """
+    Serve a document-making function with a Bokeh server.
+    """
+    import bokeh.server.server
+
+    handler = bokeh.application.handlers.FunctionHandler(func)
+    server = bokeh.server.server.Server(
+            {'/': bokeh.application.Application(handler)}, port=port)
+    server.start()
+
+    print('Serving on http://localhost:%d/' % port)
+    if show:
+        server.io_loop.add_callback(server.show, '/')
+    server.io_loop.start()
+
+
+def serve(data, port=5006, show=True, ind_win=1, max_points=1000):
+    """
+    Serve the app with a Bokeh server.
+
+    Parameters
+    ----------
+    data : AppData
+        Data to serve. It is kept in memory by the server and shared
+        by all sessions.
+    port : int, default 5006
+        Port to serve on.
+    show : bool, default True
+        If True, open the app in a browser.
+    ind_win : int, default 1
+        Initial resampling window in units of time points.
+    max_points : int, default 1000
+        Maximum number of points per trace sent to the browser.
+    """
+    _serve(functools.partial(make_document, data=data, ind_win=ind_win,
+                             max_points=max_points),
+           port=port, show=show)
+
+
+def serve_monitor(follower, port=5006, show=True, interval=60.0,
+                  rollover=2000):
+    """
+    Serve a live monitoring dashboard of a run in progress.
+
+    Parameters
+    ----------
+    follower : monitor.ActivityFollower
+        Follower of the activity file being written.
+    port : int, default 5006
+        Port to serve on.
+    show : bool, default True
+        If True, open the dashboard in a browser.
+    interval : float, default 60.0
+        Seconds between polls of the file.
+    rollover : int, default 2000
+        Maximum number of points per genotype kept in the browser.
+    """
+    # Read what is already there before the first session connects
+    follower.poll()
+
+    _serve(functools.partial(make_monitor_document, follower=follower,
+                             interval=interval, rollover=rollover),
+           port=port, show=show)
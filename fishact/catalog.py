@@ -0,0 +1,427 @@
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from . import parse
+from . import dataset
+from . import progress as _progress
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY,
+    instrument TEXT NOT NULL,
+    trial TEXT NOT NULL,
+    genotype_fname TEXT NOT NULL,
+    genotype_hash TEXT,
+    genotype_mtime REAL,
+    options TEXT,
+    UNIQUE (instrument, trial)
+);
+CREATE TABLE IF NOT EXISTS activity_files (
+    id INTEGER PRIMARY KEY,
+    experiment_id INTEGER NOT NULL REFERENCES experiments(id),
+    acquisition INTEGER NOT NULL,
+    fname TEXT NOT NULL,
+    hash TEXT,
+    mtime REAL,
+    start_time TEXT,
+    end_time TEXT,
+    interval REAL,
+    n_rows INTEGER
+);
+CREATE TABLE IF NOT EXISTS wells (
+    experiment_id INTEGER NOT NULL REFERENCES experiments(id),
+    location INTEGER NOT NULL,
+    genotype TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS wells_genotype ON wells (genotype);
+CREATE INDEX IF NOT EXISTS files_experiment ON activity_files (experiment_id);
+"""
+
+
+def _scan_activity_file(fname, comment='#', chunksize=100000):
+    """
+    Get time range, sampling interval, and size of an activity file.
+
+    Parameters
+    ----------
+    fname : str
+        Name of activity file.
+    comment : string, default '#'
+        Test that begins and comment line in the file
+    chunksize : int, default 100000
+        Number of rows to read at a time.
+
+    Returns
+    -------
+    output : dict
+        Dictionary with keys 'start_time' and 'end_time' (ISO format
+        strings), 'interval' (median interval in seconds), and 'n_rows'.
+    """
+    _, delimiter, _ = parse._sniff_file_info(fname, check_header=False,
+                                             comment=comment, quiet=True)
+
+    t_min, t_max, n_rows = None, None, 0
+    interval_counts = pd.Series([], dtype=float)
+    with parse._open_text(fname) as f:
+        for df in pd.read_csv(f, usecols=['start', 'end', 'stdate', 'sttime'],
+                              comment=comment, delimiter=delimiter,
+                              chunksize=chunksize):
+            time = pd.to_datetime(df['stdate'] + df['sttime'],
+                                  format='%d/%m/%Y%H:%M:%S')
+            t_min = time.min() if t_min is None else min(t_min, time.min())
+            t_max = time.max() if t_max is None else max(t_max, time.max())
+            interval_counts = interval_counts.add(
+                    (df['end'] - df['start']).value_counts(), fill_value=0)
+            n_rows += len(df)
+
+    # Median interval of the whole file from counts of each interval,
+    # so that only the distinct intervals are kept in memory
+    interval = None
+    interval_counts = interval_counts.sort_index()
+    cum_counts = interval_counts.values.cumsum()
+    if len(cum_counts) > 0:
+        n = cum_counts[-1]
+        inds = np.searchsorted(cum_counts, [(n - 1) // 2 + 1, n // 2 + 1])
+        interval = float(interval_counts.index[inds].values.mean())
+
+    return {'start_time': None if t_min is None else str(t_min),
+            'end_time': None if t_max is None else str(t_max),
+            'interval': interval,
+            'n_rows': n_rows}
+
+
+class Catalog(object):
+    """
+    Index of experiments stored in a local SQLite database.
+
+    Parameters
+    ----------
+    db_fname : str
+        Name of SQLite database file. It is created if it does not
+        exist. Use ':memory:' for a temporary catalog.
+
+    Notes
+    -----
+    .. For each experiment, the catalog stores the instrument and
+       trial, paths, modification times, and hashes of the activity and
+       genotype files, the genotype of each location, and the time
+       range and sampling interval of each activity file. Queries only
+       touch the database, not the data files.
+    .. Instrument and trial are stored JSON-encoded, so that, e.g., the
+       trial 1 and the trial '1' are different.
+    """
+    def __init__(self, db_fname):
+        self.db_fname = db_fname
+        self.conn = sqlite3.connect(db_fname)
+        self.conn.executescript(_schema)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection to the database.
+        """
+        self.conn.close()
+
+    def add(self, fname, genotype_fname, instrument, trial, **kwargs):
+        """
+        Add an experiment to the catalog and index it.
+
+        Parameters
+        ----------
+        fname : str, or list or tuple or strings
+            Activity file(s) of the experiment, as for
+            parse.load_activity().
+        genotype_fname : str
+            Genotype file of the experiment.
+        instrument : str or int
+            Name of instrument used to make measurement.
+        trial : str or int
+            Trial number of measurement.
+        **kwargs
+            Keyword arguments for parse.load_activity() to use when
+            loading the experiment, e.g., `lights_on`. They must be
+            JSON serializable. `comment`, `gtype_double_header`, and
+            `gtype_rstrip` are also used for indexing.
+
+        Returns
+        -------
+        output : int
+            ID of the experiment in the catalog.
+        """
+        if type(fname) == str:
+            fname = [fname]
+
+        with self.conn:
+            cur = self.conn.execute(
+                    'INSERT OR REPLACE INTO experiments '
+                    '(instrument, trial, genotype_fname, options) '
+                    'VALUES (?, ?, ?, ?)',
+                    (json.dumps(instrument), json.dumps(trial),
+                     os.path.abspath(genotype_fname), json.dumps(kwargs)))
+            exp_id = cur.lastrowid
+            self.conn.execute(
+                    'DELETE FROM activity_files WHERE experiment_id NOT IN '
+                    '(SELECT id FROM experiments)')
+            self.conn.execute(
+                    'DELETE FROM wells WHERE experiment_id NOT IN '
+                    '(SELECT id FROM experiments)')
+            self.conn.executemany(
+                    'INSERT INTO activity_files '
+                    '(experiment_id, acquisition, fname) VALUES (?, ?, ?)',
+                    [(exp_id, ac+1, os.path.abspath(f))
+                            for ac, f in enumerate(fname)])
+
+        self._index_experiment(exp_id)
+
+        return exp_id
+
+    def index(self, force=False, progress=None):
+        """
+        Update the index of all experiments.
+
+        Parameters
+        ----------
+        force : bool, default False
+            If True, re-index all files. Otherwise, files are only
+            re-read if their modification time changed and their hash
+            is different from the indexed one.
+        progress : callable, default None
+            Progress callback, reporting experiments indexed and the
+            sizes of their activity files in bytes. See
+            progress.start().
+
+        Returns
+        -------
+        output : int
+            Number of files that were re-read.
+        """
+        ids = [r[0] for r in self.conn.execute('SELECT id FROM experiments')]
+
+        task = _progress.start(progress, 'index', total=len(ids))
+        n_read = 0
+        for exp_id in ids:
+            n_read += self._index_experiment(exp_id, force=force)
+            if task is not _progress._null_task:
+                parse._update_file_progress(task, [r[0] for r in
+                        self.conn.execute('SELECT fname FROM activity_files '
+                                          'WHERE experiment_id = ?',
+                                          (exp_id,))])
+
+        return n_read
+
+    def _index_experiment(self, exp_id, force=False):
+        """
+        Index the files of a single experiment.
+        """
+        n_read = 0
+        gfname, ghash, gmtime, options = self.conn.execute(
+                'SELECT genotype_fname, genotype_hash, genotype_mtime, '
+                'options FROM experiments WHERE id = ?', (exp_id,)).fetchone()
+        options = json.loads(options)
+
+        with self.conn:
+            # Genotype file
+            mtime = os.path.getmtime(gfname)
+            if force or mtime != gmtime:
+                new_hash = parse._file_hash([gfname])
+                if force or new_hash != ghash:
+                    df_gt = parse.load_gtype(
+                        gfname, comment=options.get('comment', '#'),
+                        double_header=options.get('gtype_double_header', None),
+                        rstrip=options.get('gtype_rstrip', False), quiet=True)
+                    self.conn.execute('DELETE FROM wells WHERE experiment_id = ?',
+                                      (exp_id,))
+                    self.conn.executemany(
+                        'INSERT INTO wells VALUES (?, ?, ?)',
+                        [(exp_id, int(loc), str(gtype))
+                            for loc, gtype in zip(df_gt['location'],
+                                                  df_gt['genotype'])])
+                    n_read += 1
+                self.conn.execute(
+                    'UPDATE experiments SET genotype_hash = ?, '
+                    'genotype_mtime = ? WHERE id = ?',
+                    (new_hash, mtime, exp_id))
+
+            # Activity files
+            files = self.conn.execute(
+                    'SELECT id, fname, hash, mtime FROM activity_files '
+                    'WHERE experiment_id = ?', (exp_id,)).fetchall()
+            for file_id, fname, fhash, fmtime in files:
+                mtime = os.path.getmtime(fname)
+                if not force and mtime == fmtime:
+                    continue
+                new_hash = parse._file_hash([fname])
+                if force or new_hash != fhash:
+                    info = _scan_activity_file(
+                            fname, comment=options.get('comment', '#'))
+                    self.conn.execute(
+                        'UPDATE activity_files SET start_time = ?, '
+                        'end_time = ?, interval = ?, n_rows = ? '
+                        'WHERE id = ?',
+                        (info['start_time'], info['end_time'],
+                         info['interval'], info['n_rows'], file_id))
+                    n_read += 1
+                self.conn.execute(
+                    'UPDATE activity_files SET hash = ?, mtime = ? '
+                    'WHERE id = ?', (new_hash, mtime, file_id))
+
+        return n_read
+
+    def experiments(self, genotype=None, instrument=None, trial=None,
+                    start=None, end=None):
+        """
+        Query experiments in the catalog.
+
+        Parameters
+        ----------
+        genotype : str or list of strings, default None
+            Only return experiments with any of these genotypes.
+        instrument : str or int, or list of them, default None
+            Only return experiments with these instruments.
+        trial : str or int, or list of them, default None
+            Only return experiments with these trials.
+        start : str or datetime, default None
+            Only return experiments with data after this time.
+        end : str or datetime, default None
+            Only return experiments with data before this time.
+
+        Returns
+        -------
+        output : pandas DataFrame
+            One row per experiment with columns 'id', 'instrument',
+            'trial', 'genotype_fname', 'activity_fnames' (list),
+            'start_time', 'end_time', 'interval' (seconds), 'n_rows',
+            'n_wells', and 'genotypes' (list).
+        """
+        where = []
+        params = []
+
+        for col, vals in [('instrument', instrument), ('trial', trial)]:
+            if vals is not None:
+                if type(vals) not in [list, tuple]:
+                    vals = [vals]
+                where.append('e.%s IN (%s)' % (col, ','.join('?' * len(vals))))
+                params += [json.dumps(val) for val in vals]
+
+        if genotype is not None:
+            if type(genotype) not in [list, tuple]:
+                genotype = [genotype]
+            where.append('e.id IN (SELECT experiment_id FROM wells WHERE '
+                         'genotype IN (%s))' % ','.join('?' * len(genotype)))
+            params += list(genotype)
+
+        having = []
+        if start is not None:
+            having.append('MAX(f.end_time) >= ?')
+            params_having = [str(pd.to_datetime(start))]
+        else:
+            params_having = []
+        if end is not None:
+            having.append('MIN(f.start_time) <= ?')
+            params_having.append(str(pd.to_datetime(end)))
+
+        query = (
+            'SELECT e.id, e.instrument, e.trial, e.genotype_fname, '
+            'MIN(f.start_time), MAX(f.end_time), '
+            'MIN(f.interval), SUM(f.n_rows) '
+            'FROM experiments e JOIN activity_files f '
+            'ON e.id = f.experiment_id '
+            + ('WHERE ' + ' AND '.join(where) + ' ' if where else '')
+            + 'GROUP BY e.id '
+            + ('HAVING ' + ' AND '.join(having) + ' ' if having else '')
+            + 'ORDER BY e.id')
+        rows = self.conn.execute(query, params + params_having).fetchall()
+
+        cols = ['id', 'instrument', 'trial', 'genotype_fname', 'start_time',
+                'end_time', 'interval', 'n_rows']
+        df = pd.DataFrame(rows, columns=cols)
+        df['instrument'] = df['instrument'].apply(json.loads)
+        df['trial'] = df['trial'].apply(json.loads)
+
+        # Activity files in order of acquisition, as GROUP_CONCAT has no
+        # defined order
+        files = pd.read_sql_query(
+                'SELECT experiment_id, fname FROM activity_files '
+                'ORDER BY experiment_id, acquisition', self.conn)
+        df.insert(4, 'activity_fnames', df['id'].map(
+                files.groupby('experiment_id', sort=False)['fname'].apply(
+                                                                    list)))
+
+        # Add wells and genotypes
+        wells = pd.read_sql_query('SELECT * FROM wells', self.conn)
+        gb = wells.groupby('experiment_id')
+        df['n_wells'] = df['id'].map(gb.size()).fillna(0).astype(int)
+        df['genotypes'] = df['id'].map(
+                gb['genotype'].apply(lambda x: sorted(x.unique())))
+
+        return df
+
+    def wells(self, genotype=None):
+        """
+        Query genotypes of wells.
+
+        Parameters
+        ----------
+        genotype : str or list of strings, default None
+            Only return wells with these genotypes.
+
+        Returns
+        -------
+        output : pandas DataFrame
+            Tidy DataFrame with columns 'instrument', 'trial',
+            'location', and 'genotype'.
+        """
+        query = ('SELECT e.instrument, e.trial, w.location, w.genotype '
+                 'FROM wells w JOIN experiments e ON w.experiment_id = e.id')
+        params = []
+        if genotype is not None:
+            if type(genotype) not in [list, tuple]:
+                genotype = [genotype]
+            query += ' WHERE w.genotype IN (%s)' % ','.join('?'*len(genotype))
+            params = list(genotype)
+        query += ' ORDER BY e.id, w.location'
+
+        df = pd.read_sql_query(query, self.conn, params=params)
+        df['instrument'] = df['instrument'].apply(json.loads)
+        df['trial'] = df['trial'].apply(json.loads)
+
+        return df
+
+    def dataset(self, **kwargs):
+        """
+        Make an ActivityDataset from experiments matching a query.
+
+        Parameters
+        ----------
+        **kwargs
+            Keyword arguments for Catalog.experiments().
+
+        Returns
+        -------
+        output : dataset.ActivityDataset
+            Dataset with the matching experiments registered, using the
+            load options they were added to the catalog with.
+        """
+        df = self.experiments(**kwargs)
+        ds = dataset.ActivityDataset()
+        for _, r in df.iterrows():
+            options = json.loads(self.conn.execute(
+                    'SELECT options FROM experiments WHERE id = ?',
+                    (int(r['id']),)).fetchone()[0])
+            fnames = r['activity_fnames']
+            ds.add(fnames[0] if len(fnames) == 1 else fnames,
+                   r['genotype_fname'], r['instrument'], r['trial'],
+                   **options)
+
+        return ds
@@ -0,0 +1,291 @@
+import copy
+
+import numpy as np
+
+from . import parse
+from . import prefetch
+from . import progress as _progress
+
+# Columns of activity file that may be loaded as extra columns
+_raw_cols = ['animal', 'user', 'sn', 'an', 'datatype', 'start', 'end',
+             'startreason', 'endreason', 'frect', 'fredur', 'midct',
+             'burct', 'burdur', 'stdate', 'sttime']
+
+
+class ActivityDataset(object):
+    """
+    Lazy collection of experiments to be loaded and merged.
+
+    Experiments are registered with add(). Filters and column
+    selections are recorded with filter() and select(), and nothing is
+    read from disk until collect() is called. Filters on genotype and
+    location are pushed down to the loader so only matching wells are
+    parsed, experiments with no matching wells are not read at all, and
+    only the needed columns of the activity files are parsed. A range
+    of Zeitgeber times is converted to a range of clock times, so that
+    only those rows are read (see parse.load_activity()).
+
+    Examples
+    --------
+    >>> ds = ActivityDataset()
+    >>> ds.add('plate1.csv', 'plate1_genotype.txt', 'inst1', 1)
+    >>> ds.add('plate2.csv', 'plate2_genotype.txt', 'inst1', 2)
+    >>> df = ds.filter(genotype='mut', light=False).collect()
+    """
+    def __init__(self):
+        self.experiments = []
+        self.filters = {}
+        self.columns = None
+        self.prefetch_stats = None
+
+    def __len__(self):
+        return len(self.experiments)
+
+    def __repr__(self):
+        return ('ActivityDataset(%d experiments, filters=%s, columns=%s)'
+                    % (len(self), self.filters, self.columns))
+
+    def add(self, fname, genotype_fname, instrument, trial, **kwargs):
+        """
+        Register an experiment.
+
+        Parameters
+        ----------
+        fname : str, or list or tuple or strings
+            Activity file(s) of the experiment, as for
+            parse.load_activity().
+        genotype_fname : str
+            Genotype file of the experiment.
+        instrument : str or int
+            Name of instrument used to make measurement.
+        trial : str or int
+            Trial number of measurement.
+        **kwargs
+            All other keyword arguments are passed to
+            parse.load_activity(), e.g., `lights_on`.
+
+        Returns
+        -------
+        output : ActivityDataset
+            The dataset, so that calls may be chained.
+        """
+        for exp in self.experiments:
+            if (exp['instrument'], exp['trial']) == (instrument, trial):
+                raise RuntimeError('Instrument/trial pair (%s, %s) already '
+                                   'registered.' % (instrument, trial))
+
+        self.experiments.append({'fname': fname,
+                                 'genotype_fname': genotype_fname,
+                                 'instrument': instrument,
+                                 'trial': trial,
+                                 'kwargs': kwargs})
+
+        return self
+
+    def filter(self, genotype=None, location=None, day=None, light=None,
+               zeit_range=None):
+        """
+        Make a new dataset with only rows matching filters.
+
+        Parameters
+        ----------
+        genotype : str or list of strings, default None
+            Only keep these genotypes.
+        location : int or list of ints, default None
+            Only keep these locations.
+        day : int or list of ints, default None
+            Only keep these days.
+        light : bool, default None
+            If True, only keep times when the light is on, and if
+            False, only when the light is off.
+        zeit_range : 2-tuple, default None
+            Only keep Zeitgeber times t with
+            zeit_range[0] <= t < zeit_range[1].
+
+        Returns
+        -------
+        output : ActivityDataset
+            New dataset with the filters added to any existing ones.
+            Filters on the same quantity are intersected.
+        """
+        new = copy.deepcopy(self)
+
+        for key, val in [('genotype', genotype), ('location', location),
+                         ('day', day)]:
+            if val is None:
+                continue
+            if type(val) not in [list, tuple, set]:
+                val = [val]
+            if key in new.filters:
+                val = [v for v in new.filters[key] if v in val]
+            new.filters[key] = list(val)
+
+        if light is not None:
+            if 'light' in new.filters and new.filters['light'] != light:
+                raise RuntimeError('Conflicting light filters.')
+            new.filters['light'] = light
+
+        if zeit_range is not None:
+            if 'zeit_range' in new.filters:
+                zeit_range = (max(zeit_range[0], new.filters['zeit_range'][0]),
+                              min(zeit_range[1], new.filters['zeit_range'][1]))
+            new.filters['zeit_range'] = tuple(zeit_range)
+
+        return new
+
+    def select(self, columns):
+        """
+        Make a new dataset with only some columns.
+
+        Parameters
+        ----------
+        columns : list of strings
+            Columns to keep. The columns 'instrument', 'trial',
+            'location', 'genotype', 'zeit', and 'zeit_ind' are always
+            kept. Columns of the activity file that are not normally
+            kept, e.g. 'frect', are read from the file if requested.
+
+        Returns
+        -------
+        output : ActivityDataset
+            New dataset with the column selection.
+        """
+        new = copy.deepcopy(self)
+        new.columns = list(columns)
+
+        return new
+
+    def _has_wells(self, exp):
+        """
+        Check if any wells of an experiment pass the filters.
+        """
+        kwargs = exp['kwargs']
+
+        # Genotype file is small, so this is cheap
+        df_gt = parse.load_gtype(
+                    exp['genotype_fname'],
+                    comment=kwargs.get('comment', '#'),
+                    double_header=kwargs.get('gtype_double_header', None),
+                    rstrip=kwargs.get('gtype_rstrip', False), quiet=True)
+        if 'genotype' in self.filters:
+            df_gt = df_gt.loc[df_gt['genotype'].isin(self.filters['genotype'])]
+        if 'location' in self.filters:
+            df_gt = df_gt.loc[df_gt['location'].isin(self.filters['location'])]
+
+        return len(df_gt) > 0
+
+    def _load_experiment(self, exp, file_bytes=None):
+        """
+        Load a single experiment, pushing down filters. Returns None if
+        no data are in the Zeitgeber time range.
+        """
+        kwargs = dict(exp['kwargs'])
+        rename = kwargs.get('rename', {'middur': 'activity'})
+        loc_name = rename.get('location', 'location') if rename else 'location'
+
+        # Only parse extra columns from the file that were requested
+        if self.columns is not None:
+            extra_cols = list(kwargs.get('extra_cols', []))
+            extra_cols += [col for col in self.columns
+                                if col in _raw_cols and col not in extra_cols]
+            kwargs['extra_cols'] = extra_cols
+
+        # Only read the time points in the Zeitgeber time range
+        if 'zeit_range' in self.filters:
+            kwargs['time_range'] = parse._zeit_to_time_range(
+                    self.filters['zeit_range'], exp['fname'],
+                    file_bytes=file_bytes, **kwargs)
+            if kwargs['time_range'][0] >= kwargs['time_range'][1]:
+                return None
+
+        try:
+            df = parse.load_activity(
+                    exp['fname'], exp['genotype_fname'],
+                    instrument=exp['instrument'], trial=exp['trial'],
+                    genotypes=self.filters.get('genotype', None),
+                    locations=self.filters.get('location', None),
+                    file_bytes=file_bytes, **kwargs)
+        except RuntimeError as e:
+            # Experiment has no data in the time range
+            if 'zeit_range' in self.filters \
+                    and str(e) == 'No data in `time_range`.':
+                return None
+            raise
+
+        # Filters on derived columns
+        inds = np.ones(len(df), dtype=bool)
+        if 'day' in self.filters:
+            inds &= df['day'].isin(self.filters['day']).values
+        if 'light' in self.filters:
+            inds &= (df['light'] == self.filters['light']).values
+        if 'zeit_range' in self.filters:
+            zeit = df['zeit'].values
+            inds &= (  (zeit >= self.filters['zeit_range'][0])
+                     & (zeit < self.filters['zeit_range'][1]))
+        if not inds.all():
+            df = df.loc[inds, :].reset_index(drop=True)
+
+        # Column selection
+        if self.columns is not None:
+            keep = ['instrument', 'trial', loc_name, 'genotype', 'zeit',
+                    'zeit_ind']
+            keep += [col for col in self.columns
+                        if col in df.columns and col not in keep]
+            df = df[keep]
+
+        return df
+
+    def collect(self, max_prefetch=0, read_func=None, progress=None):
+        """
+        Load, filter, and merge the experiments.
+
+        Parameters
+        ----------
+        max_prefetch : int, default 0
+            If positive, read the activity files of up to this many
+            experiments ahead in a background thread while parsing.
+            See prefetch.Prefetcher.
+        read_func : function, default None
+            Function taking a file name and returning its contents as
+            bytes, used for prefetching. If None, files are read from
+            disk. The timing of the prefetching is stored in the
+            `prefetch_stats` attribute.
+        progress : callable, default None
+            Progress callback, reporting experiments loaded and the
+            sizes of their activity files in bytes. See
+            progress.start().
+
+        Returns
+        -------
+        output : pandas DataFrame
+            Tidy DataFrame as returned by parse.merge_experiments(), or
+            by parse.load_activity() if there is only a single
+            experiment with matching data.
+        """
+        exps = [exp for exp in self.experiments if self._has_wells(exp)]
+        task = _progress.start(progress, 'collect', total=len(exps))
+
+        dfs = []
+        if max_prefetch > 0:
+            groups = [[exp['fname']] if type(exp['fname']) == str
+                                     else list(exp['fname'])
+                        for exp in exps]
+            with prefetch.Prefetcher(groups, read_func=read_func,
+                                     max_prefetch=max_prefetch) as pf:
+                for exp, (_, contents) in zip(exps, pf):
+                    dfs.append(self._load_experiment(exp,
+                                                     file_bytes=contents))
+                    task.update(n_bytes=sum(len(data) for data in contents))
+            self.prefetch_stats = pf.stats
+        else:
+            for exp in exps:
+                dfs.append(self._load_experiment(exp))
+                parse._update_file_progress(task, exp['fname'])
+        dfs = [df for df in dfs if df is not None and len(df) > 0]
+
+        if len(dfs) == 0:
+            raise RuntimeError('No data match the filters.')
+        elif len(dfs) == 1:
+            return dfs[0]
+
+        return parse.merge_experiments(dfs)
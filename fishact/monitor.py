@@ -0,0 +1,239 @@
+import datetime
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from . import parse
+
+
+class ActivityFollower(object):
+    """
+    Follow an activity file that is still being written and keep
+    per-genotype summaries of its new rows.
+
+    Parameters
+    ----------
+    fname : str
+        Activity file being appended to by the instrument. Must be
+        uncompressed.
+    genotype_fname : str
+        Genotype file.
+    bin_width : float, default 1/6
+        Width of the time bins of the summaries in hours.
+    lights_on : string or datetime.time instance, default '9:00:00'
+        The time where lights come on each day.
+    lights_off: string or datetime.time, or None, default '23:00:00'
+        The time where lights go off each day. If None, the light is
+        taken to always be on.
+    day_in_the_life : int, default 4
+        The day in the life of the embryos when data acquisition
+        started.
+    zeitgeber_0 : datetime instance, default None
+        If not None, gives the date and time of Zeitgeber time zero.
+        Otherwise, it is `lights_on` on day `zeitgeber_0_day`, as in
+        parse.load_activity().
+    zeitgeber_0_day : int, default 5
+        The day in the life of the embryos where Zeitgeber time zero is.
+    wake_threshold : float, default 0.1
+        Threshold number of seconds per minute that the fish moved
+        to be considered awake.
+    comment : string, default '#'
+        Test that begins and comment line in the file
+
+    Attributes
+    ----------
+    history : pandas DataFrame
+        All summary points computed so far, with columns 'genotype',
+        'zeit' (start of the bin), 'light', 'activity', 'sleep', and
+        'n_wells'. 'activity' and 'sleep' are the sums over each bin,
+        averaged over the wells of each genotype, as for resampling
+        with parse.resample() and averaging over wells.
+    offset : int
+        Number of bytes of the file parsed so far.
+
+    Notes
+    -----
+    .. Each call to poll() reads only the complete lines appended to
+       the file since the last call. Per-well sums of bins that are
+       not yet complete are kept until a row beyond the bin is read,
+       so memory use does not grow with the length of the run beyond
+       the small history of summary points.
+    .. If the file shrinks, e.g., because acquisition was restarted
+       into the same file, it is followed again from the start.
+    """
+    def __init__(self, fname, genotype_fname, bin_width=1/6,
+                 lights_on='9:00:00', lights_off='23:00:00',
+                 day_in_the_life=4, zeitgeber_0=None, zeitgeber_0_day=5,
+                 wake_threshold=0.1, comment='#'):
+        if os.path.splitext(fname)[1].lower() in parse._compressed_exts:
+            raise RuntimeError('Cannot follow compressed file ' + fname)
+
+        self.fname = fname
+        self.bin_width = bin_width
+        self.day_in_the_life = day_in_the_life
+        self.zeitgeber_0_day = zeitgeber_0_day
+        self.wake_threshold = wake_threshold
+        self.comment = comment
+
+        if type(lights_on) != datetime.time:
+            lights_on = pd.to_datetime(lights_on).time()
+        if type(lights_off) != datetime.time and lights_off is not None:
+            lights_off = pd.to_datetime(lights_off).time()
+        if zeitgeber_0 is not None and type(zeitgeber_0) == str:
+            zeitgeber_0 = pd.to_datetime(zeitgeber_0)
+        self.lights_on = lights_on
+        self.lights_off = lights_off
+        self._zeitgeber_0 = zeitgeber_0
+
+        self.df_gt = parse.load_gtype(genotype_fname, comment=comment,
+                                      quiet=True)
+        self.genotypes = sorted(self.df_gt['genotype'].unique())
+
+        self._reset()
+
+    def _reset(self):
+        """
+        Forget everything read from the file.
+        """
+        self.offset = 0
+        self.zeitgeber_0 = self._zeitgeber_0
+        self.history = pd.DataFrame(columns=['genotype', 'zeit', 'light',
+                                             'activity', 'sleep', 'n_wells'])
+        self._header = None
+        self._pending = None
+        self._max_bin = None
+
+    def _read_new_lines(self):
+        """
+        Read the complete lines appended since the last read.
+        """
+        size = os.path.getsize(self.fname)
+        if size < self.offset:
+            warnings.warn(self.fname + ' shrank; following it from the '
+                          'start.', RuntimeWarning)
+            self._reset()
+
+        with open(self.fname, 'rb') as f:
+            # Header is the line before the first data row
+            if self._header is None:
+                line = f.readline()
+                while line.startswith(self.comment.encode()):
+                    line = f.readline()
+                if not line.endswith(b'\n'):
+                    return b''
+                self._header = line
+                self.offset = f.tell()
+
+            f.seek(self.offset)
+            data = f.read()
+
+        # Only keep complete lines; a partial last line is read next time
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+
+        return data
+
+    def poll(self, final=False):
+        """
+        Parse new rows of the file and update the summaries.
+
+        Parameters
+        ----------
+        final : bool, default False
+            If True, the run is over, and the last, incomplete bin is
+            summarized as well.
+
+        Returns
+        -------
+        output : pandas DataFrame
+            The new summary points, in the format of `history`. Empty
+            if no bins were completed.
+        """
+        data = self._read_new_lines()
+        if data.strip() != b'':
+            df = parse._load_single_activity_file(
+                    self.fname, self.df_gt, comment=self.comment,
+                    data=self._header + data)
+            if len(df) > 0:
+                self._add_rows(df)
+
+        # Summarize complete bins
+        if self._pending is None:
+            return self.history.iloc[:0]
+        bins = self._pending.index.get_level_values('bin')
+        done = np.ones(len(bins), dtype=bool) if final \
+                    else (bins < self._max_bin)
+        if not done.any():
+            return self.history.iloc[:0]
+        df_done = self._pending.loc[done]
+        self._pending = self._pending.loc[~done]
+
+        df_new = self._summarize(df_done)
+        if len(self.history) == 0:
+            self.history = df_new
+        else:
+            self.history = pd.concat([self.history, df_new],
+                                     ignore_index=True)
+
+        return df_new
+
+    def _add_rows(self, df):
+        """
+        Add parsed rows to the per-well sums of pending bins.
+        """
+        if self.zeitgeber_0 is None:
+            t_min = parse._first_time(self.fname, comment=self.comment)
+            self.zeitgeber_0 = datetime.datetime.combine(
+                t_min.date() + datetime.timedelta(
+                        days=self.zeitgeber_0_day - self.day_in_the_life),
+                self.lights_on)
+
+        if self.lights_off is None:
+            light = np.ones(len(df), dtype=bool)
+        else:
+            clock = pd.DatetimeIndex(df['time']).time
+            light = np.logical_and(clock >= self.lights_on,
+                                   clock < self.lights_off)
+
+        # Bin on whole seconds so bin edges are exact
+        seconds = np.round((df['time'] - self.zeitgeber_0)
+                                .dt.total_seconds().values).astype(int)
+        bin_seconds = int(round(self.bin_width * 3600))
+        df = pd.DataFrame({'genotype': df['genotype'].values,
+                           'bin': seconds // bin_seconds,
+                           'location': df['location'].values,
+                           'light': light,
+                           'activity': df['middur'].values,
+                           'sleep': (df['middur'].values
+                                        < self.wake_threshold).astype(int)})
+
+        # Sum of each well in each bin, and light at the start of the bin
+        df_sum = df.groupby(['genotype', 'bin', 'location']).agg(
+                    {'light': 'first', 'activity': 'sum', 'sleep': 'sum'})
+
+        if self._pending is None:
+            self._pending = df_sum
+        else:
+            df_sum = pd.concat([self._pending, df_sum])
+            self._pending = df_sum.groupby(level=[0, 1, 2]).agg(
+                    {'light': 'first', 'activity': 'sum', 'sleep': 'sum'})
+
+        # Rows are in time order, so bins before the last one are complete
+        max_bin = df['bin'].max()
+        if self._max_bin is None or max_bin > self._max_bin:
+            self._max_bin = max_bin
+
+    def _summarize(self, df_sum):
+        """
+        Average per-well sums over the wells of each genotype.
+        """
+        g = df_sum.groupby(level=['genotype', 'bin'])
+        df = g.agg({'light': 'first', 'activity': 'mean', 'sleep': 'mean'})
+        df['n_wells'] = g.size()
+        df = df.reset_index().sort_values(by=['bin', 'genotype'])
+        df['zeit'] = df['bin'] * self.bin_width
+
+        return df[['genotype', 'zeit', 'light', 'activity', 'sleep',
+                   'n_wells']].reset_index(drop=True)
@@ -1,19 +1,108 @@
+import bz2
+import collections
 import csv
 import datetime
+import functools
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import multiprocessing
 import os
+import time
 import warnings
 
+# pyarrow is slow to import, so it is imported on first use
+pyarrow = None
+
 try:
-    import tqdm
+    import zstandard
 except:
-    pass
+    zstandard = None
 
 import numpy as np
 import pandas as pd
-import numba
+
+from . import profiling
+from . import progress as _progress
+
+
+# Extensions of compressed files that may be read directly
+_compressed_exts = ['.gz', '.bz2', '.xz', '.zst']
+
+
+def _strip_compression_ext(fname):
+    """
+    Remove the extension of a compressed file from a file name.
+    """
+    base, ext = os.path.splitext(fname)
+    if ext.lower() in _compressed_exts:
+        return base
+    return fname
+
+
+def _open_text(fname, data=None):
+    """
+    Open a possibly compressed file for reading as text.
+
+    Parameters
+    ----------
+    fname : str
+        Name of file. Files ending in '.gz', '.bz2', '.xz', or '.zst'
+        are decompressed as they are read. Reading '.zst' files
+        requires the zstandard package.
+    data : bytes, default None
+        If not None, the raw contents of the file, already read into
+        memory, e.g., by a prefetch.Prefetcher. The file is then not
+        opened, and `fname` is only used to infer the compression.
+
+    Returns
+    -------
+    output : file object
+        File object in text mode. Decompression is streamed; no
+        temporary files are written.
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    raw = None if data is None else io.BytesIO(data)
+    if ext == '.gz':
+        return gzip.open(fname if raw is None else raw, 'rt')
+    elif ext == '.bz2':
+        return bz2.open(fname if raw is None else raw, 'rt')
+    elif ext == '.xz':
+        return lzma.open(fname if raw is None else raw, 'rt')
+    elif ext == '.zst':
+        if zstandard is None:
+            raise RuntimeError('zstandard must be installed to read '
+                               + fname)
+        reader = zstandard.ZstdDecompressor().stream_reader(
+                        open(fname, 'rb') if raw is None else raw)
+        return io.TextIOWrapper(reader)
+    elif raw is None:
+        return open(fname, 'r')
+    else:
+        return io.TextIOWrapper(raw)
 
 
-def _sniff_file_info(fname, comment='#', check_header=True, quiet=False):
+def _read_csv(fname, data=None, **kwargs):
+    """
+    Read a possibly compressed CSV file with pandas.read_csv().
+
+    Plain files are passed to pandas by name so its C reader opens
+    them directly. Compressed files, and files given as `data` bytes,
+    are streamed through _open_text(). Not for use with `chunksize`,
+    since the file is closed on return.
+    """
+    if data is None \
+            and os.path.splitext(fname)[1].lower() not in _compressed_exts:
+        return pd.read_csv(fname, **kwargs)
+
+    with _open_text(fname, data=data) as f:
+        return pd.read_csv(f, **kwargs)
+
+
+def _sniff_file_info(fname, comment='#', check_header=True, quiet=False,
+                     data=None):
     """
     Infer number of header rows and delimiter of a file.
 
@@ -28,6 +117,8 @@ def _sniff_file_info(fname, comment='#', check_header=True, quiet=False):
         that begins with a non-digit character is header.
     quiet : bool, default False
         If True, suppress output to screen.
+    data : bytes, default None
+        If not None, raw contents of the file, already in memory.
 
     Returns
     -------
@@ -46,7 +137,7 @@ def _sniff_file_info(fname, comment='#', check_header=True, quiet=False):
 
     valid_delimiters = ['\t', ',', ';', '|', ' ']
 
-    with open(fname, 'r') as f:
+    with _open_text(fname, data=data) as f:
         # Read through comments
         line = f.readline()
         while line != '' and line[0] == comment:
@@ -78,12 +169,38 @@ def _sniff_file_info(fname, comment='#', check_header=True, quiet=False):
     return n_header, delimiter, line
 
 
+def _file_hash(fnames, blocksize=2**20):
+    """
+    Compute a hash of the contents of files.
+
+    Parameters
+    ----------
+    fnames : list of strings
+        Names of files to hash together.
+    blocksize : int, default 2**20
+        Number of bytes to read at a time.
+
+    Returns
+    -------
+    output : str
+        Hex digest of SHA-256 hash of contents of all files.
+    """
+    h = hashlib.sha256()
+    for fname in fnames:
+        with open(fname, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                h.update(block)
+
+    return h.hexdigest()
+
+
 def tidy_data(fname, genotype_fname, out_fname, lights_on='9:00:00',
               lights_off='23:00:00', day_in_the_life=4,
               wake_threshold=0.1, extra_cols=[],
               rename={'middur': 'activity'}, comment='#',
               gtype_double_header=None, gtype_rstrip=False, resample_win=1,
-              resample_signal=['activity', 'sleep']):
+              resample_signal=['activity', 'sleep'], format=None,
+              compression='snappy', overwrite=False, progress=None):
     """
     Load in activity data and write tidy data file with possibly 
     resampled data.
@@ -138,9 +255,25 @@ def tidy_data(fname, genotype_fname, out_fname, lights_on='9:00:00',
         Size of resampling window in units of indices.
     resample_signal : list, default ['activity', 'sleep']
         Which signals to resample.
+    format : str, default None
+        Format of output file, one of 'csv', 'parquet', or 'feather'.
+        If None, inferred from the extension of `out_fname`, with CSV
+        used for unknown extensions. Parquet and Feather require
+        pyarrow.
+    compression : str, default 'snappy'
+        Compression codec for Parquet output.
+    overwrite : bool, default False
+        If True, overwrite `out_fname` if it exists. Input files are
+        never overwritten.
+    progress : callable, default None
+        Progress callback for loading and resampling. See
+        progress.start().
 
     Notes
     -----
+    .. Parquet files have one row group per location, so a subset of
+       locations may be read with read_tidy() without reading the
+       whole file.
     .. Writes a tidy data set with columns:
         - activity: The activity as given by the instrument, based
           on the `middur` columns of the inputted data set. This
@@ -178,7 +311,7 @@ def tidy_data(fname, genotype_fname, out_fname, lights_on='9:00:00',
     if out_fname in [fname, genotype_fname]:
         raise RuntimeError('Cowardly refusing to overwrite input file.')
 
-    if os.path.isfile(out_fname):
+    if not overwrite and os.path.isfile(out_fname):
         raise RuntimeError(out_fname 
                 + ' already exists, cowardly refusing to overwrite.')
 
@@ -187,18 +320,532 @@ def tidy_data(fname, genotype_fname, out_fname, lights_on='9:00:00',
         lights_off=lights_off, day_in_the_life=day_in_the_life,
         wake_threshold=wake_threshold, extra_cols=extra_cols,
         rename=rename, comment=comment, 
-        gtype_double_header=gtype_double_header, gtype_rstrip=gtype_rstrip)
+        gtype_double_header=gtype_double_header, gtype_rstrip=gtype_rstrip,
+        progress=progress)
 
     if 'location' in rename:
         loc_name = rename['location']
     else:
         loc_name = 'location'
 
-    df = resample(df, resample_win, signal=resample_signal, loc_name=loc_name)
-    df.to_csv(out_fname, index=False)
+    df = resample(df, resample_win, signal=resample_signal, loc_name=loc_name,
+                  progress=progress)
+    write_tidy(df, out_fname, format=format, compression=compression,
+               group_cols=['instrument', 'trial', loc_name])
+    return None
+
+
+# Parameters of tidy_data() that may be given in a manifest
+_tidy_params = ['lights_on', 'lights_off', 'day_in_the_life',
+                'wake_threshold', 'extra_cols', 'rename', 'comment',
+                'gtype_double_header', 'gtype_rstrip', 'resample_win',
+                'resample_signal', 'format', 'compression']
+
+
+def _load_manifest(manifest):
+    """
+    Load a manifest of experiments for tidy_directory().
+
+    Parameters
+    ----------
+    manifest : str
+        CSV or YAML (extension '.yml' or '.yaml') file. For CSV, each
+        row is an experiment. For YAML, the file is a list of
+        experiments, each a mapping. Each experiment has keys 'fname'
+        and 'genotype_fname', and optionally 'out_fname' and any of
+        the parameters of tidy_data(), e.g., 'lights_on' or
+        'day_in_the_life'. Blank entries in a CSV manifest use the
+        defaults. Relative paths are relative to the manifest.
+
+    Returns
+    -------
+    output : list of dicts
+        One dict per experiment.
+    """
+    if os.path.splitext(manifest)[1].lower() in ['.yml', '.yaml']:
+        import yaml
+        with open(manifest, 'r') as f:
+            exps = yaml.safe_load(f)
+        if type(exps) == dict and 'experiments' in exps:
+            exps = exps['experiments']
+    else:
+        df = pd.read_csv(manifest, comment='#', dtype=str)
+        exps = [{key: val for key, val in row.items() if not pd.isnull(val)}
+                    for row in df.to_dict(orient='records')]
+
+    dirname = os.path.dirname(os.path.abspath(manifest))
+    for i, exp in enumerate(exps):
+        for key in ['fname', 'genotype_fname']:
+            if key not in exp:
+                raise RuntimeError('Experiment %d of manifest is missing %s.'
+                                        % (i, key))
+        for key in exp:
+            if key not in ['fname', 'genotype_fname', 'out_fname'] \
+                    and key not in _tidy_params:
+                raise RuntimeError('Invalid key %s in manifest.' % key)
+        for key in ['fname', 'genotype_fname', 'out_fname']:
+            if key in exp:
+                exp[key] = os.path.join(dirname, exp[key])
+
+        # CSV entries are strings
+        for key in ['day_in_the_life', 'resample_win']:
+            if key in exp:
+                exp[key] = int(exp[key])
+        if 'wake_threshold' in exp:
+            exp['wake_threshold'] = float(exp['wake_threshold'])
+        for key in ['gtype_double_header', 'gtype_rstrip']:
+            if key in exp and type(exp[key]) == str:
+                exp[key] = exp[key].lower() in ['true', '1', 'yes']
+        for key in ['extra_cols', 'resample_signal']:
+            if key in exp and type(exp[key]) == str:
+                exp[key] = exp[key].split()
+        if 'rename' in exp and type(exp['rename']) == str:
+            exp['rename'] = json.loads(exp['rename'])
+
+    return exps
+
+
+def _limit_memory(memory_limit):
+    """
+    Limit the virtual memory of the current process, in MB.
+    """
+    try:
+        import resource
+    except ImportError:
+        warnings.warn('Cannot limit memory on this platform.',
+                      RuntimeWarning)
+        return None
+
+    limit = int(memory_limit * 2**20)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _tidy_experiment_star(args):
+    """
+    Call _tidy_experiment() with a tuple of arguments, for Pool.imap().
+    """
+    return _tidy_experiment(*args)
+
+
+def _update_file_progress(task, fname):
+    """
+    Report a file, or list of files, as done to a progress task.
+    """
+    if task is _progress._null_task:
+        return
+
+    n_bytes = 0
+    for filename in ([fname] if type(fname) == str else fname):
+        if os.path.isfile(filename):
+            n_bytes += os.path.getsize(filename)
+    task.update(n_bytes=n_bytes)
+
+
+def _tidy_experiment(exp, up_to_date):
+    """
+    Run tidy_data() on a single experiment for tidy_directory().
+    """
+    start_time = time.time()
+    exp = dict(exp)
+    fname = exp.pop('fname')
+    genotype_fname = exp.pop('genotype_fname')
+    out_fname = exp.pop('out_fname')
+
+    result = collections.OrderedDict(
+            [('fname', fname),
+             ('genotype_fname', genotype_fname),
+             ('out_fname', out_fname),
+             ('hash', None),
+             ('status', None),
+             ('message', None),
+             ('seconds', None)])
+
+    try:
+        # Hash of inputs and parameters
+        params = json.dumps(exp, sort_keys=True).encode()
+        result['hash'] = hashlib.sha256(
+                _file_hash([fname, genotype_fname]).encode()
+                + params).hexdigest()
+
+        if os.path.isfile(out_fname) \
+                and up_to_date.get(out_fname, None) == result['hash']:
+            result['status'] = 'skipped'
+        else:
+            tidy_data(fname, genotype_fname, out_fname, overwrite=True,
+                      **exp)
+            result['status'] = 'done'
+    except MemoryError:
+        result['status'] = 'error'
+        result['message'] = 'Exceeded memory limit.'
+    except Exception as e:
+        result['status'] = 'error'
+        result['message'] = repr(e)
+
+    result['seconds'] = time.time() - start_time
+
+    return result
+
+
+def tidy_directory(manifest, out_dir, n_jobs=1, memory_limit=None,
+                   summary_fname=None, quiet=False, progress=None):
+    """
+    Run tidy_data() on all experiments in a manifest.
+
+    Parameters
+    ----------
+    manifest : str
+        CSV or YAML file listing the experiments and their parameters.
+        See `Notes`.
+    out_dir : str
+        Directory for output files. It is created if it does not
+        exist.
+    n_jobs : int, default 1
+        Number of processes to use.
+    memory_limit : float, default None
+        Maximum virtual memory of each worker process in MB. An
+        experiment exceeding it gets status 'error'. Only used if
+        `n_jobs` > 1, since it would otherwise limit the calling
+        process.
+    summary_fname : str, default None
+        If given, write the run summary to this file, as CSV if it ends
+        in '.csv' and as JSON otherwise.
+    quiet : bool, default False
+        If True, do not print a line for each experiment to the screen.
+    progress : callable, default None
+        Progress callback, reporting experiments done and the sizes
+        of their input files in bytes. See progress.start(). If None,
+        a progress bar is shown unless `quiet` is True.
+
+    Returns
+    -------
+    output : list of dicts
+        One entry per experiment with keys
+        - fname, genotype_fname: Input files.
+        - out_fname: Output file.
+        - hash: SHA-256 hash of the input files and parameters.
+        - status: One of 'done', 'skipped' (output up to date), or
+          'error'.
+        - message: Error message, if any.
+        - seconds: Time taken.
+
+    Notes
+    -----
+    .. Each experiment in the manifest has keys 'fname' and
+       'genotype_fname', and optionally 'out_fname' and any of the
+       parameters of tidy_data(), e.g., 'lights_on', 'lights_off', or
+       'day_in_the_life'. If 'out_fname' is not given, it is the name
+       of the activity file with '_tidy' appended, in `out_dir`. An
+       example CSV manifest is
+            fname,genotype_fname,lights_on,day_in_the_life
+            exp1.csv,exp1_genotype.txt,9:00:00,4
+            exp2.csv,exp2_genotype.txt,8:00:00,5
+    .. The hashes of written outputs are stored in
+       '.tidy_directory_cache.json' in `out_dir`. An output is skipped
+       if it exists and neither the inputs nor the parameters have
+       changed since it was written.
+    """
+    exps = _load_manifest(manifest)
+
+    # Default output file names
+    out_fnames = set()
+    for exp in exps:
+        if 'out_fname' not in exp:
+            ext = '.csv' if exp.get('format', None) in [None, 'csv'] \
+                         else '.' + exp['format']
+            exp['out_fname'] = os.path.join(
+                    os.path.abspath(out_dir),
+                    os.path.splitext(os.path.basename(exp['fname']))[0]
+                        + '_tidy' + ext)
+        if exp['out_fname'] in out_fnames:
+            raise RuntimeError('Output file %s is used by more than one '
+                               'experiment.' % exp['out_fname'])
+        out_fnames.add(exp['out_fname'])
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    # Load hashes of existing outputs
+    cache_fname = os.path.join(out_dir, '.tidy_directory_cache.json')
+    up_to_date = {}
+    if os.path.isfile(cache_fname):
+        with open(cache_fname, 'r') as f:
+            up_to_date = json.load(f)
+
+    # Process experiments, possibly in parallel
+    task = _progress.start(progress, 'tidy_directory', total=len(exps),
+                           quiet=quiet)
+    args = [(exp, up_to_date) for exp in exps]
+    results = []
+    if n_jobs == 1:
+        for arg in args:
+            results.append(_tidy_experiment(*arg))
+            _update_file_progress(task, results[-1]['fname'])
+    else:
+        if memory_limit is None:
+            pool = multiprocessing.Pool(n_jobs, maxtasksperchild=1)
+        else:
+            pool = multiprocessing.Pool(n_jobs, initializer=_limit_memory,
+                                        initargs=(memory_limit,),
+                                        maxtasksperchild=1)
+        try:
+            for result in pool.imap(_tidy_experiment_star, args,
+                                    chunksize=1):
+                results.append(result)
+                _update_file_progress(task, result['fname'])
+        finally:
+            pool.close()
+            pool.join()
+
+    if not quiet:
+        for result in results:
+            print('{0:8s} {1:7.1f} s  {2:s}'.format(
+                        result['status'].upper(), result['seconds'],
+                        result['out_fname']))
+
+    # Update the cache
+    for result in results:
+        if result['status'] in ['done', 'skipped']:
+            up_to_date[result['out_fname']] = result['hash']
+    with open(cache_fname, 'w') as f:
+        json.dump(up_to_date, f, indent=2, sort_keys=True)
+
+    if summary_fname is not None:
+        if summary_fname.endswith('.csv'):
+            pd.DataFrame(results,
+                         columns=list(results[0].keys()) if len(results) > 0
+                                 else None).to_csv(summary_fname, index=False)
+        else:
+            with open(summary_fname, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    return results
+
+
+def _import_pyarrow():
+    """
+    Import pyarrow if needed, returning True if it is available.
+    """
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            import pyarrow.feather
+        except:
+            pyarrow = None
+
+    return pyarrow is not None
+
+
+def _output_format(fname, format=None):
+    """
+    Determine the format of a data file from its extension.
+    """
+    if format is None:
+        ext = os.path.splitext(fname)[1].lower()
+        if ext in ['.parquet', '.pq']:
+            format = 'parquet'
+        elif ext in ['.feather', '.arrow']:
+            format = 'feather'
+        else:
+            format = 'csv'
+
+    if format not in ['csv', 'parquet', 'feather']:
+        raise RuntimeError(
+            "Invalid format '%s', must be 'csv', 'parquet', or 'feather'."
+                % format)
+
+    if format != 'csv' and not _import_pyarrow():
+        raise RuntimeError('pyarrow must be installed to use %s format.'
+                                % format)
+
+    return format
+
+
+def write_tidy(df, fname, format=None, compression='snappy',
+               group_cols=['instrument', 'trial', 'location'],
+               float_format=None):
+    """
+    Write a tidy DataFrame to CSV, Parquet, or Feather.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame to write.
+    fname : str
+        Name of output file.
+    format : str, default None
+        One of 'csv', 'parquet', or 'feather'. If None, inferred from
+        the extension of `fname` ('.parquet' or '.pq' for Parquet,
+        '.feather' or '.arrow' for Feather, CSV otherwise).
+    compression : str, default 'snappy'
+        Compression codec for Parquet output.
+    group_cols : list of strings, default ['instrument', 'trial', 'location']
+        For Parquet, one row group is written for each unique
+        combination of these columns. Columns not in `df` are ignored.
+        For Feather, which has no row groups, rows are sorted by these
+        columns.
+    float_format : str, default None
+        Format string for floats in CSV output.
+
+    Notes
+    -----
+    .. Categorical columns are stored by value and their categories
+       are stored in the file metadata, so that read_tidy() restores
+       them with the same categories. Datetimes and other dtypes are
+       stored natively.
+    """
+    format = _output_format(fname, format=format)
+
+    if format == 'csv':
+        df.to_csv(fname, index=False, float_format=float_format)
+        return None
+
+    group_cols = [col for col in group_cols if col in df.columns]
+    df = df.reset_index(drop=True)
+
+    if len(group_cols) > 0:
+        df = df.sort_values(by=group_cols, kind='mergesort')
+        df = df.reset_index(drop=True)
+
+    if format == 'feather':
+        pyarrow.feather.write_feather(df, fname)
+        return None
+
+    # Categories are stored in our own metadata and the values are
+    # written plainly so all row groups share a schema
+    categories = {}
+    df_plain = df.copy(deep=False)
+    for col in df.columns:
+        if str(df[col].dtype) == 'category':
+            categories[col] = {
+                'categories': df[col].cat.categories.values.tolist(),
+                'ordered': bool(df[col].cat.ordered)}
+            df_plain[col] = np.asarray(df[col])
+
+    # Row group boundaries
+    if len(group_cols) > 0 and len(df) > 0:
+        codes = df.groupby(group_cols, sort=False).ngroup().values
+        starts = np.concatenate(
+                ((0,), np.where(np.diff(codes) != 0)[0] + 1, (len(df),)))
+        keys = df.loc[starts[:-1], group_cols].values.tolist()
+    else:
+        starts = np.array([0, len(df)])
+        keys = [[]]
+
+    table = pyarrow.Table.from_pandas(df_plain.iloc[:1], preserve_index=False)
+    metadata = dict(table.schema.metadata)
+    metadata[b'fishact'] = json.dumps(
+            {'categories': categories,
+             'group_cols': group_cols,
+             'row_groups': keys},
+            default=lambda x: x.item()).encode()
+    schema = table.schema.add_metadata(metadata)
+
+    writer = pyarrow.parquet.ParquetWriter(fname, schema,
+                                           compression=compression)
+    try:
+        for i, j in zip(starts[:-1], starts[1:]):
+            writer.write_table(pyarrow.Table.from_pandas(
+                    df_plain.iloc[i:j], schema=schema, preserve_index=False))
+    finally:
+        writer.close()
+
     return None
 
 
+def read_tidy(fname, format=None, columns=None, instrument=None, trial=None,
+              locations=None, loc_name='location'):
+    """
+    Read a tidy DataFrame written by write_tidy() or tidy_data().
+
+    Parameters
+    ----------
+    fname : str
+        Name of file to read.
+    format : str, default None
+        One of 'csv', 'parquet', or 'feather'. If None, inferred from
+        the extension of `fname`.
+    columns : list of strings, default None
+        Columns to read. If None, all columns are read.
+    instrument : str or int, or list of them, default None
+        Only read rows with these instruments.
+    trial : str or int, or list of them, default None
+        Only read rows with these trials.
+    locations : list of ints, default None
+        Only read rows with these locations.
+    loc_name : str, default 'location'
+        Name of location column.
+
+    Returns
+    -------
+    output : pandas DataFrame
+        Tidy DataFrame. For Parquet files, only the row groups matching
+        `instrument`, `trial`, and `locations` are read.
+    """
+    format = _output_format(fname, format=format)
+
+    filters = {}
+    for col, vals in [('instrument', instrument), ('trial', trial),
+                      (loc_name, locations)]:
+        if vals is not None:
+            filters[col] = list(vals) if type(vals) in [list, tuple] \
+                                      else [vals]
+
+    read_cols = columns
+    if columns is not None:
+        read_cols = list(columns) + [col for col in filters
+                                        if col not in columns]
+
+    if format == 'csv':
+        df = pd.read_csv(fname, usecols=read_cols)
+    elif format == 'feather':
+        df = pyarrow.feather.read_feather(fname, columns=read_cols)
+    else:
+        pf = pyarrow.parquet.ParquetFile(fname)
+        meta = pf.metadata.metadata
+        meta = json.loads(meta[b'fishact'].decode()) \
+                    if meta is not None and b'fishact' in meta else None
+
+        if meta is None:
+            df = pf.read(columns=read_cols).to_pandas()
+        else:
+            # Only read row groups whose keys pass the filters
+            groups = []
+            for i, key in enumerate(meta['row_groups']):
+                key = dict(zip(meta['group_cols'], key))
+                if all(key[col] in vals for col, vals in filters.items()
+                                            if col in key):
+                    groups.append(i)
+
+            if len(groups) == 0:
+                df = pf.read(columns=read_cols).to_pandas().iloc[:0]
+            else:
+                df = pd.concat([pf.read_row_group(i, columns=read_cols)
+                                  .to_pandas() for i in groups],
+                               ignore_index=True)
+
+            for col, cat in meta['categories'].items():
+                if col in df.columns:
+                    df[col] = pd.Categorical(df[col],
+                                             categories=cat['categories'],
+                                             ordered=cat['ordered'])
+
+    # Filter rows (needed for CSV and Feather, and for columns without
+    # their own row groups)
+    if len(filters) > 0:
+        inds = np.ones(len(df), dtype=bool)
+        for col, vals in filters.items():
+            inds &= np.asarray(df[col].isin(vals))
+        if not inds.all():
+            df = df.loc[inds, :].reset_index(drop=True)
+
+    if columns is not None:
+        df = df[list(columns)]
+
+    return df
+
+
 def load_gtype(fname, comment='#', double_header=None, rstrip=False,
                quiet=False):
     """
@@ -248,13 +895,13 @@ def load_gtype(fname, comment='#', double_header=None, rstrip=False,
                 warnings.warn('Inferring two header rows.', RuntimeWarning)
 
     if double_header:
-        df = pd.read_csv(fname, comment=comment, header=[0, 1],
-                         delimiter=delimiter)
+        df = _read_csv(fname, comment=comment, header=[0, 1],
+                       delimiter=delimiter)
 
         # Reset the columns to be the second level of indexing
         df.columns = df.columns.get_level_values(1)
     else:
-        df = pd.read_csv(fname, comment=comment, delimiter=delimiter)
+        df = _read_csv(fname, comment=comment, delimiter=delimiter)
 
     # Only keep genotype up to last space because sometimes has n
     if rstrip:
@@ -273,12 +920,15 @@ def load_gtype(fname, comment='#', double_header=None, rstrip=False,
     return df
 
 
+@profiling.profiled
 def load_activity(fname, genotype_fname, instrument=-9999, trial=-9999,
                   lights_on='9:00:00', lights_off='23:00:00', 
                   day_in_the_life=4, zeitgeber_0=None, zeitgeber_0_day=5,
                   zeitgeber_0_time=None, wake_threshold=0.1, extra_cols=[],
                   rename={'middur': 'activity'}, comment='#',
-                  gtype_double_header=None, gtype_rstrip=False):
+                  gtype_double_header=None, gtype_rstrip=False, qc=False,
+                  validate=False, genotypes=None, locations=None,
+                  time_range=None, file_bytes=None, progress=None):
     """
     Load in activity CSV file to tidy DateFrame
 
@@ -289,7 +939,8 @@ def load_activity(fname, genotype_fname, instrument=-9999, trial=-9999,
         a conversion to CSV of the Excel file that comes off the
         instrument. If a list or tuple, each entry contains a CSV file 
         for a single experiment. The data in these files are stitched
-        together.
+        together. Files ending in '.gz', '.bz2', '.xz', or '.zst' are
+        decompressed as they are read.
     genotype_fname : str
         File containing genotype information. This is in standard
         Prober lab format, with tab delimited file.
@@ -345,6 +996,35 @@ def load_activity(fname, genotype_fname, instrument=-9999, trial=-9999,
         If True, strip out all text in genotype name to the right of
         the last space. This is because the genotype files typically
         have headers like 'wt (n=22)', and the '(n=22)' is useless.
+    qc : bool or dict, default False
+        If True, run validate.qc_wells() on the loaded data and drop
+        all wells that are flagged. If a dict, the wells are checked
+        and dropped as for True, with the dict passed as keyword
+        arguments to validate.qc_wells().
+    validate : bool or str, default False
+        If True, run the checks of validate.test_activity_file() on
+        the data as they are loaded and raise a
+        validate.ValidationError, which carries the report, if any
+        fail. If 'report', run the checks and return the report along
+        with the DataFrame instead of raising.
+    genotypes : str or list of strings, default None
+        If not None, only load locations with these genotypes.
+    locations : int or list of ints, default None
+        If not None, only load these locations.
+    time_range : 2-tuple, default None
+        If not None, only load rows with clock times t such that
+        time_range[0] <= t < time_range[1]. The entries may be
+        strings, e.g., '2017-04-02 09:00:00', or datetimes. For
+        uncompressed files, a time index is used to read only the
+        needed part of the file (see build_time_index()).
+    file_bytes : bytes or list of bytes, default None
+        If not None, the raw contents of the activity file(s) in
+        `fname`, already read into memory, e.g., by a
+        prefetch.Prefetcher. The activity files are then not read
+        from disk.
+    progress : callable, default None
+        Progress callback, reporting activity files read and their
+        sizes in bytes. See progress.start().
 
     Returns
     -------
@@ -393,6 +1073,11 @@ def load_activity(fname, genotype_fname, instrument=-9999, trial=-9999,
        but we still want to know what day it is. Specification of
        `lights_on` says what wall clock time specifies the start of
        a day.
+    .. If `time_range` is given, 'day' and 'zeit' are computed from
+       the first time point of the files, so they are the same as when
+       loading all data, with Zeitgeber time zero at `lights_on` on
+       day `zeitgeber_0_day`. 'exp_ind' counts from the first loaded
+       time point.
     """
 
 
@@ -400,24 +1085,80 @@ def load_activity(fname, genotype_fname, instrument=-9999, trial=-9999,
     df_gt = load_gtype(genotype_fname, comment=comment,
                        double_header=gtype_double_header, rstrip=gtype_rstrip)
 
-    # Read in DataFrames
+    # Only keep requested wells; others are dropped after each file is
+    # read, before genotypes are mapped and datetimes parsed
+    df_gt_all = df_gt
+    if genotypes is not None:
+        if type(genotypes) not in [list, tuple]:
+            genotypes = [genotypes]
+        df_gt = df_gt.loc[df_gt['genotype'].isin(genotypes), :]
+    if locations is not None:
+        if type(locations) not in [list, tuple]:
+            locations = [locations]
+        df_gt = df_gt.loc[df_gt['location'].isin(locations), :]
+    if len(df_gt) == 0:
+        raise RuntimeError('No locations match `genotypes` and `locations`.')
+
     if type(fname) == str:
         fname = [fname]
+    if file_bytes is None:
+        file_bytes = [None] * len(fname)
+    elif type(file_bytes) == bytes:
+        file_bytes = [file_bytes]
+
+    # Set up validation of each file as it is read
+    if validate:
+        from . import validate as _validate
+
+        if validate not in [True, 'report']:
+            raise RuntimeError("`validate` must be False, True, or 'report'.")
+        reports = [_validate.ValidationReport(filename) for filename in fname]
+    else:
+        reports = [None] * len(fname)
 
     # Read in DataFrames
-    df = pd.concat([_load_single_activity_file(
-                        filename, 
-                        df_gt,
-                        extra_cols=extra_cols, 
-                        comment=comment,
-                        acquisition=ac+1)
-                    for ac, filename in enumerate(fname)])
+    task = _progress.start(progress, 'load_activity', total=len(fname))
+    with profiling.stage('read_files') as st:
+        dfs = []
+        for ac, filename in enumerate(fname):
+            dfs.append(_load_single_activity_file(
+                            filename, 
+                            df_gt,
+                            extra_cols=extra_cols, 
+                            comment=comment,
+                            acquisition=ac+1,
+                            report=reports[ac],
+                            df_gt_all=df_gt_all,
+                            time_range=time_range,
+                            data=file_bytes[ac]))
+            if task is not _progress._null_task:
+                task.update(n_bytes=len(file_bytes[ac])
+                                if file_bytes[ac] is not None
+                                else os.path.getsize(filename))
+        df = pd.concat(dfs)
+        st.rows = len(df)
+    if len(df) == 0:
+        raise RuntimeError('No data in `time_range`.')
+
+    # Collect validation results
+    if validate:
+        if len(fname) == 1:
+            report = reports[0]
+        else:
+            report = _validate.ValidationReport(fname)
+            for rep in reports:
+                for err in rep.errors:
+                    report.add(err['check'], rep.fname + ': ' + err['message'],
+                               rows=err['rows'], n_rows=err['n_rows'])
+        if validate != 'report' and not report.passed:
+            raise _validate.ValidationError(report)
 
     # Columns to use
     usecols = list(df.columns)
 
     # Sort by location and then time
-    df = df.sort_values(['location', 'time']).reset_index(drop=True)
+    with profiling.stage('sort', rows=len(df)):
+        df = df.sort_values(['location', 'time']).reset_index(drop=True)
 
     # Convert lights_on to datetime
     if type(lights_on) != datetime.time:
@@ -429,48 +1170,61 @@ def load_activity(fname, genotype_fname, instrument=-9999, trial=-9999,
     if zeitgeber_0 is not None and type(zeitgeber_0) == str:
         zeitgeber_0 = pd.to_datetime(zeitgeber_0)
 
-    # Determine light or dark
-    if lights_off is None:
-        df['light'] = [True] * len(df)
-    else:
-        clock = pd.DatetimeIndex(df['time']).time
-        df['light'] = np.logical_and(clock >= lights_on, clock < lights_off)
-
-    # Get earliest time point
-    t_min = pd.DatetimeIndex(df['time']).min()
-
-    # Which day it is (day goes lights on to lights on)
-    df['day'] = pd.DatetimeIndex(
-        df['time'] - datetime.datetime.combine(t_min.date(), lights_on)).day \
-                + day_in_the_life - 1
-
-    # Compute zeitgeber_0
-    if zeitgeber_0 is None:
-        times = df.loc[
-            (df['day']==zeitgeber_0_day) & (df['light'] == True), 
-            'time']
-        if len(times) == 0:
-            raise RuntimeError(
-                    'Unable to find Zeitgeber_0. Check `day_in_the_life` and '
-                  + 'zeitgeber_0_day` inputs.')
-        zeit_date = times.min().date()
-        zeitgeber_0 = pd.to_datetime(str(zeit_date) + ' ' + str(lights_on))
-
-    # Add Zeitgeber time
-    df['zeit'] = (df['time'] - zeitgeber_0).dt.total_seconds() / 3600
-
-    # Set up exp_time indices
-    for loc in df['location'].unique():
-        df.loc[df['location']==loc, 'exp_ind'] = np.arange(
-                                            np.sum(df['location']==loc))
-    df['exp_ind'] = df['exp_ind'].astype(int)
-
-    # Infer time interval in units of hours (almost always 1/60)
-    dt = np.diff(df.loc[df['location'] == df['location'].unique()[0], 'time'])
-    dt = np.median(dt.astype(float) / 3600e9)
+    with profiling.stage('light_and_zeit', rows=len(df)):
+        # Determine light or dark
+        if lights_off is None:
+            df['light'] = [True] * len(df)
+        else:
+            clock = pd.DatetimeIndex(df['time']).time
+            df['light'] = np.logical_and(clock >= lights_on,
+                                         clock < lights_off)
 
-    # Add zeit indices
-    df['zeit_ind'] = (np.round(df['zeit'] / dt)).astype(int)
+        # Get earliest time point, of whole files if only part is loaded
+        if time_range is None:
+            t_min = pd.DatetimeIndex(df['time']).min()
+        else:
+            t_min = min(_first_time(filename, comment=comment, data=data)
+                            for filename, data in zip(fname, file_bytes))
+
+        # Which day it is (day goes lights on to lights on)
+        df['day'] = pd.DatetimeIndex(
+            df['time']
+                - datetime.datetime.combine(t_min.date(), lights_on)).day \
+                    + day_in_the_life - 1
+
+        # Compute zeitgeber_0; needed day may not be loaded for a time range
+        if zeitgeber_0 is None and time_range is not None:
+            zeitgeber_0 = _zeitgeber_0_from_start(
+                    t_min, lights_on, day_in_the_life, zeitgeber_0_day)
+        elif zeitgeber_0 is None:
+            times = df.loc[
+                (df['day']==zeitgeber_0_day) & (df['light'] == True), 
+                'time']
+            if len(times) == 0:
+                raise RuntimeError(
+                        'Unable to find Zeitgeber_0. Check `day_in_the_life` '
+                      + 'and zeitgeber_0_day` inputs.')
+            zeit_date = times.min().date()
+            zeitgeber_0 = pd.to_datetime(str(zeit_date) + ' '
+                                         + str(lights_on))
+
+        # Add Zeitgeber time
+        df['zeit'] = (df['time'] - zeitgeber_0).dt.total_seconds() / 3600
+
+    with profiling.stage('time_indices', rows=len(df)):
+        # Set up exp_time indices
+        for loc in df['location'].unique():
+            df.loc[df['location']==loc, 'exp_ind'] = np.arange(
+                                                np.sum(df['location']==loc))
+        df['exp_ind'] = df['exp_ind'].astype(int)
+
+        # Infer time interval in units of hours (almost always 1/60)
+        dt = np.diff(df.loc[df['location'] == df['location'].unique()[0],
+                            'time'])
+        dt = np.median(dt.astype(float) / 3600e9)
+
+        # Add zeit indices
+        df['zeit_ind'] = (np.round(df['zeit'] / dt)).astype(int)
 
     # Only use columns we want
     if 'sttime' not in extra_cols:
@@ -497,6 +1251,24 @@ def load_activity(fname, genotype_fname, instrument=-9999, trial=-9999,
     df['instrument'] = [instrument] * len(df)
     df['trial'] = [trial] * len(df)
 
+    # Drop wells that fail quality control
+    if qc is not False and qc is not None:
+        from . import validate as _validate
+
+        qc_kwargs = qc if type(qc) == dict else {}
+        loc_name = rename.get('location', 'location') if rename else 'location'
+        signal = rename.get('middur', 'middur') if rename else 'middur'
+        df_qc = _validate.qc_wells(df, signal=signal, loc_name=loc_name,
+                                   **qc_kwargs)
+        bad_locs = df_qc.loc[df_qc['flagged'], loc_name]
+        if len(bad_locs) > 0:
+            warnings.warn('Dropping wells that failed QC: '
+                          + str(list(bad_locs)), RuntimeWarning)
+            df = df.loc[~df[loc_name].isin(bad_locs), :].reset_index(drop=True)
+
+    if validate == 'report':
+        return df, report
+
     return df
 
 
@@ -556,15 +1328,23 @@ def merge_experiments(dfs, instrument_trial=None):
         `instrument` and `trial` columns fully populated with proper
         values (not NaN's nor the placeholder -9999).
 
+    Returns
+    -------
+    output : pandas DataFrame
+        Merged DataFrame, sorted by instrument, trial, and Zeitgeber
+        time. The 'instrument' and 'trial' columns are categorical.
+
     Notes
     -----
     .. This will give unexpected results if the sampling frequency of
        the data sets is different at all.
+    .. The inputted DataFrames are not modified.
     """
 
-    if instrument_trial is not None and len(instrument_trial) != len(dfs):
-        raise RuntimeError('Must have same number of entries in '
-                                + '`instrument_trial` as in `dfs`.')
+    if instrument_trial is not None:
+        if len(instrument_trial) != len(dfs):
+            raise RuntimeError('Must have same number of entries in '
+                                    + '`instrument_trial` as in `dfs`.')
 
         if len(instrument_trial) != len(set(instrument_trial)):
             raise RuntimeError('instrument, trial pairs are not all unique.')
@@ -589,22 +1369,401 @@ def merge_experiments(dfs, instrument_trial=None):
             raise RuntimeError(
                 'Nonunique instrument/trial pairs in inputted DataFrames.')
 
-    # Make outputted DataFrame
-    df_out = pd.DataFrame(columns=cols)
+    # Concatenate everything except instrument and trial in one shot
+    data_cols = [col for col in dfs[0].columns
+                        if col not in ['instrument', 'trial']]
+    df_out = pd.concat([df[data_cols] for df in dfs], ignore_index=True)
+
+    # Instrument and trial as categoricals
+    if instrument_trial is not None:
+        if not all((df['instrument'] == -9999).all() for df in dfs):
+            warnings.warn('Overwriting instrument and trial columns.',
+                          RuntimeWarning)
+    for j, col in enumerate(['instrument', 'trial']):
+        if instrument_trial is None:
+            values = np.concatenate([np.asarray(df[col]) for df in dfs])
+        else:
+            values = np.repeat([it[j] for it in instrument_trial],
+                               [len(df) for df in dfs])
+        df_out[col] = _sorted_categorical(values)
+
+    # Sort by instrument, trial, and zeit only if not already sorted
+    keys = (df_out['zeit'].values,
+            df_out['trial'].cat.codes.values,
+            df_out['instrument'].cat.codes.values)
+    if not _is_lexsorted(keys):
+        df_out = df_out.iloc[np.lexsort(keys), :].reset_index(drop=True)
 
-    # Populate new DataFrame
-    for i, df in enumerate(dfs):
-        if instrument_trial is not None:
-            if not (df['instrument'] == -9999).all():
-                warning.warn('Overwriting instrument and trial columns.')
-            df['instrument'] = [instrument_trial[i][0]] * len(df)
-            df['trial'] = [instrument_trial[i][1]] * len(df)
-        df_out = df_out.append(df, ignore_index=True)
+    return df_out[list(dfs[0].columns)]
 
-    # Sort the DataFrame
-    df_out = df_out.sort_values(by=['instrument', 'trial', 'zeit'])
 
-    return df_out
+def _sorted_categorical(values):
+    """
+    Make a categorical with sorted categories if possible.
+    """
+    categories = pd.unique(values)
+    try:
+        categories = sorted(categories)
+    except TypeError:
+        pass
+
+    return pd.Categorical(values, categories=categories)
+
+
+def _is_lexsorted(keys):
+    """
+    Check if arrays are sorted, as would be by np.lexsort(keys).
+    """
+    if len(keys[0]) < 2:
+        return True
+
+    # Rows are in order if the last unequal key is increasing
+    in_order = np.diff(keys[0]) >= 0
+    for key in keys[1:]:
+        d = np.diff(key)
+        in_order = (d > 0) | ((d == 0) & in_order)
+
+    return bool(in_order.all())
+
+
+def _time_index_fname(fname):
+    """
+    Name of the time index sidecar file of an activity file.
+    """
+    return fname + '.tidx'
+
+
+# Bytes read at a time when building a time index
+_index_chunk_bytes = 2**24
+
+# Masks keeping the first k bytes of a little-endian 64-bit word
+_byte_masks = np.array([2**(8*k) - 1 for k in range(9)], dtype=np.uint64)
+
+
+def _chunk_time_stamps(lines, delimiter, comment, n_cols, i_date, i_time):
+    """
+    Find the data rows of a chunk of whole lines of an activity file
+    and their date and time fields, without a loop over lines.
+
+    Parameters
+    ----------
+    lines : bytes
+        Whole lines of the file.
+    delimiter, comment : str
+        Single-character delimiter and comment character.
+    n_cols : int
+        Number of columns of the file.
+    i_date, i_time : int
+        Columns of the date and time.
+
+    Returns
+    -------
+    starts : ndarray
+        Position in `lines` of the first byte of each data row.
+    keys : 2D uint64 ndarray
+        Four words per row holding the bytes of the date and time
+        fields, equal for rows with equal time stamps.
+    bounds : list of 2-tuples of ndarrays
+        Start and end positions of the date and time fields of each
+        row.
+    """
+    n = len(lines)
+    chunk = np.frombuffer(lines, dtype=np.uint8)
+
+    # Each position viewed as the start of a 64-bit word; padding keeps
+    # words near the end in bounds
+    padded = lines + bytes(16)
+    words = np.ndarray((n + 8,), dtype='<u8', buffer=padded, strides=(1,))
+
+    # Lines, without line endings
+    ends = np.flatnonzero(chunk == ord('\n'))
+    if len(ends) == 0 or ends[-1] != n - 1:
+        ends = np.append(ends, n)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    ends = ends - (chunk[np.maximum(ends - 1, 0)] == ord('\r'))
+
+    # Skip blank and comment lines, as read_csv() does
+    first = chunk[np.minimum(starts, n - 1)]
+    keep = (ends > starts) & (first != ord(comment))
+    starts, ends = starts[keep], ends[keep]
+
+    # Delimiters of each line
+    delims = np.flatnonzero(chunk == ord(delimiter))
+    first_delim = np.searchsorted(delims, starts)
+    if (np.searchsorted(delims, ends) - first_delim != n_cols - 1).any():
+        raise RuntimeError('Rows do not all have %d fields.' % n_cols)
+
+    # Up to 16 bytes of the date and time fields as two words each
+    keys = []
+    bounds = []
+    for i in [i_date, i_time]:
+        lo = starts if i == 0 else delims[first_delim + i - 1] + 1
+        hi = ends if i == n_cols - 1 else delims[first_delim + i]
+        width = hi - lo
+        if (width > 16).any():
+            raise RuntimeError('Date or time field is too wide.')
+        keys.append(words[lo] & _byte_masks[np.minimum(width, 8)])
+        keys.append(words[lo + 8] & _byte_masks[np.maximum(width - 8, 0)])
+        bounds.append((lo, hi))
+
+    return starts, np.column_stack(keys), bounds
+
+
+def build_time_index(fname, comment='#', write=True):
+    """
+    Build an index of byte offsets of time points in an activity file.
+
+    Parameters
+    ----------
+    fname : str
+        Uncompressed activity file. Rows must be sorted by time, as
+        they are in files that come off the instrument.
+    comment : string, default '#'
+        Test that begins and comment line in the file
+    write : bool, default True
+        If True, write the index to a sidecar file, `fname` + '.tidx',
+        so it is only built once.
+
+    Returns
+    -------
+    output : pandas DataFrame
+        One row per time point, with columns 'offset', the byte offset
+        of the first row with that time, and 'time'.
+
+    Notes
+    -----
+    .. The file is read in large chunks, and line ends, delimiters, and
+       the date and time fields are found with vectorized NumPy
+       operations, so building the index is much faster than parsing
+       the file. Fields must not be quoted, as in files from the
+       instrument.
+    .. The sidecar is a CSV file whose first line is a comment with
+       the size and modification time of `fname`. It is only used by
+       load_time_index() if these still match.
+    """
+    if os.path.splitext(fname)[1].lower() in _compressed_exts:
+        raise RuntimeError('Cannot index compressed file ' + fname)
+
+    _, delimiter, _ = _sniff_file_info(fname, check_header=False,
+                                       comment=comment, quiet=True)
+
+    # Read whole lines a chunk at a time, recording the byte offset
+    # each time the time stamp changes
+    offsets = []
+    stamps = []
+    prev = None
+    with open(fname, 'rb') as f:
+        # Skip comments and find columns of date and time in header
+        line = f.readline()
+        while line != b'' and line.startswith(comment.encode()):
+            line = f.readline()
+        header = line.decode().rstrip('\r\n').split(delimiter)
+        i_date, i_time = header.index('stdate'), header.index('sttime')
+        base = f.tell()
+
+        rest = b''
+        while True:
+            data = f.read(_index_chunk_bytes)
+            lines = rest + data
+            if data != b'':
+                cut = lines.rfind(b'\n') + 1
+                lines, rest = lines[:cut], lines[cut:]
+            if lines != b'':
+                try:
+                    starts, keys, bounds = _chunk_time_stamps(
+                            lines, delimiter, comment, len(header), i_date,
+                            i_time)
+                except RuntimeError as e:
+                    raise RuntimeError('Cannot index %s: %s' % (fname, e))
+
+                change = np.ones(len(keys), dtype=bool)
+                change[1:] = (keys[1:] != keys[:-1]).any(axis=1)
+                if prev is not None and len(keys) > 0:
+                    change[0] = (keys[0] != prev).any()
+                for i in np.flatnonzero(change):
+                    offsets.append(base + starts[i])
+                    stamps.append(b''.join(lines[lo[i]:hi[i]]
+                                                for lo, hi in bounds))
+                if len(keys) > 0:
+                    prev = keys[-1]
+                base += len(lines)
+            if data == b'':
+                break
+
+    df = pd.DataFrame({'offset': np.array(offsets, dtype=np.int64),
+                       'time': pd.to_datetime([stamp.decode()
+                                                    for stamp in stamps],
+                                              format='%d/%m/%Y%H:%M:%S')},
+                      columns=['offset', 'time'])
+
+    if (np.diff(df['time'].values.astype(np.int64)) < 0).any():
+        raise RuntimeError('Times in %s are not sorted; cannot index.'
+                                % fname)
+
+    if write:
+        stat = os.stat(fname)
+        try:
+            with open(_time_index_fname(fname), 'w') as f:
+                f.write('# ' + json.dumps({'size': stat.st_size,
+                                           'mtime': stat.st_mtime}) + '\n')
+                df.to_csv(f, index=False)
+        except (IOError, OSError):
+            warnings.warn('Unable to write time index for ' + fname,
+                          RuntimeWarning)
+
+    return df
+
+
+def load_time_index(fname, comment='#', build=True):
+    """
+    Load the time index of an activity file.
+
+    Parameters
+    ----------
+    fname : str
+        Uncompressed activity file.
+    comment : string, default '#'
+        Test that begins and comment line in the file
+    build : bool, default True
+        If True, build and write the index if there is no up-to-date
+        sidecar file.
+
+    Returns
+    -------
+    output : pandas DataFrame or None
+        Index as returned by build_time_index(), or None if there is no
+        up-to-date index and `build` is False.
+    """
+    idx_fname = _time_index_fname(fname)
+    if os.path.isfile(idx_fname):
+        stat = os.stat(fname)
+        with open(idx_fname, 'r') as f:
+            meta = json.loads(f.readline()[1:])
+            if meta['size'] == stat.st_size and meta['mtime'] == stat.st_mtime:
+                return pd.read_csv(f, parse_dates=['time'])
+
+    if build:
+        return build_time_index(fname, comment=comment)
+
+    return None
+
+
+def _read_time_range(fname, time_range, usecols=None, comment='#',
+                     delimiter=','):
+    """
+    Parse only the rows of an uncompressed activity file in a time
+    range, using its time index.
+    """
+    try:
+        df_idx = load_time_index(fname, comment=comment)
+    except RuntimeError as e:
+        warnings.warn(str(e) + ' Reading whole file.', RuntimeWarning)
+        return _read_csv(fname, usecols=usecols, comment=comment,
+                         delimiter=delimiter)
+
+    # Byte range containing all times in range
+    times = df_idx['time'].values
+    i_start = np.searchsorted(times, np.datetime64(time_range[0]), 'left')
+    i_end = np.searchsorted(times, np.datetime64(time_range[1]), 'left')
+
+    with open(fname, 'rb') as f:
+        # Header is the line before the first data row
+        line = f.readline()
+        while line != b'' and line.startswith(comment.encode()):
+            line = f.readline()
+        header = line
+
+        if i_start >= len(df_idx) or i_start >= i_end:
+            data = b''
+        else:
+            f.seek(df_idx['offset'].iloc[i_start])
+            if i_end < len(df_idx):
+                data = f.read(df_idx['offset'].iloc[i_end]
+                                - df_idx['offset'].iloc[i_start])
+            else:
+                data = f.read()
+
+    return pd.read_csv(io.BytesIO(header + data), usecols=usecols,
+                       comment=comment, delimiter=delimiter)
+
+
+def _zeitgeber_0_from_start(t_min, lights_on, day_in_the_life,
+                            zeitgeber_0_day):
+    """
+    Zeitgeber time zero from the first time point of an experiment.
+    """
+    return datetime.datetime.combine(
+            t_min.date() + datetime.timedelta(
+                                days=zeitgeber_0_day - day_in_the_life),
+            lights_on)
+
+
+def _zeit_to_time_range(zeit_range, fname, lights_on='9:00:00',
+                        day_in_the_life=4, zeitgeber_0=None,
+                        zeitgeber_0_day=5, comment='#', file_bytes=None,
+                        time_range=None, **kwargs):
+    """
+    Clock-time range of a range of Zeitgeber times.
+
+    Parameters
+    ----------
+    zeit_range : 2-tuple
+        Range of Zeitgeber times in hours.
+    fname : str, or list or tuple of strings
+        Activity file(s) of the experiment.
+    lights_on, day_in_the_life, zeitgeber_0, zeitgeber_0_day, comment,
+    file_bytes
+        As for load_activity().
+    time_range : 2-tuple, default None
+        If not None, a range of clock times to intersect the output
+        with.
+    **kwargs
+        Other keyword arguments of load_activity(), ignored.
+
+    Returns
+    -------
+    output : 2-tuple of datetimes
+        Range of clock times to pass as `time_range` to
+        load_activity(), which sets Zeitgeber time zero the same way
+        when loading a time range.
+    """
+    if zeitgeber_0 is not None:
+        zeitgeber_0 = pd.to_datetime(zeitgeber_0)
+    else:
+        if type(fname) == str:
+            fname = [fname]
+        if file_bytes is None:
+            file_bytes = [None] * len(fname)
+        elif type(file_bytes) == bytes:
+            file_bytes = [file_bytes]
+        if type(lights_on) != datetime.time:
+            lights_on = pd.to_datetime(lights_on).time()
+        t_min = min(_first_time(filename, comment=comment, data=data)
+                        for filename, data in zip(fname, file_bytes))
+        zeitgeber_0 = pd.to_datetime(_zeitgeber_0_from_start(
+                    t_min, lights_on, day_in_the_life, zeitgeber_0_day))
+
+    start = zeitgeber_0 + pd.Timedelta(hours=zeit_range[0])
+    end = zeitgeber_0 + pd.Timedelta(hours=zeit_range[1])
+    if time_range is not None:
+        start = max(start, pd.to_datetime(time_range[0]))
+        end = min(end, pd.to_datetime(time_range[1]))
+
+    return start, end
+
+
+def _first_time(fname, comment='#', data=None):
+    """
+    Time of the first row of an activity file.
+    """
+    _, delimiter, _ = _sniff_file_info(fname, check_header=False,
+                                       comment=comment, quiet=True, data=data)
+    with _open_text(fname, data=data) as f:
+        df = pd.read_csv(f, usecols=['stdate', 'sttime'], comment=comment,
+                         delimiter=delimiter, nrows=1)
+
+    return pd.to_datetime(df['stdate'] + df['sttime'],
+                          format='%d/%m/%Y%H:%M:%S').iloc[0]
 
 
 def _load_single_activity_file(
@@ -612,7 +1771,11 @@ def _load_single_activity_file(
         df_gt,
         extra_cols=[],
         comment='#',
-        acquisition=1):
+        acquisition=1,
+        report=None,
+        df_gt_all=None,
+        time_range=None,
+        data=None):
     """
     Load in activity CSV file to tidy DateFrame
 
@@ -632,6 +1795,23 @@ def _load_single_activity_file(
         activity as measured by 'middur' is kept.
     comment : string, default '#'
         Test that begins and comment line in the file
+    acquisition : int, default 1
+        Number of the acquisition.
+    report : validate.ValidationReport, default None
+        If not None, all columns are read in and validated, with the
+        results added to `report`.
+    df_gt_all : pandas DataFrame, default None
+        Genotype information of all locations, used to validate the
+        file if `df_gt` only contains a subset of locations. If None,
+        `df_gt` is used.
+    time_range : 2-tuple of datetimes, default None
+        If not None, only keep rows with times t such that
+        time_range[0] <= t < time_range[1]. For uncompressed files,
+        only the part of the file in the range is parsed, using the
+        time index of the file.
+    data : bytes, default None
+        If not None, the raw contents of the file, already read into
+        memory. The file is then not read from disk.
 
     Returns
     -------
@@ -666,34 +1846,69 @@ def _load_single_activity_file(
 
     # Sniff out the delimiter, see how many headers, check file not empty
     _, delimiter, _ = _sniff_file_info(fname, check_header=False,
-                                       comment=comment, quiet=True)
-
-    # Read file
-    df = pd.read_csv(fname, usecols=usecols, comment=comment,
-                     delimiter=delimiter)
+                                       comment=comment, quiet=True, data=data)
+
+    # Convert time range
+    if time_range is not None:
+        time_range = (pd.to_datetime(time_range[0]),
+                      pd.to_datetime(time_range[1]))
+
+    with profiling.stage('read_csv') as st:
+        # Read file, validating all columns if need be
+        if report is None and time_range is not None and data is None \
+                and os.path.splitext(fname)[1].lower() not in _compressed_exts:
+            df = _read_time_range(fname, time_range, usecols=usecols,
+                                  comment=comment, delimiter=delimiter)
+        elif report is None:
+            df = _read_csv(fname, data=data, usecols=usecols, comment=comment,
+                           delimiter=delimiter)
+        else:
+            from . import validate
+
+            if delimiter != ',':
+                report.add('delimiter', 'Activity file is not comma delimited.')
+            df = _read_csv(fname, data=data, comment=comment,
+                           delimiter=delimiter)
+            checker = validate._ActivityChecker()
+            checker.update(df)
+            checker.finish(report,
+                           df_gt=df_gt if df_gt_all is None else df_gt_all)
+            if set(usecols) - set(df.columns) != set():
+                raise validate.ValidationError(report)
+            df = df[usecols]
+        st.rows = len(df)
+        st.n_bytes = len(data) if data is not None \
+                        else os.path.getsize(fname)
+
+    with profiling.stage('map_genotypes', rows=len(df)):
+        # Detect if it's the new file format, and the convert fish to integer
+        if len(df) > 0 and '-' in df['location'].iloc[0]:
+            df['location'] = (df['location']
+                                .apply(lambda x: x[x.rfind('-')+1:])
+                                .astype(int))
+        else:
+            df['location'] = (df['location']
+                                .str.extract('(\d+)', expand=False)
+                                .astype(int))
 
-    # Detect if it's the new file format, and the convert fish to integer
-    if '-' in df['location'].iloc[0]:
-        df['location'] = (df['location']
-                            .apply(lambda x: x[x.rfind('-')+1:])
-                            .astype(int))
-    else:
-        df['location'] = (df['location']
-                            .str.extract('(\d+)', expand=False)
-                            .astype(int))
+        # Only keep fish that we have genotypes for
+        df = df.loc[df['location'].isin(df_gt['location']), :]
 
-    # Only keep fish that we have genotypes for
-    df = df.loc[df['location'].isin(df_gt['location']), :]
+        # Store the genotypes
+        loc_lookup = {loc: df_gt.loc[df_gt['location']==loc, 'genotype']
+                                 .values[0]
+                            for loc in df_gt['location']}
+        df['genotype'] = df['location'].apply(lambda x: loc_lookup[x])
 
-    # Store the genotypes
-    loc_lookup = {loc: df_gt.loc[df_gt['location']==loc, 'genotype']
-                             .values[0]
-                        for loc in df_gt['location']}
-    df['genotype'] = df['location'].apply(lambda x: loc_lookup[x])
+    with profiling.stage('parse_datetime', rows=len(df)):
+        # Convert date and time to a time stamp
+        df['time'] = pd.to_datetime(df['stdate'] + df['sttime'],
+                                    format='%d/%m/%Y%H:%M:%S')
 
-    # Convert date and time to a time stamp
-    df['time'] = pd.to_datetime(df['stdate'] + df['sttime'],
-                                format='%d/%m/%Y%H:%M:%S')
+    # Trim to time range
+    if time_range is not None:
+        df = df.loc[(df['time'] >= time_range[0])
+                        & (df['time'] < time_range[1]), :]
 
     # Add the acquisition number
     df['acquisition'] = acquisition * np.ones(len(df), dtype=int)
@@ -701,7 +1916,30 @@ def _load_single_activity_file(
     return df
 
 
-@numba.jit(nopython=True)
+def _lazy_jit(func):
+    """
+    Decorator compiling a function with Numba on its first call.
+
+    Numba is only imported when the function is first called, and the
+    compiled code is cached on disk next to the module, so later
+    processes load it instead of compiling again. The pure Python
+    function is available as the `py_func` attribute.
+    """
+    compiled = []
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        if len(compiled) == 0:
+            import numba
+            compiled.append(numba.jit(nopython=True, cache=True)(func))
+        return compiled[0](*args)
+
+    wrapper.py_func = func
+
+    return wrapper
+
+
+@_lazy_jit
 def _resample_array(x, ind_win):
     """
     Resample a NumPy array.
@@ -759,8 +1997,9 @@ def _resample_segment(df, ind_win, signal):
     return re_df
 
 
+@profiling.profiled(rows='input')
 def resample(df, ind_win, signal=['activity', 'sleep'], loc_name='location',
-             quiet=False):
+             quiet=False, progress=None):
     """
     Resample the DataFrame.
 
@@ -779,6 +2018,10 @@ def resample(df, ind_win, signal=['activity', 'sleep'], loc_name='location',
         'fish' is a common entry.
     quiet : bool, default False
         If True, status output to the screen is silenced.
+    progress : callable, default None
+        Progress callback, reporting locations done. See
+        progress.start(). If None, a progress bar is shown unless
+        `quiet` is True.
 
     Returns
     -------
@@ -812,31 +2055,25 @@ def resample(df, ind_win, signal=['activity', 'sleep'], loc_name='location',
     df_out = pd.DataFrame(columns=df_in.columns)
 
     # Set up iterator to go through instrument/trial/location triples
+    sizes = df_in.groupby(['instrument', 'trial', loc_name]).size()
     iterator = [
             (r['instrument'], r['trial'], r[loc_name]) 
-             for _, r in df_in.groupby(['instrument', 'trial', loc_name])
-                               .size()
-                               .reset_index()
-                               .iterrows()]
-    if not quiet:
-        print('Performing resampling....')
-        try:
-            iterator = tqdm.tqdm(iterator)
-        except:
-            pass
+             for _, r in sizes[sizes > 0].reset_index().iterrows()]
+    task = _progress.start(progress, 'resample', total=len(iterator),
+                           quiet=quiet)
 
     for inst, trial, loc in iterator:
         # Slice out entry for loc
-        inds = (  (df['instrument'] == inst) 
-                & (df['trial'] == trial) 
-                & (df[loc_name] == loc))
+        inds = (  (df_in['instrument'] == inst) 
+                & (df_in['trial'] == trial) 
+                & (df_in[loc_name] == loc))
         df_loc = df_in.loc[inds, :].copy().reset_index(drop=True)
 
         # Find indices where light or acquisition switches
         df_loc['switch'] = (  df_loc['light'].diff().astype(bool) 
                             | df_loc['acquisition'].diff())
         df_loc.loc[df_loc.index[0], 'switch'] = True
-        inds = df_loc.where(df_loc['switch']).dropna().index
+        inds = df_loc.index[df_loc['switch'].values.astype(bool)]
 
         # Resample data for each segment
         for i, ind in enumerate(inds[:-1]):
@@ -847,6 +2084,7 @@ def resample(df, ind_win, signal=['activity', 'sleep'], loc_name='location',
         new_df = _resample_segment(df_loc.loc[inds[-1]:, :], ind_win, signal)
         new_df = new_df.drop('switch', 1)
         df_out = df_out.append(new_df, ignore_index=True)
+        task.update()
 
     # Make sure the data types are ok
     for col in df_in:
@@ -859,8 +2097,61 @@ def instrument_trial_pairs(df):
     """
     Extract a list of all unique instrument/trial pairs.
     """
-    df_iter = df.groupby(['instrument', 'trial']).size().reset_index()
-    return [(r['instrument'], r['trial']) for _, r in df_iter.iterrows()]
+    sizes = df.groupby(['instrument', 'trial']).size()
+    return list(sizes.index[sizes.values > 0])
+
+
+def _wells_by_time(df, cols, loc_name='location'):
+    """
+    Arrange columns of a tidy DataFrame as wells x time arrays.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame as returned by load_activity() or resample().
+        Must have columns 'instrument', 'trial', 'genotype', 'zeit_ind',
+        and `loc_name`.
+    cols : list
+        Columns of `df` to arrange into arrays.
+    loc_name : str, default 'location'
+        Name of column containing the "location," i.e., animal location.
+
+    Returns
+    -------
+    df_wells : pandas DataFrame
+        One row per well, sorted by instrument, trial, and location,
+        with columns 'instrument', 'trial', `loc_name`, and 'genotype'.
+        Row i corresponds to row i of each of the arrays.
+    zeit_ind : ndarray
+        Sorted unique Zeitgeber time indices. Entry j corresponds to
+        column j of each of the arrays.
+    arrays : dict
+        arrays[col] is a 2D float array of shape
+        (len(df_wells), len(zeit_ind)). Missing time points are NaN.
+    codes : tuple of ndarrays
+        (well_code, time_code), the row and column of each row of `df`
+        in the arrays.
+    """
+    keys = ['instrument', 'trial', loc_name]
+
+    # Well for each row; groups are sorted the same way as df_wells
+    well_code = df.groupby(keys, sort=True).ngroup().values
+    df_wells = (df[keys + ['genotype']].drop_duplicates(subset=keys)
+                                        .sort_values(by=keys)
+                                        .reset_index(drop=True))
+
+    # Time point for each row
+    zeit_ind = np.unique(df['zeit_ind'].values)
+    time_code = np.searchsorted(zeit_ind, df['zeit_ind'].values)
+
+    # Scatter the columns into arrays
+    arrays = {}
+    for col in cols:
+        arrays[col] = np.empty((len(df_wells), len(zeit_ind)))
+        arrays[col][:] = np.nan
+        arrays[col][well_code, time_code] = df[col].values.astype(float)
+
+    return df_wells, zeit_ind, arrays, (well_code, time_code)
 
 
 def load_perl_processed_activity(fname, genotype_fname, lights_off=14.0,
@@ -922,7 +2213,7 @@ def load_perl_processed_activity(fname, genotype_fname, lights_off=14.0,
     df_gt = load_gtype(genotype_fname)
 
     # Load in the data set
-    df = pd.read_csv(fname, delimiter='\t', comment='#', header=[0, 1])
+    df = _read_csv(fname, delimiter='\t', comment='#', header=[0, 1])
 
     # Make list of columns (use type conversion to allow list concatenation)
     df.columns = list(df.columns.get_level_values(1)[:2]) \
@@ -0,0 +1,226 @@
+import queue
+import threading
+import time
+
+from . import parse
+from . import progress as _progress
+
+
+def read_bytes(fname):
+    """
+    Read the raw contents of a file.
+    """
+    with open(fname, 'rb') as f:
+        return f.read()
+
+
+class ThrottledReader(object):
+    """
+    Stand-in for slow storage that reads files with added latency and
+    limited bandwidth.
+
+    Parameters
+    ----------
+    latency : float, default 0.0
+        Seconds to wait before each read.
+    bandwidth : float, default None
+        Bytes per second. If None, bandwidth is unlimited.
+
+    Notes
+    -----
+    .. Instances are callables that can be used as the `read_func` of
+       a Prefetcher, for testing and benchmarking prefetching without
+       network storage. The waiting releases the GIL, as real I/O does.
+    """
+    def __init__(self, latency=0.0, bandwidth=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def __call__(self, fname):
+        data = read_bytes(fname)
+        delay = self.latency
+        if self.bandwidth is not None:
+            delay += len(data) / self.bandwidth
+        time.sleep(delay)
+
+        return data
+
+
+class Prefetcher(object):
+    """
+    Read groups of files in a background thread ahead of their use.
+
+    Parameters
+    ----------
+    groups : list of lists of strings
+        Groups of file names, e.g., the activity files of each
+        experiment. Iterating over the Prefetcher yields the contents
+        of each group in order.
+    read_func : function, default None
+        Function taking a file name and returning its contents as
+        bytes. If None, files are read from disk with read_bytes().
+    max_prefetch : int, default 2
+        Maximum number of groups read ahead and held in memory.
+
+    Attributes
+    ----------
+    stats : dict
+        Timing of the run, updated as it goes, with keys
+        - read_seconds: Total time spent reading in the background.
+        - wait_seconds: Total time the consumer waited for data.
+        - wall_seconds: Time from start to the last group consumed.
+        - n_bytes: Number of bytes read.
+        - overlap_efficiency: Fraction of read time hidden behind the
+          consumer's work, 1 - wait_seconds / read_seconds. 1 means
+          the consumer never waited for I/O; 0 means no overlap.
+
+    Examples
+    --------
+    >>> with Prefetcher([['a.csv'], ['b.csv', 'b2.csv']]) as pf:
+    ...     for fnames, contents in pf:
+    ...         parse_them(fnames, contents)
+    >>> pf.stats['overlap_efficiency']
+    """
+    def __init__(self, groups, read_func=None, max_prefetch=2):
+        if max_prefetch < 1:
+            raise RuntimeError('`max_prefetch` must be at least 1.')
+
+        self.groups = [[g] if type(g) == str else list(g) for g in groups]
+        self.read_func = read_bytes if read_func is None else read_func
+        self.max_prefetch = max_prefetch
+
+        self.stats = {'read_seconds': 0.0,
+                      'wait_seconds': 0.0,
+                      'wall_seconds': 0.0,
+                      'n_bytes': 0,
+                      'overlap_efficiency': None}
+
+        self._queue = queue.Queue(maxsize=max_prefetch)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _worker(self):
+        """
+        Read groups and put them on the queue until done or stopped.
+        """
+        for group in self.groups:
+            if self._stop.is_set():
+                return
+            try:
+                start = time.time()
+                contents = [self.read_func(fname) for fname in group]
+                self.stats['read_seconds'] += time.time() - start
+                self.stats['n_bytes'] += sum(len(c) for c in contents)
+                item = (group, contents, None)
+            except Exception as e:
+                item = (group, None, e)
+
+            # Put, checking periodically if the consumer stopped
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+            if item[2] is not None:
+                return
+
+    def __iter__(self):
+        start = time.time()
+        self._thread = threading.Thread(target=self._worker)
+        self._thread.daemon = True
+        self._thread.start()
+
+        try:
+            for _ in self.groups:
+                wait_start = time.time()
+                group, contents, error = self._queue.get()
+                self.stats['wait_seconds'] += time.time() - wait_start
+                if error is not None:
+                    raise error
+
+                yield group, contents
+        finally:
+            self.stats['wall_seconds'] = time.time() - start
+            if self.stats['read_seconds'] > 0:
+                self.stats['overlap_efficiency'] = max(
+                    0.0, 1 - self.stats['wait_seconds']
+                                / self.stats['read_seconds'])
+            self.close()
+
+    def close(self):
+        """
+        Stop the background thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def load_experiments(experiments, max_prefetch=2, read_func=None,
+                     return_stats=False, progress=None):
+    """
+    Load and merge experiments, reading files ahead while parsing.
+
+    Parameters
+    ----------
+    experiments : list of dicts
+        Each dict has keys 'fname' (activity file or list of them),
+        'genotype_fname', 'instrument', and 'trial', and optionally
+        'kwargs', a dict of keyword arguments for
+        parse.load_activity(). This is the format of
+        dataset.ActivityDataset.experiments.
+    max_prefetch : int, default 2
+        Maximum number of experiments read ahead and held in memory.
+    read_func : function, default None
+        Function taking a file name and returning its contents as
+        bytes. If None, files are read from disk.
+    return_stats : bool, default False
+        If True, also return the Prefetcher stats.
+    progress : callable, default None
+        Progress callback, reporting experiments loaded and the sizes
+        of their activity files in bytes. See progress.start().
+
+    Returns
+    -------
+    df : pandas DataFrame
+        Merged tidy DataFrame as from parse.merge_experiments(), or
+        from parse.load_activity() for a single experiment.
+    stats : dict
+        Only returned if `return_stats` is True. See Prefetcher.
+
+    Notes
+    -----
+    .. While one experiment is parsed, the activity files of the next
+       ones are read in a background thread. Genotype files are small
+       and read when needed.
+    """
+    groups = [[exp['fname']] if type(exp['fname']) == str
+                             else list(exp['fname'])
+                for exp in experiments]
+
+    dfs = []
+    task = _progress.start(progress, 'load_experiments',
+                           total=len(experiments))
+    pf = Prefetcher(groups, read_func=read_func, max_prefetch=max_prefetch)
+    with pf:
+        for exp, (fnames, contents) in zip(experiments, pf):
+            dfs.append(parse.load_activity(
+                    fnames, exp['genotype_fname'],
+                    instrument=exp['instrument'], trial=exp['trial'],
+                    file_bytes=contents, **exp.get('kwargs', {})))
+            task.update(n_bytes=sum(len(data) for data in contents))
+
+    df = dfs[0] if len(dfs) == 1 else parse.merge_experiments(dfs)
+
+    if return_stats:
+        return df, pf.stats
+    return df
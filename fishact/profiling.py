@@ -0,0 +1,362 @@
+import atexit
+import collections
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except:
+    resource = None
+
+# Profiles currently recording, innermost last
+_active = []
+
+# Environment variable that turns on profiling of the whole process
+_env_var = 'FISHACT_PROFILE'
+
+
+def _peak_rss_mb():
+    """
+    Peak resident set size of the process so far in MB, or None if it
+    cannot be determined.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports KB, macOS reports bytes
+    if sys.platform == 'darwin':
+        return peak / 2**20
+    return peak / 2**10
+
+
+class _NullStage(object):
+    """
+    Stage that records nothing, used when profiling is off.
+    """
+    rows = None
+    n_bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+class _Stage(object):
+    """
+    Stage being timed by a Profile.
+    """
+    def __init__(self, profile, name, rows=None, n_bytes=None):
+        self.profile = profile
+        self.name = name
+        self.rows = rows
+        self.n_bytes = n_bytes
+        self.peak_traced = 0
+
+    def __enter__(self):
+        prof = self.profile
+        self.parent = prof._stack[-1] if prof._stack else None
+        self.path = self.name if self.parent is None \
+                        else self.parent.path + '/' + self.name
+        if prof.memory:
+            self._push_traced_peak()
+        prof._stack.append(self)
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *args):
+        wall = time.perf_counter() - self.start
+        prof = self.profile
+        prof._stack.pop()
+
+        record = collections.OrderedDict(
+                [('stage', self.path),
+                 ('wall_seconds', wall),
+                 ('rows', self.rows),
+                 ('bytes', self.n_bytes),
+                 ('rows_per_second',
+                    self.rows / wall if self.rows and wall > 0 else None),
+                 ('peak_rss_mb', _peak_rss_mb())])
+        if prof.memory:
+            self._push_traced_peak(own=True)
+            record['peak_traced_mb'] = self.peak_traced / 2**20
+        prof.records.append(record)
+
+        return False
+
+    def _push_traced_peak(self, own=False):
+        """
+        Attribute the traced memory peak since the last reset to this
+        stage (if `own`) and to its ancestors, then reset the peak.
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        if own:
+            self.peak_traced = max(self.peak_traced, peak)
+            peak = self.peak_traced
+        stage = self.parent
+        while stage is not None:
+            stage.peak_traced = max(stage.peak_traced, peak)
+            stage = stage.parent
+
+        # Before Python 3.9 the peak cannot be reset, so it is the
+        # peak since the profile started
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+
+class Profile(object):
+    """
+    Record of the time and memory used by stages of fishact functions.
+
+    Parameters
+    ----------
+    memory : bool, default False
+        If True, trace Python memory allocations with tracemalloc and
+        report the peak traced memory of each stage. This slows
+        functions down considerably; the peak resident set size of
+        the process is always reported.
+
+    Attributes
+    ----------
+    records : list of dicts
+        One entry per completed stage, in order of completion, with
+        keys 'stage' (names of enclosing stages and the stage joined
+        by '/'), 'wall_seconds', 'rows', 'bytes', 'rows_per_second',
+        'peak_rss_mb', and, if `memory` is True, 'peak_traced_mb'.
+
+    Examples
+    --------
+    >>> with fishact.profiling.profile() as prof:
+    ...     df = fishact.parse.load_activity('exp.csv', 'exp_genotype.txt')
+    ...     df = fishact.parse.resample(df, 10)
+    >>> prof.print_table()
+    >>> prof.to_json('profile.json')
+    """
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.records = []
+        self._stack = []
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        _active.append(self)
+        return self
+
+    def __exit__(self, *args):
+        _active.remove(self)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    def summary(self):
+        """
+        Totals of each stage over all of its calls.
+
+        Returns
+        -------
+        output : list of dicts
+            One entry per stage, in order of first completion, with
+            keys 'stage', 'calls', 'wall_seconds', 'rows', 'bytes',
+            'rows_per_second', 'peak_rss_mb', and, if `memory` is True,
+            'peak_traced_mb' (maxima over calls).
+        """
+        totals = collections.OrderedDict()
+        for rec in self.records:
+            if rec['stage'] not in totals:
+                totals[rec['stage']] = collections.OrderedDict(
+                        [('stage', rec['stage']), ('calls', 0),
+                         ('wall_seconds', 0.0), ('rows', None),
+                         ('bytes', None), ('rows_per_second', None),
+                         ('peak_rss_mb', None)])
+            tot = totals[rec['stage']]
+            tot['calls'] += 1
+            tot['wall_seconds'] += rec['wall_seconds']
+            for key in ['rows', 'bytes']:
+                if rec[key] is not None:
+                    tot[key] = (tot[key] or 0) + rec[key]
+            for key in ['peak_rss_mb', 'peak_traced_mb']:
+                if rec.get(key) is not None:
+                    tot[key] = max(tot.get(key) or 0, rec[key])
+
+        for tot in totals.values():
+            if tot['rows'] and tot['wall_seconds'] > 0:
+                tot['rows_per_second'] = tot['rows'] / tot['wall_seconds']
+
+        return list(totals.values())
+
+    def to_json(self, fname=None):
+        """
+        Report of the profile as JSON.
+
+        Parameters
+        ----------
+        fname : str, default None
+            If not None, file to write the report to.
+
+        Returns
+        -------
+        output : str
+            JSON report with keys 'summary' (see summary()) and
+            'records'.
+        """
+        report = json.dumps({'summary': self.summary(),
+                             'records': self.records}, indent=2)
+        if fname is not None:
+            with open(fname, 'w') as f:
+                f.write(report)
+
+        return report
+
+    def table(self):
+        """
+        Human-readable table of the summary of the profile.
+        """
+        def fmt(x, spec):
+            return '-' if x is None else format(x, spec)
+
+        lines = ['{0:40s} {1:>5s} {2:>9s} {3:>10s} {4:>11s} {5:>9s} {6:>9s}'
+                    .format('stage', 'calls', 'time (s)', 'rows', 'rows/s',
+                            'RSS (MB)', 'peak (MB)')]
+        for tot in self.summary():
+            depth = tot['stage'].count('/')
+            name = '  ' * depth + tot['stage'].rsplit('/', 1)[-1]
+            lines.append(
+                '{0:40s} {1:5d} {2:9.3f} {3:>10s} {4:>11s} {5:>9s} {6:>9s}'
+                    .format(name, tot['calls'], tot['wall_seconds'],
+                            fmt(tot['rows'], 'd'),
+                            fmt(tot['rows_per_second'], '.0f'),
+                            fmt(tot['peak_rss_mb'], '.1f'),
+                            fmt(tot.get('peak_traced_mb'), '.1f')))
+
+        return '\n'.join(lines)
+
+    def print_table(self, file=None):
+        """
+        Print the table of the summary of the profile.
+        """
+        print(self.table(), file=file)
+
+
+def profile(memory=False):
+    """
+    Context manager recording stages of fishact functions called in
+    its body.
+
+    Parameters
+    ----------
+    memory : bool, default False
+        If True, also trace memory allocations. See Profile.
+
+    Returns
+    -------
+    output : Profile
+        The profile, filled in as stages complete.
+    """
+    return Profile(memory=memory)
+
+
+def stage(name, rows=None, n_bytes=None):
+    """
+    Context manager timing a stage of a computation.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage. Stages within stages are reported as
+        'outer/inner'.
+    rows : int, default None
+        Number of rows processed, if known on entry. It may also be
+        set on the returned object before the stage ends.
+    n_bytes : int, default None
+        Number of bytes read, if relevant.
+
+    Notes
+    -----
+    .. When no profile is recording, a shared object that does
+       nothing is returned, so stages cost a function call.
+    """
+    if not _active:
+        return _null_stage
+    return _Stage(_active[-1], name, rows=rows, n_bytes=n_bytes)
+
+
+def profiled(func=None, name=None, rows='output'):
+    """
+    Decorator recording each call of a function as a stage.
+
+    Parameters
+    ----------
+    func : function
+        Function to decorate.
+    name : str, default None
+        Name of the stage. If None, the name of the function.
+    rows : str, default 'output'
+        If 'output', the number of rows processed is the length of the
+        returned value (or of its first entry if it is a tuple). If
+        'input', the length of the first argument.
+    """
+    if func is None:
+        return functools.partial(profiled, name=name, rows=rows)
+    if name is None:
+        name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _active:
+            return func(*args, **kwargs)
+
+        with _Stage(_active[-1], name) as st:
+            if rows == 'input' and len(args) > 0 \
+                    and hasattr(args[0], '__len__'):
+                st.rows = len(args[0])
+            output = func(*args, **kwargs)
+            out = output[0] if type(output) == tuple else output
+            if rows == 'output' and hasattr(out, '__len__'):
+                st.rows = len(out)
+
+        return output
+
+    return wrapper
+
+
+def _profile_from_env():
+    """
+    Profile the whole process if the FISHACT_PROFILE environment
+    variable is set, reporting at exit.
+
+    If the variable is '1', a table is printed to stderr at exit.
+    Otherwise it is the name of a JSON file to write the report to,
+    and the table is printed as well. 'memory' traces memory
+    allocations and prints the table.
+    """
+    value = os.environ.get(_env_var, '')
+    if value in ['', '0']:
+        return
+
+    prof = Profile(memory=(value == 'memory'))
+    prof.__enter__()
+
+    def report():
+        prof.__exit__(None, None, None)
+        if value not in ['1', 'memory']:
+            prof.to_json(value)
+        prof.print_table(file=sys.stderr)
+
+    atexit.register(report)
+
+
+_profile_from_env()
@@ -0,0 +1,173 @@
+import collections
+import time
+
+try:
+    import tqdm
+except:
+    tqdm = None
+
+
+class ConsoleProgress(object):
+    """
+    Progress callback showing a progress bar for each task on screen.
+
+    A tqdm progress bar is used if tqdm is installed. Otherwise, a
+    line is printed when each task starts.
+
+    Parameters
+    ----------
+    file : file object, default None
+        Where to write. If None, progress bars go to stderr and lines
+        to stdout.
+    """
+    messages = {'load_activity': 'Loading activity files....',
+                'resample': 'Performing resampling....',
+                'bouts': 'Performing bout calculation....',
+                'tidy_directory': 'Tidying experiments....',
+                'validate_directory': 'Validating files....',
+                'load_experiments': 'Loading experiments....',
+                'collect': 'Loading experiments....',
+                'apply': 'Processing wells....',
+                'daily_summary': 'Computing daily summary....',
+                'event_aligned': 'Averaging around events....',
+                'rolling': 'Computing rolling metrics....',
+                'index': 'Indexing experiments....'}
+
+    def __init__(self, file=None):
+        self.file = file
+        self._bars = {}
+
+    def __call__(self, task, done, total, n_bytes):
+        # Start of task: print message and make progress bar
+        if done == 0:
+            self._close(task)
+            print(self.messages.get(task, task + '....'), file=self.file)
+            bar = None if tqdm is None \
+                       else tqdm.tqdm(total=total, file=self.file)
+            self._bars[task] = [bar, 0]
+            return
+
+        if task not in self._bars:
+            return
+        bar, last_done = self._bars[task]
+        if bar is not None:
+            bar.update(done - last_done)
+        self._bars[task][1] = done
+
+        if total is not None and done >= total:
+            self._close(task)
+
+    def _close(self, task):
+        """
+        Close the progress bar of a task, if any.
+        """
+        bar, _ = self._bars.pop(task, (None, 0))
+        if bar is not None:
+            bar.close()
+
+
+class Throughput(object):
+    """
+    Progress callback keeping track of the throughput of each task.
+
+    Attributes
+    ----------
+    tasks : dict
+        Keyed by task name, with dicts with keys 'done', 'total',
+        'bytes', 'seconds' (since the task started), 'units_per_second',
+        and 'bytes_per_second' as values. Entries are updated at each
+        report, so another thread, e.g., of a web service, may read
+        them while the task runs.
+
+    Examples
+    --------
+    >>> tp = fishact.progress.Throughput()
+    >>> df = fishact.parse.load_activity('exp.csv', 'exp_genotype.txt',
+    ...                                  progress=tp)
+    >>> tp.tasks['load_activity']['bytes_per_second']
+    """
+    def __init__(self):
+        self.tasks = collections.OrderedDict()
+        self._start = {}
+
+    def __call__(self, task, done, total, n_bytes):
+        now = time.perf_counter()
+        if done == 0 or task not in self._start:
+            self._start[task] = now
+        seconds = now - self._start[task]
+
+        self.tasks[task] = {
+            'done': done,
+            'total': total,
+            'bytes': n_bytes,
+            'seconds': seconds,
+            'units_per_second': done / seconds if seconds > 0 else None,
+            'bytes_per_second': n_bytes / seconds
+                        if n_bytes is not None and seconds > 0 else None}
+
+
+class _NullTask(object):
+    """
+    Task that reports nothing, used when there is no callback.
+    """
+    def update(self, n=1, n_bytes=None):
+        pass
+
+
+_null_task = _NullTask()
+
+
+class _Task(object):
+    """
+    Task reporting its progress to a callback.
+    """
+    def __init__(self, callback, name, total):
+        self.callback = callback
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.n_bytes = None
+        callback(name, 0, total, None)
+
+    def update(self, n=1, n_bytes=None):
+        self.done += n
+        if n_bytes is not None:
+            self.n_bytes = (self.n_bytes or 0) + n_bytes
+        self.callback(self.name, self.done, self.total, self.n_bytes)
+
+
+def start(progress, task, total=None, quiet=True):
+    """
+    Start reporting progress of a task.
+
+    Parameters
+    ----------
+    progress : callable or None
+        Progress callback, called as
+        `progress(task, done, total, n_bytes)`, where `task` is the name
+        of the task, e.g., 'resample', `done` is the number of units
+        (e.g., files or wells) done so far, `total` is the total number
+        of units or None if not known, and `n_bytes` is the number of
+        bytes processed so far or None if not relevant. It is called
+        with `done` = 0 when the task starts and after each unit. If
+        None, a ConsoleProgress is used unless `quiet` is True.
+    task : str
+        Name of the task.
+    total : int, default None
+        Total number of units.
+    quiet : bool, default True
+        If True and `progress` is None, nothing is reported.
+
+    Returns
+    -------
+    output : object
+        Object with method `update(n=1, n_bytes=None)` to call as `n`
+        units, comprising `n_bytes` bytes, are done. If there is
+        nothing to report to, a shared object doing nothing.
+    """
+    if progress is None:
+        if quiet:
+            return _null_task
+        progress = ConsoleProgress()
+
+    return _Task(progress, task, total)
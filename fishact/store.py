@@ -0,0 +1,447 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import parse
+from . import progress as _progress
+
+# Columns that depend on time. Except for 'zeit_ind', they are stored as
+# wells x time arrays, since they differ between plates started at
+# different times.
+_axis_cols = ['time', 'zeit', 'zeit_ind', 'exp_time', 'exp_ind',
+              'acquisition', 'light', 'day']
+
+_metadata_fname = 'metadata.json'
+
+
+def write_store(df, dirname, signals=None, loc_name='location',
+                dtype=np.float64):
+    """
+    Write a tidy DataFrame as a memory-mappable store.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame as returned by parse.load_activity(),
+        parse.resample(), or parse.merge_experiments().
+    dirname : str
+        Directory to write the store to. It is created if it does not
+        exist, and must not already contain a store.
+    signals : list of strings, default None
+        Columns to store as wells x time arrays. If None, 'activity'
+        and 'sleep' are stored if present, as well as any other
+        numerical columns that are not time-axis or well columns.
+    loc_name : str, default 'location'
+        Name of location column.
+    dtype : numpy dtype, default np.float64
+        Data type of the stored arrays. Using np.float32 halves the
+        size of the store. Missing time points are NaN.
+
+    Returns
+    -------
+    output : ActivityStore
+        The newly written store.
+
+    Notes
+    -----
+    .. The store is a directory with one .npy file per signal, each a
+       wells x time array, one wells x time .npy file per time-axis
+       column (e.g., 'zeit', 'light', 'day'), and a small JSON metadata
+       file with the instrument, trial, location, and genotype of each
+       well. Time-axis columns are stored per well because plates
+       started at different times share Zeitgeber time indices but not
+       times. Only 'zeit_ind' and summaries of 'zeit' and 'light' over
+       wells are stored once per time point.
+    .. Arrays are written through numpy.lib.format.open_memmap, so only
+       one signal column at a time is converted in memory.
+    """
+    if os.path.isfile(os.path.join(dirname, _metadata_fname)):
+        raise RuntimeError(dirname + ' already contains a store, '
+                           + 'cowardly refusing to overwrite.')
+
+    well_cols = ['instrument', 'trial', loc_name, 'genotype']
+    for col in well_cols + ['zeit', 'zeit_ind']:
+        if col not in df.columns:
+            raise RuntimeError('%s missing from input DataFrame' % col)
+
+    axis_cols = [col for col in _axis_cols
+                        if col in df.columns and col != 'zeit_ind']
+    if signals is None:
+        signals = [col for col in df.columns
+                        if col not in well_cols + axis_cols + ['zeit_ind']
+                            and (df[col].dtype.kind in 'biuf')]
+
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    df_wells, zeit_ind, _, (well_code, time_code) = parse._wells_by_time(
+                                                    df, [], loc_name=loc_name)
+    shape = (len(df_wells), len(zeit_ind))
+
+    # Signals, one at a time
+    for signal in signals:
+        arr = np.lib.format.open_memmap(
+                    os.path.join(dirname, signal + '.npy'), mode='w+',
+                    dtype=dtype, shape=shape)
+        arr[:] = np.nan
+        arr[well_code, time_code] = df[signal].values
+        arr.flush()
+        del arr
+
+    # Time-axis columns, keeping their dtype. Entries of missing time
+    # points are never read, as to_frame() drops them.
+    for col in axis_cols:
+        values = df[col].values
+        if values.dtype.kind == 'M':
+            values = values.astype('datetime64[ns]')
+        arr = np.lib.format.open_memmap(
+                    os.path.join(dirname, 'axis_' + col + '.npy'), mode='w+',
+                    dtype=values.dtype, shape=shape)
+        if values.dtype.kind == 'f':
+            arr[:] = np.nan
+        elif values.dtype.kind == 'M':
+            arr[:] = np.datetime64('NaT')
+        else:
+            arr[:] = 0
+        arr[well_code, time_code] = values
+        arr.flush()
+        del arr
+
+    # Shared time axis
+    df_axis = _common_axis(df, zeit_ind, time_code)
+    for col in df_axis.columns:
+        np.save(os.path.join(dirname, 'common_' + col + '.npy'),
+                df_axis[col].values)
+
+    metadata = {'shape': list(shape),
+                'dtype': np.dtype(dtype).str,
+                'loc_name': loc_name,
+                'signals': signals,
+                'axis_cols': axis_cols,
+                'common_axis_cols': list(df_axis.columns),
+                'wells': {col: np.asarray(df_wells[col]).tolist()
+                                for col in well_cols}}
+    with open(os.path.join(dirname, _metadata_fname), 'w') as f:
+        json.dump(metadata, f, indent=2,
+                  default=lambda x: x.item() if hasattr(x, 'item') else str(x))
+
+    return ActivityStore(dirname)
+
+
+def _common_axis(df, zeit_ind, time_code):
+    """
+    Time axis shared by all wells of a tidy DataFrame.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame with column 'zeit', and optionally 'light'.
+    zeit_ind : ndarray
+        Sorted unique Zeitgeber time indices, as from
+        parse._wells_by_time().
+    time_code : ndarray of ints
+        Entry of `zeit_ind` of each row of `df`.
+
+    Returns
+    -------
+    output : pandas DataFrame
+        One row per time point with columns 'zeit_ind'; 'zeit', the
+        mean Zeitgeber time of the wells with data; 'zeit_min' and
+        'zeit_max'; and 'light', True if most of the wells with data
+        are in the light.
+    """
+    grouped = df['zeit'].groupby(time_code)
+    df_axis = pd.DataFrame({'zeit_ind': zeit_ind,
+                            'zeit': grouped.mean().values,
+                            'zeit_min': grouped.min().values,
+                            'zeit_max': grouped.max().values},
+                           columns=['zeit_ind', 'zeit', 'zeit_min',
+                                    'zeit_max'])
+    if 'light' in df.columns:
+        df_axis['light'] = df['light'].astype(float).groupby(
+                                        time_code).mean().values >= 0.5
+
+    return df_axis
+
+
+class ActivityStore(object):
+    """
+    Memory-mapped store of wells x time signal arrays.
+
+    Parameters
+    ----------
+    dirname : str
+        Directory containing a store written by write_store().
+    mode : str, default 'r'
+        Mode for numpy.memmap; 'r' for read-only, 'r+' to allow
+        modifying the arrays in place.
+
+    Attributes
+    ----------
+    wells : pandas DataFrame
+        One row per well with columns 'instrument', 'trial', location,
+        and 'genotype'. Row i is row i of each signal array.
+    axis : pandas DataFrame
+        One row per time point with the columns of the time axis
+        shared by all wells: 'zeit_ind'; 'zeit', 'zeit_min', and
+        'zeit_max', the mean, minimum, and maximum Zeitgeber time of
+        the wells with data; and 'light', True if most of them are in
+        the light. Row j is column j of each signal array.
+    signals : list of strings
+        Names of the stored signals.
+    axis_cols : list of strings
+        Names of the time-axis columns stored per well, e.g., 'time',
+        'zeit', 'light', and 'day'. See axis_array().
+
+    Notes
+    -----
+    .. store[signal] is a numpy.memmap of shape (n_wells, n_times).
+       Slicing it with slices, e.g., store['activity'][:96, 100:200],
+       gives a view without reading data; the operating system pages
+       in only the parts that are used.
+    .. Functions that work per well, such as parse.resample(),
+       summarize.daily_summary(), and summarize.bouts(), can process
+       cohorts of any size in chunks of wells with apply(). Traces of
+       subsets of wells for visualize functions are obtained with
+       to_frame().
+    """
+    def __init__(self, dirname, mode='r'):
+        self.dirname = dirname
+        self.mode = mode
+
+        with open(os.path.join(dirname, _metadata_fname), 'r') as f:
+            self.metadata = json.load(f)
+
+        self.loc_name = self.metadata['loc_name']
+        self.signals = self.metadata['signals']
+        self.shape = tuple(self.metadata['shape'])
+        self.wells = pd.DataFrame(
+                self.metadata['wells'],
+                columns=['instrument', 'trial', self.loc_name, 'genotype'])
+        self.axis_cols = self.metadata['axis_cols']
+        common_cols = self.metadata['common_axis_cols']
+        self.axis = pd.DataFrame(
+                {col: np.load(os.path.join(dirname, 'common_' + col + '.npy'))
+                    for col in common_cols},
+                columns=common_cols)
+
+        self._arrays = {}
+
+    def __repr__(self):
+        return ('ActivityStore(%s, %d wells x %d times, signals=%s)'
+                    % (self.dirname, self.shape[0], self.shape[1],
+                       self.signals))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, signal):
+        if signal not in self.signals:
+            raise KeyError(signal)
+        if signal not in self._arrays:
+            self._arrays[signal] = np.load(
+                    os.path.join(self.dirname, signal + '.npy'),
+                    mmap_mode=self.mode)
+        return self._arrays[signal]
+
+    def axis_array(self, col):
+        """
+        Wells x time memory-mapped array of a time-axis column.
+
+        Parameters
+        ----------
+        col : str
+            Time-axis column, e.g., 'zeit' or 'light'.
+
+        Returns
+        -------
+        output : numpy.memmap
+            Array of shape (n_wells, n_times). Entries at missing time
+            points are NaN, NaT, or zero, depending on the dtype.
+        """
+        if col not in self.axis_cols:
+            raise KeyError(col)
+        key = 'axis_' + col
+        if key not in self._arrays:
+            self._arrays[key] = np.load(
+                    os.path.join(self.dirname, key + '.npy'),
+                    mmap_mode=self.mode)
+        return self._arrays[key]
+
+    def well_indices(self, genotype=None, instrument=None, trial=None,
+                     locations=None):
+        """
+        Indices of wells matching criteria.
+
+        Parameters
+        ----------
+        genotype : str or list of strings, default None
+            Only wells with these genotypes.
+        instrument : str or int, or list of them, default None
+            Only wells with these instruments.
+        trial : str or int, or list of them, default None
+            Only wells with these trials.
+        locations : list of ints, default None
+            Only wells at these locations.
+
+        Returns
+        -------
+        output : ndarray
+            Sorted row indices into the signal arrays.
+        """
+        inds = np.ones(len(self.wells), dtype=bool)
+        for col, vals in [('genotype', genotype), ('instrument', instrument),
+                          ('trial', trial), (self.loc_name, locations)]:
+            if vals is not None:
+                if type(vals) not in [list, tuple, np.ndarray]:
+                    vals = [vals]
+                inds &= self.wells[col].isin(vals).values
+
+        return np.where(inds)[0]
+
+    def time_slice(self, zeit_range=None):
+        """
+        Slice of time points within a range of Zeitgeber times.
+
+        Parameters
+        ----------
+        zeit_range : 2-tuple, default None
+            Zeitgeber times t with zeit_range[0] <= t < zeit_range[1]
+            are included. If None, all times are included.
+
+        Returns
+        -------
+        output : slice
+            Slice of the columns of the signal arrays, so that
+            store[signal][:, output] is a view. If plates were started
+            at different times, it includes all time points at which
+            any well is in the range, so edge points of some wells may
+            be just outside of it.
+        """
+        if zeit_range is None:
+            return slice(0, self.shape[1])
+
+        return slice(np.searchsorted(self.axis['zeit_max'].values,
+                                     zeit_range[0], side='left'),
+                     np.searchsorted(self.axis['zeit_min'].values,
+                                     zeit_range[1], side='left'))
+
+    def to_frame(self, wells=None, time=None, signals=None):
+        """
+        Tidy DataFrame of a subset of the store.
+
+        Parameters
+        ----------
+        wells : slice or array of ints, default None
+            Rows of the signal arrays to include. If None, all wells.
+        time : slice, default None
+            Columns of the signal arrays to include, e.g., from
+            time_slice(). If None, all times.
+        signals : list of strings, default None
+            Signals to include. If None, all signals.
+
+        Returns
+        -------
+        output : pandas DataFrame
+            Tidy DataFrame with well columns, time-axis columns, and
+            signals, sorted by well and time. Missing time points are
+            not included.
+        """
+        if wells is None:
+            wells = slice(0, self.shape[0])
+        if time is None:
+            time = slice(0, self.shape[1])
+        if signals is None:
+            signals = self.signals
+
+        df_wells = self.wells.iloc[wells]
+        zeit_ind = self.axis['zeit_ind'].values[time]
+        n_wells, n_times = len(df_wells), len(zeit_ind)
+
+        data = {}
+        for col in df_wells.columns:
+            data[col] = np.repeat(df_wells[col].values, n_times)
+        for col in self.axis_cols:
+            data[col] = np.asarray(self.axis_array(col)[wells, time]).ravel()
+        data['zeit_ind'] = np.tile(zeit_ind, n_wells)
+        axis_cols = [col for col in _axis_cols
+                        if col in self.axis_cols or col == 'zeit_ind']
+
+        present = np.zeros(n_wells * n_times, dtype=bool)
+        for signal in signals:
+            values = np.asarray(self[signal][wells, time]).ravel()
+            present |= ~np.isnan(values)
+            data[signal] = values
+
+        df = pd.DataFrame(data, columns=list(df_wells.columns) + axis_cols
+                                        + list(signals))
+        if not present.all():
+            df = df.loc[present, :].reset_index(drop=True)
+
+        return df
+
+    def iter_frames(self, chunk_wells=96, time=None, signals=None):
+        """
+        Iterate over tidy DataFrames of chunks of wells.
+
+        Parameters
+        ----------
+        chunk_wells : int, default 96
+            Number of wells in each chunk.
+        time : slice, default None
+            Columns of the signal arrays to include. If None, all
+            times.
+        signals : list of strings, default None
+            Signals to include. If None, all signals.
+
+        Yields
+        ------
+        output : pandas DataFrame
+            Tidy DataFrame as from to_frame() for each chunk of wells.
+        """
+        for start in range(0, self.shape[0], chunk_wells):
+            yield self.to_frame(
+                    wells=slice(start, min(start+chunk_wells, self.shape[0])),
+                    time=time, signals=signals)
+
+    def apply(self, func, chunk_wells=96, time=None, signals=None,
+              progress=None, **kwargs):
+        """
+        Apply a per-well function to chunks of wells and concatenate.
+
+        Parameters
+        ----------
+        func : function
+            Function taking a tidy DataFrame as its first argument and
+            returning a DataFrame, e.g., summarize.daily_summary. Its
+            result must only depend on the data of each well, not on
+            other wells.
+        chunk_wells : int, default 96
+            Number of wells in each chunk.
+        time : slice, default None
+            Columns of the signal arrays to include. If None, all
+            times.
+        signals : list of strings, default None
+            Signals to include. If None, all signals.
+        progress : callable, default None
+            Progress callback, reporting wells done. See
+            progress.start().
+        **kwargs
+            Passed to `func`.
+
+        Returns
+        -------
+        output : pandas DataFrame
+            Concatenated results of `func` for each chunk.
+        """
+        task = _progress.start(progress, 'apply', total=self.shape[0])
+        dfs = []
+        for start in range(0, self.shape[0], chunk_wells):
+            wells = slice(start, min(start+chunk_wells, self.shape[0]))
+            dfs.append(func(self.to_frame(wells=wells, time=time,
+                                          signals=signals), **kwargs))
+            task.update(wells.stop - wells.start)
+
+        return pd.concat(dfs, ignore_index=True)
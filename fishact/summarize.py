@@ -1,13 +1,12 @@
 import collections
-
-try:
-    import tqdm
-except:
-    pass
+import warnings
 
 import numpy as np
 import pandas as pd
-import numba
+
+from . import parse
+from . import profiling
+from . import progress as _progress
 
 
 def _compute_bouts(df, rest=True):
@@ -190,7 +189,8 @@ def _sleep_latency(df):
     return sleep_mins['zeit'].min() - first_awake_min
 
 
-def bouts(df, rest=True, loc_name='location', quiet=False):
+@profiling.profiled(rows='input')
+def bouts(df, rest=True, loc_name='location', quiet=False, progress=None):
     """
     Compute bouts for rest of activity.
 
@@ -239,6 +239,10 @@ def bouts(df, rest=True, loc_name='location', quiet=False):
         'fish' is a common entry.
     quiet : bool, default False
         If True, do not show progress bar.
+    progress : callable, default None
+        Progress callback, reporting locations done. See
+        progress.start(). If None, a progress bar is shown unless
+        `quiet` is True.
 
     Returns
     -------
@@ -280,24 +284,19 @@ def bouts(df, rest=True, loc_name='location', quiet=False):
             'bout_length': float})
     df_out = pd.DataFrame(columns=[key for key in cols])
 
-    # Set up progress bar
-    if not quiet:
-        print('Performing bout calculation....')
-        try:
-            iterator = tqdm.tqdm(df[loc_name].unique())
-        except:
-            iterator = df[loc_name].unique()
-    else:
-        iterator = df[loc_name].unique()
+    # Set up progress reporting
+    locs = df[loc_name].unique()
+    task = _progress.start(progress, 'bouts', total=len(locs), quiet=quiet)
 
     # Loop through locations and populate output DataFrame
-    for loc in iterator:
+    for loc in locs:
         for ac in df['acquisition'].unique():
             df_loc = df.loc[(df[loc_name]==loc) & (df['acquisition']==ac), :]
             df_bout = _compute_bouts(df_loc, rest=rest)
             df_bout[loc_name] = loc
             df_bout['genotype'] = df_loc['genotype'].iloc[0]
             df_out = df_out.append(df_bout, ignore_index=True)
+        task.update()
 
     # Ensure data types
     # for col, dtype in cols.items():
@@ -306,7 +305,8 @@ def bouts(df, rest=True, loc_name='location', quiet=False):
     return df_out
 
 
-def daily_summary(df, loc_name='location'):
+@profiling.profiled(rows='input')
+def daily_summary(df, loc_name='location', progress=None):
     """
     Make a summary DataFrame of activity and sleep
 
@@ -350,6 +350,9 @@ def daily_summary(df, loc_name='location'):
     loc_name : str
         Name of column containing the "location," i.e., animal location.
         'fish' is a common entry.
+    progress : callable, default None
+        Progress callback, reporting location/day/light groups whose
+        sleep latency has been computed. See progress.start().
 
     Returns
     -------
@@ -365,10 +368,321 @@ def daily_summary(df, loc_name='location'):
     """
     gb = df.groupby([loc_name, 'genotype', 'day', 'light'])
     df_sum = gb['activity', 'sleep'].sum()
-    df_sum['latency'] = gb['sleep', 'zeit'].apply(_sleep_latency)
+
+    # Sleep latency needs a Python call per group
+    task = _progress.start(progress, 'daily_summary', total=len(df_sum))
+    if task is _progress._null_task:
+        df_sum['latency'] = gb['sleep', 'zeit'].apply(_sleep_latency)
+    else:
+        latency = []
+        for _, df_group in gb['sleep', 'zeit']:
+            latency.append(_sleep_latency(df_group))
+            task.update()
+        df_sum['latency'] = latency
+
     return df_sum.reset_index()
 
 
+def _light_events(light, zeit):
+    """
+    Find times where the lights switch.
+
+    Parameters
+    ----------
+    light : ndarray
+        Wells x time array of light values (1.0 if light, 0.0 if dark,
+        NaN if missing).
+    zeit : ndarray
+        Zeitgeber time of each column of `light`.
+
+    Returns
+    -------
+    output : dict
+        output['lights on'] and output['lights off'] are arrays of
+        the Zeitgeber times of the respective switches.
+    """
+    # Light over time, taking any well for which we have a measurement
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        light_t = np.nanmax(light, axis=0)
+    good = ~np.isnan(light_t)
+    light_t = light_t[good]
+    zeit = zeit[good]
+
+    # Switching events are where the light value changes
+    switches = np.where(np.diff(light_t) != 0)[0] + 1
+
+    return {'lights on': zeit[switches[light_t[switches] == 1]],
+            'lights off': zeit[switches[light_t[switches] == 0]]}
+
+
+def event_aligned(df, events=None, pre=1.0, post=1.0, signal='activity',
+                  loc_name='location', progress=None):
+    """
+    Align time traces of all wells to events and average.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame, as outputted by fishact.parse.load_activity()
+        or fishact.parse.resample(). Must have columns 'instrument',
+        'trial', 'genotype', 'zeit', 'zeit_ind', `signal`, and
+        `loc_name`, and also 'light' if `events` is None.
+    events : array_like or dict, default None
+        Zeitgeber times of the events to align to. If a dict, the keys
+        are labels for the type of event and the values are array_like
+        Zeitgeber times. If None, events are the light switching
+        events, labeled 'lights on' and 'lights off'.
+    pre : float, default 1.0
+        Amount of time before each event to include, in the same units
+        as the Zeitgeber time (usually hours).
+    post : float, default 1.0
+        Amount of time after each event to include, in the same units
+        as the Zeitgeber time (usually hours).
+    signal : str, default 'activity'
+        Column of `df` to align.
+    loc_name : str, default 'location'
+        Name of column containing the "location," i.e., animal location.
+        'fish' is a common entry.
+    progress : callable, default None
+        Progress callback, reporting genotype/event label pairs
+        summarized. See progress.start().
+
+    Returns
+    -------
+    df_summary : pandas DataFrame
+        Tidy DataFrame with columns
+        - genotype: genotype of the fish
+        - event_label: label of the event type
+        - rel_time: time relative to the event
+        - mean: mean of `signal` over all wells and events
+        - sem: standard error of the mean
+        - n: number of traces contributing to the mean
+    df_traces : pandas DataFrame
+        Tidy DataFrame with the aligned trace of each well for each
+        event, with columns 'instrument', 'trial', `loc_name`,
+        'genotype', 'event_label', 'event', 'event_zeit', 'rel_time',
+        and `signal`.
+
+    Notes
+    -----
+    .. Windows that extend past the beginning or end of the experiment
+       are padded with NaNs, which are ignored in the summary.
+    .. Events are placed at the first time point at or after the
+       specified Zeitgeber time. Events outside of the time range of
+       the data are ignored.
+    """
+    cols = [signal, 'zeit']
+    if events is None:
+        cols.append('light')
+
+    # Wells x time arrays of signal
+    df_wells, zeit_ind, arrays, _ = parse._wells_by_time(df, cols,
+                                                          loc_name=loc_name)
+    x = arrays[signal]
+
+    # Time step of the Zeitgeber index and Zeitgeber time of each column
+    inds = df['zeit_ind'].values != 0
+    dt = np.median(df['zeit'].values[inds] / df['zeit_ind'].values[inds])
+    zeit = zeit_ind * dt
+
+    # Number of time points in the windows
+    step = np.median(np.diff(zeit)) if len(zeit) > 1 else dt
+    n_pre = int(np.round(pre / step))
+    n_post = int(np.round(post / step))
+    n_win = n_pre + n_post + 1
+
+    # Get events
+    if events is None:
+        events = _light_events(arrays['light'], zeit)
+    elif not isinstance(events, dict):
+        events = {'event': events}
+
+    # Convert events to column indices
+    labels = []
+    event_zeit = []
+    for label, ev in events.items():
+        ev = np.sort(np.atleast_1d(np.array(ev, dtype=float)))
+        ev = ev[(ev >= zeit[0]) & (ev <= zeit[-1])]
+        labels += [label] * len(ev)
+        event_zeit.append(ev)
+    event_zeit = (np.concatenate(event_zeit) if len(event_zeit) > 0
+                                             else np.array([]))
+    event_inds = np.searchsorted(zeit, event_zeit)
+    labels = np.array(labels, dtype=object)
+
+    # Pad with NaNs so that all windows are in bounds
+    x_pad = np.empty((x.shape[0], x.shape[1] + n_win - 1))
+    x_pad[:] = np.nan
+    x_pad[:, n_pre:n_pre+x.shape[1]] = x
+
+    # Strided view of all windows; window j starts n_pre before column j
+    windows = np.lib.stride_tricks.as_strided(
+            x_pad, shape=(x.shape[0], x.shape[1] + 1, n_win),
+            strides=(x_pad.strides[0], x_pad.strides[1], x_pad.strides[1]),
+            writeable=False)
+
+    # Pull out the windows for the events, shape (wells, events, time)
+    traces = windows[:, event_inds, :]
+    rel_time = np.arange(-n_pre, n_post + 1) * step
+
+    # Build DataFrame of traces
+    n_wells, n_events = traces.shape[:2]
+    df_traces = df_wells.loc[np.repeat(np.arange(n_wells), n_events*n_win),
+                             :].reset_index(drop=True)
+    df_traces['event_label'] = np.tile(np.repeat(labels, n_win), n_wells)
+    df_traces['event'] = np.tile(np.repeat(np.arange(n_events), n_win),
+                                 n_wells)
+    df_traces['event_zeit'] = np.tile(np.repeat(event_zeit, n_win), n_wells)
+    df_traces['rel_time'] = np.tile(rel_time, n_wells*n_events)
+    df_traces[signal] = traces.ravel()
+
+    # Compute mean and SEM for each genotype and event label
+    gtypes = df_wells['genotype'].values
+    summaries = []
+    task = _progress.start(progress, 'event_aligned',
+                           total=len(pd.unique(gtypes))
+                                    * len(pd.unique(labels)))
+    for gtype in pd.unique(gtypes):
+        for label in pd.unique(labels):
+            y = traces[gtypes==gtype][:, labels==label, :].reshape(-1, n_win)
+            n = np.sum(~np.isnan(y), axis=0)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                mean = np.nanmean(y, axis=0)
+                sem = np.nanstd(y, axis=0, ddof=1) / np.sqrt(n)
+            summaries.append(pd.DataFrame(collections.OrderedDict(
+                    [('genotype', [gtype] * n_win),
+                     ('event_label', [label] * n_win),
+                     ('rel_time', rel_time),
+                     ('mean', mean),
+                     ('sem', sem),
+                     ('n', n)])))
+            task.update()
+
+    if len(summaries) == 0:
+        df_summary = pd.DataFrame(columns=['genotype', 'event_label',
+                                           'rel_time', 'mean', 'sem', 'n'])
+    else:
+        df_summary = pd.concat(summaries, ignore_index=True)
+
+    return df_summary, df_traces
+
+
+def rolling(df, window, metrics=['sleep', 'activity_zscore',
+                                 'bout_frequency'], loc_name='location',
+            progress=None):
+    """
+    Compute sliding window metrics for each location at every time point.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame, as outputted by fishact.parse.load_activity()
+        or fishact.parse.resample(). Must have columns 'instrument',
+        'trial', 'acquisition', 'light', 'zeit', and `loc_name`, as
+        well as 'activity' and/or 'sleep', depending on `metrics`.
+    window : int
+        Width of the trailing window, in units of indices. E.g., for
+        one-minute samples, 60 gives metrics over the previous hour.
+    metrics : list, default ['sleep', 'activity_zscore', 'bout_frequency']
+        Which metrics to compute. Allowed values are:
+        - sleep: Total sleep in the window.
+        - activity: Total activity in the window.
+        - activity_zscore: Activity at the time point relative to the
+          mean and standard deviation of activity in the window.
+        - bout_frequency: Number of rest bouts begun in the window
+          per unit Zeitgeber time (usually per hour).
+    loc_name : str, default 'location'
+        Name of column containing the "location," i.e., animal location.
+        'fish' is a common entry.
+    progress : callable, default None
+        Progress callback, reporting metrics computed. See
+        progress.start().
+
+    Returns
+    -------
+    output : pandas DataFrame
+        Copy of `df`, sorted by instrument, trial, location, and
+        Zeitgeber time, with a column 'rolling_' + metric for each
+        metric.
+
+    Notes
+    -----
+    .. Windows do not extend across switches of the light or changes
+       in acquisition, so near those switches the window is truncated.
+    .. All locations are computed at once using cumulative sums, so
+       the computation is linear in the number of rows regardless of
+       the window size.
+    """
+    allowed = ['sleep', 'activity', 'activity_zscore', 'bout_frequency']
+    for metric in metrics:
+        if metric not in allowed:
+            raise RuntimeError('Invalid metric: %s' % metric)
+
+    # Sort the DataFrame by instrument, trial, location and then zeit
+    df_out = (df.sort_values(by=['instrument', 'trial', loc_name, 'zeit'])
+                .reset_index(drop=True))
+
+    # Mark the start of each segment
+    new_seg = np.zeros(len(df_out), dtype=bool)
+    new_seg[:1] = True
+    for col in ['instrument', 'trial', loc_name, 'acquisition', 'light']:
+        x = df_out[col].values
+        new_seg[1:] |= x[1:] != x[:-1]
+
+    task = _progress.start(progress, 'rolling', total=len(metrics))
+
+    # Left edge of window for each row, truncated at segment start
+    ind = np.arange(len(df_out))
+    seg_start = np.maximum.accumulate(np.where(new_seg, ind, 0))
+    lo = np.maximum(ind - window + 1, seg_start)
+    n = ind - lo + 1
+
+    def _rolling_sum(x):
+        cs = np.concatenate(((0,), np.cumsum(x)))
+        return cs[ind+1] - cs[lo]
+
+    if 'sleep' in metrics:
+        df_out['rolling_sleep'] = _rolling_sum(df_out['sleep'].values)
+        task.update()
+
+    if 'activity' in metrics:
+        df_out['rolling_activity'] = _rolling_sum(df_out['activity'].values)
+        task.update()
+
+    if 'activity_zscore' in metrics:
+        # Center to reduce roundoff in the sum of squares
+        x = df_out['activity'].values.astype(float)
+        x = x - x.mean()
+        mean = _rolling_sum(x) / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = (_rolling_sum(x**2) - n * mean**2) / (n - 1)
+            zscore = (x - mean) / np.sqrt(np.maximum(var, 0))
+        zscore[n < 2] = np.nan
+        df_out['rolling_activity_zscore'] = zscore
+        task.update()
+
+    if 'bout_frequency' in metrics:
+        # Rest bouts start at awake to asleep transitions within a segment
+        sleep = df_out['sleep'].values > 0
+        onset = np.zeros(len(df_out), dtype=bool)
+        onset[1:] = sleep[1:] & ~sleep[:-1]
+        onset &= ~new_seg
+
+        # Time step for each row
+        zeit = df_out['zeit'].values
+        dt = np.empty(len(df_out))
+        dt[1:] = zeit[1:] - zeit[:-1]
+        dt[new_seg] = np.nan
+        dt = np.nanmedian(dt) if np.any(~np.isnan(dt)) else np.nan
+
+        df_out['rolling_bout_frequency'] = _rolling_sum(onset) / (n * dt)
+        task.update()
+
+    return df_out
+
+
 def _column_tup_to_str(ind):
     """
     Convert tuple of MultiIndex to string.
@@ -402,9 +716,32 @@ def _column_tup_to_str(ind):
         return string + 'night ' + str(ind[1])
 
 
-def write_daily_summary(df, outfile, loc_name='location'):
+def write_daily_summary(df, outfile, loc_name='location', format=None,
+                        compression='snappy', progress=None):
     """
-    Write a CSV file with summary of daily statistics.
+    Write a file with summary of daily statistics.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame of activity data.
+    outfile : str
+        Name of output file.
+    loc_name : str, default 'location'
+        Name of location column.
+    format : str, default None
+        One of 'csv', 'parquet', or 'feather'. If None, inferred from
+        the extension of `outfile`, with CSV used for unknown
+        extensions.
+    compression : str, default 'snappy'
+        Compression codec for Parquet output.
+    progress : callable, default None
+        Progress callback, passed to daily_summary().
+
+    Notes
+    -----
+    .. Parquet and Feather outputs also have the location and genotype
+       columns and keep full float precision.
     """
     # Make sure all columns are there
     for col in ['activity', 'sleep', loc_name, 'genotype', 'light', 'day']:
@@ -412,7 +749,7 @@ def write_daily_summary(df, outfile, loc_name='location'):
             raise RuntimeError('%s missing from input DataFrame' % col)
 
     # Compute summary stats
-    df_sum = daily_summary(df)
+    df_sum = daily_summary(df, progress=progress)
     df_sum['latency'] *= 60
 
     # Pivot
@@ -431,5 +768,275 @@ def write_daily_summary(df, outfile, loc_name='location'):
     # Rename the column headings from the MultiIndex
     df_sum.columns = [_column_tup_to_str(ind) for ind in df_sum.columns]
 
-    # Write summary CSV
-    df_sum.to_csv(outfile, index=False, float_format='%.4f')
+    # Write summary
+    if parse._output_format(outfile, format=format) == 'csv':
+        df_sum.to_csv(outfile, index=False, float_format='%.4f')
+    else:
+        parse.write_tidy(df_sum.reset_index(), outfile, format=format,
+                         compression=compression, group_cols=[])
+
+
+class TraceAggregator(object):
+    """
+    Mergeable per-genotype statistics of a signal at each time point.
+
+    Parameters
+    ----------
+    signal : str, default 'activity'
+        Column of the tidy DataFrames to aggregate.
+    sketch : bool, default True
+        If True, also keep a sketch of the distribution of `signal`
+        for approximate quantiles, e.g., the median.
+    relative_accuracy : float, default 0.01
+        Relative accuracy of quantiles from the sketch. A quantile
+        estimate x' of a true value x satisfies
+        |x' - x| <= relative_accuracy * |x|.
+
+    Attributes
+    ----------
+    moments : pandas DataFrame
+        Indexed by genotype and 'zeit_ind', with columns 'zeit',
+        'light', 'n' (number of measurements), 'mean', and 'm2' (sum of
+        squared deviations from the mean).
+    buckets : pandas Series
+        Counts of the sketch, indexed by genotype, 'zeit_ind', 'sign',
+        and 'bucket'.
+
+    Examples
+    --------
+    >>> agg = TraceAggregator('sleep')
+    >>> for fname, gtype_fname in experiments:
+    ...     agg.update(parse.resample(
+    ...             parse.load_activity(fname, gtype_fname), 10))
+    >>> df_agg = agg.result(quantiles=[0.5])
+
+    Notes
+    -----
+    .. Each call to update() is a single pass over its data. Counts,
+       means, and sums of squared deviations of each genotype and time
+       point are computed per batch and combined with running values
+       by the pairwise form of Welford's algorithm (Chan et al.), so
+       data may be processed in chunks of any size, e.g., one
+       experiment or one store.ActivityStore chunk at a time, without
+       loss of precision. Aggregators of separate plates can be
+       combined with merge().
+    .. The sketch stores counts of values in logarithmically spaced
+       buckets with ratio (1 + a) / (1 - a), with a the relative
+       accuracy, in the manner of DDSketch. Merging sketches is adding
+       counts, so quantiles of merged aggregators are as accurate as
+       of a single one.
+    """
+    def __init__(self, signal='activity', sketch=True,
+                 relative_accuracy=0.01):
+        if not 0 < relative_accuracy < 1:
+            raise RuntimeError('`relative_accuracy` must be between 0 and 1.')
+
+        self.signal = signal
+        self.sketch = sketch
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+
+        self.moments = None
+        self.buckets = None
+
+    def __repr__(self):
+        n_keys = 0 if self.moments is None else len(self.moments)
+        return 'TraceAggregator(%s, %d genotype/time points)' % (self.signal,
+                                                                 n_keys)
+
+    def update(self, df):
+        """
+        Add the measurements of a tidy DataFrame.
+
+        Parameters
+        ----------
+        df : pandas DataFrame
+            Tidy DataFrame with columns 'genotype', 'zeit', 'zeit_ind',
+            and the signal, e.g., as from parse.load_activity() or
+            parse.resample(). Missing values are ignored.
+
+        Returns
+        -------
+        output : TraceAggregator
+            The aggregator, so that calls may be chained.
+        """
+        for col in ['genotype', 'zeit', 'zeit_ind', self.signal]:
+            if col not in df.columns:
+                raise RuntimeError('%s missing from input DataFrame' % col)
+
+        x = df[self.signal].values.astype(float)
+        good = ~np.isnan(x)
+        df_in = pd.DataFrame(
+                {'genotype': np.asarray(df['genotype'])[good],
+                 'zeit_ind': df['zeit_ind'].values[good],
+                 'zeit': df['zeit'].values[good],
+                 'light': (df['light'].values[good] if 'light' in df.columns
+                                else np.ones(good.sum(), dtype=bool)),
+                 'x': x[good]})
+        if len(df_in) == 0:
+            return self
+
+        # Moments of the batch, with the two-pass variance
+        gb = df_in.groupby(['genotype', 'zeit_ind'])
+        df_batch = gb[['zeit', 'light']].first()
+        df_batch['n'] = gb['x'].count()
+        df_batch['mean'] = gb['x'].mean()
+        df_batch['m2'] = gb['x'].var(ddof=0) * df_batch['n']
+        self.moments = _merge_moments(self.moments, df_batch)
+
+        if self.sketch:
+            df_in['sign'] = np.sign(df_in['x'].values).astype(int)
+            abs_x = np.abs(df_in['x'].values)
+            bucket = np.zeros(len(df_in), dtype=int)
+            nonzero = abs_x > 0
+            bucket[nonzero] = np.ceil(np.log(abs_x[nonzero])
+                                      / np.log(self._gamma)).astype(int)
+            df_in['bucket'] = bucket
+            counts = df_in.groupby(
+                        ['genotype', 'zeit_ind', 'sign', 'bucket']).size()
+            self.buckets = _merge_buckets(self.buckets, counts)
+
+        return self
+
+    def merge(self, other):
+        """
+        Add the measurements of another aggregator, e.g., of another
+        plate, to this one.
+
+        Parameters
+        ----------
+        other : TraceAggregator
+            Aggregator of the same signal with the same relative
+            accuracy.
+
+        Returns
+        -------
+        output : TraceAggregator
+            The aggregator, so that calls may be chained.
+        """
+        if other.signal != self.signal:
+            raise RuntimeError('Cannot merge aggregators of different '
+                               'signals.')
+        if self.sketch and (not other.sketch
+                or other.relative_accuracy != self.relative_accuracy):
+            raise RuntimeError('Cannot merge sketches with different '
+                               'relative accuracies.')
+
+        if other.moments is not None:
+            self.moments = _merge_moments(self.moments, other.moments)
+        if self.sketch and other.buckets is not None:
+            self.buckets = _merge_buckets(self.buckets, other.buckets)
+
+        return self
+
+    def quantile(self, q):
+        """
+        Approximate quantile of each genotype at each time point.
+
+        Parameters
+        ----------
+        q : float
+            Quantile, between 0 and 1.
+
+        Returns
+        -------
+        output : ndarray
+            Quantiles, in the order of the rows of `moments`.
+        """
+        if not self.sketch:
+            raise RuntimeError('Quantiles need an aggregator with a sketch.')
+        if not 0 <= q <= 1:
+            raise RuntimeError('Quantile must be between 0 and 1.')
+
+        # Representative value of each bucket
+        df = self.buckets.reset_index(name='count')
+        sign = df['sign'].values
+        value = sign * 2 * self._gamma**df['bucket'].values \
+                    / (self._gamma + 1)
+
+        # Sort buckets by value within each genotype/time point
+        keys = self.moments.index.get_indexer(
+                    pd.MultiIndex.from_arrays([df['genotype'].values,
+                                               df['zeit_ind'].values]))
+        order = np.lexsort((value, keys))
+        cum_count = np.cumsum(df['count'].values[order])
+
+        # First bucket with more than q * (n - 1) values before it
+        n = np.bincount(keys, weights=df['count'].values,
+                        minlength=len(self.moments))
+        key_start = np.concatenate(((0,), np.cumsum(n)[:-1]))
+        inds = np.searchsorted(cum_count, key_start + q * (n - 1),
+                               side='right')
+
+        return value[order][inds]
+
+    def result(self, quantiles=None):
+        """
+        Summary statistics of each genotype at each time point.
+
+        Parameters
+        ----------
+        quantiles : list of floats, default None
+            Quantiles to compute from the sketch, e.g., [0.5] for the
+            median.
+
+        Returns
+        -------
+        output : pandas DataFrame
+            Tidy DataFrame with columns 'genotype', 'zeit_ind', 'zeit',
+            'light', 'n', 'mean', 'var' (unbiased), 'std', 'sem', and
+            'q_<quantile>' for each quantile, e.g., 'q_0.5', sorted by
+            genotype and time.
+        """
+        if self.moments is None:
+            raise RuntimeError('No data have been aggregated.')
+
+        df = self.moments.copy()
+        n = df['n'].values
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['var'] = np.where(n > 1, df['m2'].values / (n - 1), np.nan)
+        df['std'] = np.sqrt(df['var'])
+        df['sem'] = df['std'] / np.sqrt(n)
+
+        if quantiles is not None:
+            for q in quantiles:
+                df['q_%g' % q] = self.quantile(q)
+
+        return df.drop('m2', axis=1).reset_index()
+
+
+def _merge_moments(df_a, df_b):
+    """
+    Combine counts, means, and sums of squared deviations.
+    """
+    if df_a is None:
+        return df_b.sort_index()
+
+    ind = df_a.index.union(df_b.index)
+    df_a = df_a.reindex(ind)
+    df_b = df_b.reindex(ind)
+
+    n_a = df_a['n'].fillna(0).values
+    n_b = df_b['n'].fillna(0).values
+    mean_a = df_a['mean'].fillna(0).values
+    mean_b = df_b['mean'].fillna(0).values
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    frac_b = n_b / n
+
+    df = df_a[['zeit', 'light']].combine_first(df_b[['zeit', 'light']])
+    df['n'] = n.astype(int)
+    df['mean'] = mean_a + delta * frac_b
+    df['m2'] = (df_a['m2'].fillna(0).values + df_b['m2'].fillna(0).values
+                    + delta**2 * n_a * frac_b)
+
+    return df
+
+
+def _merge_buckets(s_a, s_b):
+    """
+    Add the counts of two sketches.
+    """
+    if s_a is None:
+        return s_b
+    return pd.concat([s_a, s_b]).groupby(level=[0, 1, 2, 3]).sum()
@@ -1,8 +1,16 @@
+import collections
+import concurrent.futures
 import csv
+import glob
+import json
+import os
+import time
+
 import numpy as np
 import pandas as pd
 
 from . import parse
+from . import progress as _progress
 
 
 def test_genotype_file(fname, quiet=False):
@@ -30,14 +38,14 @@ def test_genotype_file(fname, quiet=False):
 
     # Sniff out the delimiter, see how many headers, check file not empty
     n_header, delimiter, line = parse._sniff_file_info(
-                    fname, check_header=True, comment='#', quiet=False)
+                    fname, check_header=True, comment='#', quiet=quiet)
 
     # Check headers
     if n_header >= 3:
         if not quiet:
             print('ERROR: Genotype file possibly uses wrong comment character.')
             print('\n***GENOTYPE VALIDATION FAILED***\n')
-        return 1
+        return False
     elif n_header == 2:
         if not quiet:
             print('Warning: Genotype file probably has two header rows.\n')
@@ -56,15 +64,17 @@ def test_genotype_file(fname, quiet=False):
         if not quiet:
             print('ERROR: Genotype file has no data,\n')
             print('***GENOTYPE VALIDATION FAILED***\n')
-        return n_fail + 1
+        return False
 
     # Check comma delimiting
     if delimiter != ',':
-        print('ERROR: Genotype file is not comma delimited.\n')
+        if not quiet:
+            print('ERROR: Genotype file is not comma delimited.\n')
         n_fail += 1
 
     # Read file
-    df = pd.read_csv(fname, comment='#', header=header, delimiter=delimiter)
+    df = parse._read_csv(fname, comment='#', header=header,
+                         delimiter=delimiter)
 
     # Reset the columns to be the second level of indexing
     if header == [0, 1]:
@@ -153,7 +163,7 @@ def test_activity_file(fname, genotype_fname, quiet=False):
         n_fail += 1
 
     # Read in data file
-    df = pd.read_csv(fname)
+    df = parse._read_csv(fname)
 
     # Make sure columns are correct
     cols = ['location', 'animal', 'user', 'sn', 'an', 'datatype', 'start',
@@ -321,3 +331,745 @@ def test_activity_file(fname, genotype_fname, quiet=False):
             print('Activity validation passed.\n')
 
     return n_fail == 0
+
+
+def _longest_runs(x, well, n_wells):
+    """
+    Length of the longest run of True values for each well.
+
+    Parameters
+    ----------
+    x : ndarray, dtype bool
+        Array sorted by well and then time.
+    well : ndarray, dtype int
+        Well index of each entry of `x`.
+    n_wells : int
+        Total number of wells.
+
+    Returns
+    -------
+    output : ndarray
+        Length of longest run of True, in number of entries, for each
+        well.
+    """
+    # Runs begin when x changes or when a new well starts
+    new_run = np.ones(len(x), dtype=bool)
+    new_run[1:] = (x[1:] != x[:-1]) | (well[1:] != well[:-1])
+    run_id = np.cumsum(new_run) - 1
+
+    # Length of each run and its well
+    run_len = np.bincount(run_id)
+    run_well = well[new_run]
+    run_true = x[new_run]
+
+    longest = np.zeros(n_wells, dtype=int)
+    np.maximum.at(longest, run_well[run_true], run_len[run_true])
+
+    return longest
+
+
+def qc_wells(df, signal='activity', loc_name='location', zero_hours=12.0,
+             saturation_hours=1.0, saturation_frac=0.95, gap_factor=5.0,
+             variance_factor=5.0):
+    """
+    Flag wells with dead or missing animals or with tracking problems.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame as returned by parse.load_activity(), before
+        resampling. Must have columns 'instrument', 'trial',
+        'genotype', 'time', 'zeit', `signal`, and `loc_name`.
+    signal : str, default 'activity'
+        Column containing the activity, in seconds of activity per
+        time interval.
+    loc_name : str, default 'location'
+        Name of column containing the "location," i.e., animal location.
+        'fish' is a common entry.
+    zero_hours : float, default 12.0
+        A well is flagged as dead if it has an uninterrupted run of
+        zero activity at least this long, in hours.
+    saturation_hours : float, default 1.0
+        A well is flagged as saturated if it has an uninterrupted run
+        of saturated activity at least this long, in hours.
+    saturation_frac : float, default 0.95
+        Activity is considered saturated if it is at least this fraction
+        of the length of the time interval.
+    gap_factor : float, default 5.0
+        A gap in the time stamps of a well is flagged if it is greater
+        than `gap_factor` times the typical time interval. Gaps between
+        acquisitions are not counted.
+    variance_factor : float, default 5.0
+        A well is flagged as a variance outlier if the variance of its
+        activity is more than `variance_factor` times greater or less
+        than the median variance over all wells.
+
+    Returns
+    -------
+    output : pandas DataFrame
+        One row per well with columns:
+        - instrument, trial, `loc_name`, genotype: identify the well
+        - zero_run: Longest run of zero activity in hours.
+        - saturation_run: Longest run of saturated activity in hours.
+        - max_gap: Longest time between successive time points in hours.
+        - n_gaps: Number of gaps in the time stamps.
+        - variance: Variance of activity.
+        - variance_ratio: Variance relative to median over all wells.
+        - dead: True if zero_run >= `zero_hours`.
+        - saturated: True if saturation_run >= `saturation_hours`.
+        - gaps: True if n_gaps > 0.
+        - variance_outlier: True if variance is an outlier.
+        - flagged: True if any of the above flags are True.
+    """
+    keys = ['instrument', 'trial', loc_name]
+
+    # Sort by well and then time; get well index of each row
+    df_in = df.sort_values(by=keys + ['time'])
+    well = df_in.groupby(keys, sort=True).ngroup().values
+    df_out = (df_in[keys + ['genotype']].drop_duplicates(subset=keys)
+                                         .reset_index(drop=True))
+    n_wells = len(df_out)
+
+    x = df_in[signal].values.astype(float)
+    zeit = df_in['zeit'].values
+
+    # Successive time points within the same acquisition of a well
+    same_well = well[1:] == well[:-1]
+    if 'acquisition' in df_in.columns:
+        acq = df_in['acquisition'].values
+        same_well &= acq[1:] == acq[:-1]
+
+    # Typical time interval in hours
+    dt = np.diff(zeit)[same_well]
+    dt_med = np.median(dt) if len(dt) > 0 else np.nan
+
+    # Runs of zero activity and saturated activity
+    df_out['zero_run'] = _longest_runs(x == 0, well, n_wells) * dt_med
+    df_out['saturation_run'] = _longest_runs(
+            x >= saturation_frac * dt_med * 3600, well, n_wells) * dt_med
+
+    # Gaps in time stamps
+    t = df_in['time'].values.astype('<M8[ns]').astype(np.int64) / 3600e9
+    gaps = np.zeros(len(x))
+    gaps[1:][same_well] = np.diff(t)[same_well]
+    max_gap = np.zeros(n_wells)
+    np.maximum.at(max_gap, well, gaps)
+    df_out['max_gap'] = max_gap
+    df_out['n_gaps'] = np.bincount(well, weights=gaps > gap_factor*dt_med,
+                                   minlength=n_wells).astype(int)
+
+    # Variance of activity relative to typical well
+    n = np.bincount(well, minlength=n_wells)
+    mean = np.bincount(well, weights=x, minlength=n_wells) / n
+    var = np.bincount(well, weights=(x - mean[well])**2,
+                      minlength=n_wells) / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = var / np.median(var)
+    df_out['variance'] = var
+    df_out['variance_ratio'] = ratio
+
+    # Flags
+    df_out['dead'] = df_out['zero_run'] >= zero_hours
+    df_out['saturated'] = df_out['saturation_run'] >= saturation_hours
+    df_out['gaps'] = df_out['n_gaps'] > 0
+    df_out['variance_outlier'] = (  (ratio > variance_factor)
+                                  | (ratio < 1 / variance_factor))
+    df_out['flagged'] = (  df_out['dead'] | df_out['saturated']
+                         | df_out['gaps'] | df_out['variance_outlier'])
+
+    return df_out
+
+
+class ValidationReport(object):
+    """
+    Problems found while validating a data file.
+
+    Parameters
+    ----------
+    fname : str, default None
+        Name of file that was validated.
+
+    Attributes
+    ----------
+    errors : list of dicts
+        Each entry has keys
+        - check: Name of the check that failed.
+        - message: Description of the problem.
+        - n_rows: Number of offending rows, or None if not applicable.
+        - rows: List of (at most a few) offending row numbers. Rows are
+          numbered from zero, counting only data rows.
+    """
+    def __init__(self, fname=None):
+        self.fname = fname
+        self.errors = []
+
+    def add(self, check, message, rows=None, n_rows=None):
+        """
+        Record a failed check.
+        """
+        if rows is not None:
+            rows = [int(r) for r in rows]
+        if n_rows is not None:
+            n_rows = int(n_rows)
+        self.errors.append({'check': check, 'message': message,
+                            'n_rows': n_rows, 'rows': rows})
+
+    @property
+    def passed(self):
+        """
+        True if no checks failed.
+        """
+        return len(self.errors) == 0
+
+    def to_dict(self):
+        """
+        Convert report to a dict suitable for JSON serialization.
+        """
+        return {'fname': self.fname, 'passed': self.passed,
+                'errors': self.errors}
+
+    def print_errors(self):
+        """
+        Print the errors to the screen.
+        """
+        for err in self.errors:
+            print('ERROR:', err['message'])
+            if err['n_rows'] is not None:
+                print('    Number of rows:', err['n_rows'])
+            if err['rows']:
+                print('    Rows:', err['rows'])
+            print()
+
+
+class ValidationError(RuntimeError):
+    """
+    Raised when a data file fails validation.
+
+    Parameters
+    ----------
+    report : ValidationReport
+        Report of the failed checks.
+    """
+    def __init__(self, report):
+        self.report = report
+        msgs = [err['message'] for err in report.errors]
+        RuntimeError.__init__(self, 'Validation of %s failed: %s'
+                                        % (report.fname, ' '.join(msgs)))
+
+
+class _ActivityChecker(object):
+    """
+    Accumulate checks of an activity file over chunks of rows.
+
+    Parameters
+    ----------
+    max_rows : int, default 10
+        Maximum number of offending row numbers to keep for each check.
+    """
+    cols = ['location', 'animal', 'user', 'sn', 'an', 'datatype', 'start',
+            'end', 'startreason', 'endreason', 'frect', 'fredur', 'midct',
+            'middur', 'burct', 'burdur', 'stdate', 'sttime']
+
+    nonneg_cols = ['start', 'end', 'frect', 'fredur', 'midct', 'middur',
+                   'burct', 'burdur']
+
+    def __init__(self, max_rows=10):
+        self.max_rows = max_rows
+        self.n = 0
+        self.columns = None
+        self.bad = collections.OrderedDict()
+        self.n_null = 0
+        self.last_start = None
+        self.intervals = collections.Counter()
+        self.interval_counts = collections.Counter()
+        self.interval_rows = {}
+        self.offsets = collections.Counter()
+        self.offset_rows = {}
+        self.t_min = None
+        self.new_format = None
+        self.locations = set()
+
+    def _add_bad(self, check, rows):
+        """
+        Record offending rows for a check.
+        """
+        if len(rows) == 0:
+            return
+        n, kept = self.bad.get(check, (0, []))
+        kept = kept + list(rows[:self.max_rows - len(kept)])
+        self.bad[check] = (n + len(rows), kept)
+
+    def _add_keyed(self, counter, row_dict, keys, rows, keep=None):
+        """
+        Count values, keeping a few row numbers for each value.
+        """
+        if keep is not None:
+            keys = keys[keep]
+            rows = rows[keep]
+        uniq, inv, counts = np.unique(keys, return_inverse=True,
+                                      return_counts=True)
+        for i, (key, count) in enumerate(zip(uniq, counts)):
+            counter[key] += count
+            kept = row_dict.setdefault(key, [])
+            if len(kept) < self.max_rows:
+                kept += list(rows[inv == i][:self.max_rows - len(kept)])
+
+    def update(self, df, row_offset=None):
+        """
+        Run checks on a chunk of rows.
+
+        Parameters
+        ----------
+        df : pandas DataFrame
+            Chunk of the activity file as read by pandas.read_csv().
+        row_offset : int, default None
+            Row number of first row of `df`. If None, the chunks are
+            assumed to be given in order.
+        """
+        if row_offset is None:
+            row_offset = self.n
+        rows = row_offset + np.arange(len(df))
+        self.n += len(df)
+
+        if self.columns is None:
+            self.columns = list(df.columns)
+        if set(self.cols) - set(df.columns) != set() or len(df) == 0:
+            return
+
+        # Missing data
+        null = df.isnull()
+        self.n_null += null.values.sum()
+        self._add_bad('null', rows[null.values.any(axis=1)])
+
+        # Negative values
+        for col in self.nonneg_cols:
+            self._add_bad('negative ' + col, rows[df[col].values < 0])
+
+        # Sequential start times, including across chunks
+        start = df['start'].values
+        if self.last_start is not None:
+            prev = np.concatenate(((self.last_start,), start[:-1]))
+        else:
+            prev = np.concatenate(((start[0],), start[:-1]))
+        self._add_bad('sequence', rows[start < prev])
+        self.last_start = start[-1]
+
+        # End times greater than start times
+        end = df['end'].values
+        self._add_bad('end before start', rows[end <= start])
+
+        # Time intervals; end of session is allowed to be irregular
+        interval = np.round(end - start, 6)
+        uniq, counts = np.unique(interval, return_counts=True)
+        for key, count in zip(uniq, counts):
+            self.intervals[key] += count
+        eos = df['endreason'].values == 'End of session'
+        self._add_keyed(self.interval_counts, self.interval_rows, interval,
+                        rows, keep=~eos)
+
+        # Clock time minus start time should be constant
+        time = pd.to_datetime(df['stdate'] + df['sttime'],
+                              format='%d/%m/%Y%H:%M:%S')
+        t = time.values.astype(np.int64) / 1e9
+        self.t_min = t.min() if self.t_min is None else min(self.t_min,
+                                                            t.min())
+        self._add_keyed(self.offsets, self.offset_rows,
+                        np.round(t - start, 6), rows)
+
+        # Locations
+        loc = df['location'].astype(str)
+        if self.new_format is None:
+            self.new_format = '-' in loc.iloc[0]
+        if self.new_format:
+            loc = loc.apply(lambda x: x[x.rfind('-')+1:])
+        else:
+            loc = loc.str.extract(r'(\d+)', expand=False)
+        self.locations |= set(pd.to_numeric(loc, errors='coerce')
+                                .dropna().astype(int).unique())
+
+    def finish(self, report, df_gt=None):
+        """
+        Add results of all checks to a report.
+
+        Parameters
+        ----------
+        report : ValidationReport
+            Report to add errors to.
+        df_gt : pandas DataFrame, default None
+            Genotype information as returned by parse.load_gtype(). If
+            None, locations are not checked against genotypes.
+
+        Returns
+        -------
+        report : ValidationReport
+            The updated report.
+        """
+        # Columns
+        if self.columns is None:
+            report.add('no data', 'Activity file has no data.')
+            return report
+        if len(self.columns) != len(self.cols):
+            report.add('columns', 'Wrong number of columns in DataFrame.')
+        extra = set(self.columns) - set(self.cols)
+        if extra != set():
+            report.add('columns', 'Columns present that should not be: '
+                                  + str(extra))
+        missing = set(self.cols) - set(self.columns)
+        if missing != set():
+            report.add('columns', 'Columns absent that should be there: '
+                                  + str(missing))
+            return report
+        if len(self.intervals) == 0:
+            report.add('no data', 'Activity file has no data.')
+            return report
+
+        messages = {'null': 'Missing data.',
+                    'sequence': 'Nonsequential `start` values.',
+                    'end before start':
+                        'Some `end` times occur before their `start` times.'}
+        for col in self.nonneg_cols:
+            messages['negative ' + col] = 'Some negative `%s` values.' % col
+        for check, (n, rows) in self.bad.items():
+            report.add(check, messages[check], rows=rows, n_rows=n)
+
+        # Intervals relative to median interval
+        time_int = _counter_median(self.intervals)
+        bad = [key for key in self.interval_counts
+                        if not np.isclose(key, time_int)]
+        if len(bad) > 0:
+            rows = sorted(sum([self.interval_rows[key] for key in bad], []))
+            report.add('interval',
+                       'Bad time intervals based on `start` and `end`. '
+                       + 'Standard interval: %g, max interval: %g, '
+                       % (time_int, max(bad))
+                       + 'min interval: %g.' % min(bad),
+                       rows=rows[:self.max_rows],
+                       n_rows=sum(self.interval_counts[key] for key in bad))
+
+        # Clock time versus start time
+        t_diff = {key - self.t_min: key for key in self.offsets}
+        if not np.isclose(max(t_diff), 0):
+            bad = [key for diff, key in t_diff.items()
+                            if not np.isclose(diff, 0)]
+            rows = sorted(sum([self.offset_rows[key] for key in bad], []))
+            report.add('timestamp',
+                       '`sttime` and `start` do not match. '
+                       + 'Maximum `sttime` - `start`: %g.' % max(t_diff),
+                       rows=rows[:self.max_rows],
+                       n_rows=sum(self.offsets[key] for key in bad))
+
+        # Locations versus genotype file
+        if df_gt is not None:
+            g_set = set(df_gt['location'].unique())
+            set_diff = self.locations - g_set
+            if set_diff != set():
+                report.add('genotype', 'location [ '
+                           + ' '.join(str(x) for x in sorted(set_diff))
+                           + ' ] in activity file but not in genotype file.')
+            set_diff = g_set - self.locations
+            if set_diff != set():
+                report.add('genotype', 'location [ '
+                           + ' '.join(str(x) for x in sorted(set_diff))
+                           + ' ] in genotype file but not in activity file.')
+
+        return report
+
+
+def _counter_median(counter):
+    """
+    Median of values with multiplicities given by a Counter.
+    """
+    keys = np.array(sorted(counter))
+    counts = np.array([counter[key] for key in keys])
+    cum = np.cumsum(counts)
+    n = cum[-1]
+    lo = keys[np.searchsorted(cum, (n - 1) // 2 + 1)]
+    hi = keys[np.searchsorted(cum, n // 2 + 1)]
+    return (lo + hi) / 2
+
+
+def stream_activity_file(fname, genotype_fname=None, chunksize=100000,
+                         max_rows=10, quiet=False):
+    """
+    Validate an activity file in a single pass with bounded memory.
+
+    Parameters
+    ----------
+    fname : string
+        Name of activity file.
+    genotype_fname : string, default None
+        Name of genotype file. If None, locations are not checked
+        against the genotype file.
+    chunksize : int, default 100000
+        Number of rows to read at a time.
+    max_rows : int, default 10
+        Maximum number of offending row numbers to report for each
+        check.
+    quiet : bool, default False
+        If True, do not print problems with data set to screen.
+
+    Returns
+    -------
+    output : ValidationReport
+        Report of the errors found. `output.passed` is True if the
+        file passed validation.
+
+    Notes
+    -----
+    .. The same checks as in test_activity_file() are performed, but
+       the file is read in chunks, so memory use is set by `chunksize`
+       and the number of distinct time intervals and clock offsets,
+       not by the size of the file.
+    """
+    report = ValidationReport(fname)
+
+    # Sniff out the delimiter; only reads the first few lines
+    _, delimiter, line = parse._sniff_file_info(fname, check_header=False,
+                                                comment='#', quiet=True)
+    if delimiter != ',':
+        report.add('delimiter', 'Activity file is not comma delimited.')
+
+    # Genotype information
+    df_gt = None
+    if genotype_fname is not None:
+        try:
+            df_gt = parse.load_gtype(genotype_fname, quiet=True)
+        except:
+            report.add('genotype', 'Cannot open genotype file.')
+
+    # Perform checks chunk by chunk
+    checker = _ActivityChecker(max_rows=max_rows)
+    if line != '':
+        with parse._open_text(fname) as f:
+            for df in pd.read_csv(f, comment='#', delimiter=delimiter,
+                                  chunksize=chunksize):
+                checker.update(df)
+    checker.finish(report, df_gt=df_gt)
+
+    if not quiet:
+        print()
+        report.print_errors()
+        if report.passed:
+            print('Activity validation passed.\n')
+        else:
+            print('***ACTIVITY VALIDATION FAILED***\n')
+
+    return report
+
+
+def pair_files(dirname):
+    """
+    Pair activity files in a directory with their genotype files.
+
+    Parameters
+    ----------
+    dirname : str
+        Directory containing the data files.
+
+    Returns
+    -------
+    output : list of 2-tuples
+        Each entry is (activity file name, genotype file name), sorted
+        by activity file name. If no genotype file is found for an
+        activity file, the genotype file name is None.
+
+    Notes
+    -----
+    .. Activity files are files ending in '.csv', possibly followed by
+       a compression extension such as '.gz', that do not contain
+       'genotype' in their name. The genotype file for activity file
+       'exp.csv' is a file whose name begins with 'exp' and contains
+       'genotype', e.g., 'exp_genotype.txt' or 'exp_genotypes.csv'. The
+       name must continue with '_' or '.' after 'exp', so that
+       'exp10_genotype.txt' is not paired with 'exp1.csv'. If there
+       are several such files, the one with the shortest name is used.
+    .. CSV summaries written by write_validation_summary() and
+       parse.tidy_directory() are recognized by their header and are
+       not treated as activity files, so they may be written to the
+       data directory.
+    """
+    fnames = sorted(glob.glob(os.path.join(dirname, '*')))
+    gtype_fnames = [fname for fname in fnames
+                        if 'genotype' in os.path.basename(fname).lower()]
+    activity_fnames = [fname for fname in fnames
+                        if parse._strip_compression_ext(fname).endswith('.csv')
+                            and fname not in gtype_fnames
+                            and not _is_summary_file(fname)]
+
+    pairs = []
+    for fname in activity_fnames:
+        prefix = parse._strip_compression_ext(fname)[:-len('.csv')]
+        matches = sorted([gfname for gfname in gtype_fnames
+                                if gfname.startswith(prefix)
+                                    and gfname[len(prefix):len(prefix)+1]
+                                            in ['_', '.']], key=len)
+        pairs.append((fname, matches[0] if len(matches) > 0 else None))
+
+    return pairs
+
+
+# First columns of the CSV summaries of batch tools
+_summary_headers = [['activity_fname', 'genotype_fname', 'hash'],
+                    ['fname', 'genotype_fname', 'out_fname']]
+
+
+def _is_summary_file(fname):
+    """
+    True if a CSV file is a summary written by validate_directory() or
+    tidy_directory(), judging by its header.
+    """
+    try:
+        with parse._open_text(fname) as f:
+            header = f.readline().strip().split(',')
+    except Exception:
+        return False
+
+    return any(header[:len(cols)] == cols for cols in _summary_headers)
+
+
+def _validate_pair(fname, genotype_fname, passed_hashes, chunksize):
+    """
+    Validate an activity/genotype file pair for validate_directory().
+    """
+    start_time = time.time()
+    result = collections.OrderedDict(
+            [('activity_fname', fname),
+             ('genotype_fname', genotype_fname),
+             ('hash', None),
+             ('status', None),
+             ('n_errors', 0),
+             ('errors', []),
+             ('seconds', None)])
+
+    try:
+        if genotype_fname is None:
+            result['hash'] = parse._file_hash([fname])
+            result['status'] = 'failed'
+            result['errors'] = [{'check': 'genotype',
+                                 'message': 'No genotype file found.',
+                                 'n_rows': None, 'rows': None}]
+        else:
+            result['hash'] = parse._file_hash([fname, genotype_fname])
+
+            if result['hash'] in passed_hashes:
+                result['status'] = 'cached'
+            else:
+                report = stream_activity_file(fname, genotype_fname,
+                                              chunksize=chunksize, quiet=True)
+                if not test_genotype_file(genotype_fname, quiet=True):
+                    report.add('genotype file', 'Genotype file failed '
+                                                + 'validation.')
+                result['errors'] = report.errors
+                result['status'] = 'passed' if report.passed else 'failed'
+    except Exception as e:
+        result['status'] = 'error'
+        result['errors'] = [{'check': 'exception', 'message': repr(e),
+                             'n_rows': None, 'rows': None}]
+
+    result['n_errors'] = len(result['errors'])
+    result['seconds'] = time.time() - start_time
+
+    return result
+
+
+def validate_directory(dirname, n_jobs=1, cache_fname=None, chunksize=100000,
+                       quiet=False, progress=None):
+    """
+    Validate all activity/genotype file pairs in a directory.
+
+    Parameters
+    ----------
+    dirname : str
+        Directory containing the data files. Files are paired using
+        pair_files().
+    n_jobs : int, default 1
+        Number of processes to use.
+    cache_fname : str, default None
+        JSON file storing hashes of file pairs that have passed
+        validation. Pairs whose hash is in the cache are not validated
+        again, and the hashes of newly passed pairs are added. If None,
+        no cache is used.
+    chunksize : int, default 100000
+        Number of rows of the activity file to read at a time.
+    quiet : bool, default False
+        If True, do not print a line for each file to the screen.
+    progress : callable, default None
+        Progress callback, reporting file pairs done and the sizes of
+        their activity files in bytes. See progress.start(). If None,
+        a progress bar is shown unless `quiet` is True.
+
+    Returns
+    -------
+    output : list of dicts
+        One entry per activity file with keys
+        - activity_fname: Name of activity file.
+        - genotype_fname: Name of genotype file, or None if not found.
+        - hash: SHA-256 hash of the contents of the file pair.
+        - status: One of 'passed', 'failed', 'cached' (passed on a
+          previous run), or 'error' (validation itself raised).
+        - n_errors: Number of failed checks.
+        - errors: List of failed checks as in ValidationReport.errors.
+        - seconds: Time taken to validate.
+    """
+    pairs = pair_files(dirname)
+
+    # Load the cache
+    passed_hashes = set()
+    if cache_fname is not None and os.path.isfile(cache_fname):
+        with open(cache_fname, 'r') as f:
+            passed_hashes = set(json.load(f))
+
+    # Validate pairs, possibly in parallel
+    task = _progress.start(progress, 'validate_directory', total=len(pairs),
+                           quiet=quiet)
+    args = [(fname, gfname, passed_hashes, chunksize)
+                    for fname, gfname in pairs]
+    results = []
+    if n_jobs == 1:
+        for arg in args:
+            results.append(_validate_pair(*arg))
+            parse._update_file_progress(task, results[-1]['activity_fname'])
+    else:
+        with concurrent.futures.ProcessPoolExecutor(n_jobs) as executor:
+            for result in executor.map(_validate_pair, *zip(*args)):
+                results.append(result)
+                parse._update_file_progress(task, result['activity_fname'])
+
+    if not quiet:
+        for result in results:
+            print('{0:8s} {1:3d} errors  {2:s}'.format(
+                        result['status'].upper(), result['n_errors'],
+                        result['activity_fname']))
+
+    # Update the cache
+    if cache_fname is not None:
+        passed_hashes |= set(result['hash'] for result in results
+                                if result['status'] == 'passed')
+        with open(cache_fname, 'w') as f:
+            json.dump(sorted(passed_hashes), f)
+
+    return results
+
+
+def write_validation_summary(results, fname):
+    """
+    Write the results of validate_directory() to a file.
+
+    Parameters
+    ----------
+    results : list of dicts
+        Output of validate_directory().
+    fname : str
+        Output file. If it ends in '.csv', a CSV file with one row per
+        activity file is written, with the errors serialized as JSON.
+        Otherwise, the results are written as JSON.
+    """
+    if fname.endswith('.csv'):
+        df = pd.DataFrame(results, columns=list(results[0].keys())
+                                        if len(results) > 0 else None)
+        if 'errors' in df.columns:
+            df['errors'] = df['errors'].apply(json.dumps)
+        df.to_csv(fname, index=False)
+    else:
+        with open(fname, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -1,7 +1,15 @@
+import collections
+import hashlib
+
 import numpy as np
 import pandas as pd
 
+import bokeh.models
+import bokeh.palettes
+import bokeh.plotting
+
 from . import parse
+from . import profiling
 
 import tsplot
 
@@ -155,10 +163,349 @@ def get_y_axis_label(df, signal, loc_name='location', time_unit=None):
                                                      int(np.round(dt)))
 
 
+# Sort orders and keys of recently plotted frames, keyed by data hash
+_composite_cache = collections.OrderedDict()
+_composite_cache_size = 8
+
+
+def _composite_locations(df, loc_name='location'):
+    """
+    Sort a frame with several instrument/trial pairs by time and give
+    each well a single key.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame with columns 'instrument', 'trial', 'zeit', and
+        `loc_name`.
+    loc_name : str, default 'location'
+        Name of column containing the "location," i.e., animal location.
+
+    Returns
+    -------
+    df_in : pandas DataFrame
+        Copy of `df` sorted by 'zeit', 'instrument', 'trial', and
+        `loc_name`, with a column 'new_loc_name'.
+    new_loc_name : str
+        'new_loc_name', a categorical column with one category per
+        well, labeled 'instrument/trial/location'.
+
+    Notes
+    -----
+    .. The keys come from group codes and the order from
+       numpy.lexsort, so there is no Python-level loop over rows. The
+       sort order and keys are cached for the last few frames, keyed
+       by a hash of the index and of the key and 'zeit' columns, which
+       is much cheaper to compute than the sort. Repeated plots of the
+       same data then only gather rows, and frames that are modified,
+       e.g., sorted in place, are sorted anew.
+    """
+    keys = ['instrument', 'trial', loc_name]
+    fingerprint = (loc_name, hashlib.sha1(
+            pd.util.hash_pandas_object(df[keys + ['zeit']], index=True)
+              .values.tobytes()).hexdigest())
+
+    cached = _composite_cache.get(fingerprint, None)
+    if cached is not None:
+        order, codes, labels = cached
+        _composite_cache.move_to_end(fingerprint)
+    else:
+        # Well codes, numbered in sorted order of keys
+        key_codes, key_uniques = zip(*[pd.factorize(np.asarray(df[key]),
+                                                    sort=True)
+                                            for key in keys])
+        flat = np.ravel_multi_index(key_codes,
+                                    [len(u) for u in key_uniques])
+        flat_unique, codes = np.unique(flat, return_inverse=True)
+        labels = ['/'.join(str(u[i]) for u, i in zip(key_uniques, ind))
+                    for ind in zip(*np.unravel_index(
+                                        flat_unique,
+                                        [len(u) for u in key_uniques]))]
+
+        # Sort by time, then by well
+        order = np.lexsort((codes, df['zeit'].values))
+
+        _composite_cache[fingerprint] = (order, codes, labels)
+        while len(_composite_cache) > _composite_cache_size:
+            _composite_cache.popitem(last=False)
+
+    # Gather rows column by column to avoid copying twice
+    data = collections.OrderedDict([(col, df[col].values[order])
+                                        for col in df.columns])
+    data['new_loc_name'] = pd.Categorical.from_codes(codes[order], labels)
+    df_in = pd.DataFrame(data, index=df.index[order])
+
+    return df_in, 'new_loc_name'
+
+
+def _lttb_indices(y, n_out):
+    """
+    Largest-triangle-three-buckets decimation of rows of an array.
+
+    Parameters
+    ----------
+    y : 2D ndarray
+        Each row is a trace, sampled at uniform intervals. NaNs are
+        missing points.
+    n_out : int
+        Number of points to keep in each trace, at least 3.
+
+    Returns
+    -------
+    output : 2D int ndarray, shape (len(y), n_out)
+        Column indices of the kept points of each row, increasing
+        along rows.
+
+    Notes
+    -----
+    .. The first and last points are always kept. The remaining points
+       are split into n_out - 2 buckets, and in each bucket the point
+       making the largest triangle with the previously kept point and
+       the mean of the next bucket is kept. The buckets must be
+       processed in order, but each step is vectorized over all rows.
+    """
+    n_rows, n = y.shape
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(int) + 1
+    edges[-1] = n - 1
+
+    inds = np.empty((n_rows, n_out), dtype=int)
+    inds[:, 0] = 0
+    inds[:, -1] = n - 1
+    rows = np.arange(n_rows)
+
+    # Averages of each bucket, and of the last point, for the third vertex
+    with np.errstate(invalid='ignore'):
+        x_avg = [(edges[i] + edges[i+1] - 1) / 2 for i in range(n_out - 2)]
+        y_avg = [np.nanmean(y[:, edges[i]:edges[i+1]], axis=1)
+                    for i in range(n_out - 2)]
+    x_avg.append(n - 1)
+    y_avg.append(y[:, -1])
+
+    for i in range(n_out - 2):
+        x_a = inds[:, i]
+        y_a = y[rows, x_a]
+        x_b = np.arange(edges[i], edges[i+1])
+        y_b = y[:, edges[i]:edges[i+1]]
+        x_c, y_c = x_avg[i+1], y_avg[i+1]
+
+        area = np.abs((x_a[:, np.newaxis] - x_c) * (y_b - y_a[:, np.newaxis])
+                      - (x_a[:, np.newaxis] - x_b) * (y_c - y_a)[:, np.newaxis])
+        area[np.isnan(area)] = -1
+        inds[:, i+1] = edges[i] + np.argmax(area, axis=1)
+
+    return inds
+
+
+def _minmax_indices(y, n_out):
+    """
+    Min/max envelope decimation of rows of an array.
+
+    Parameters
+    ----------
+    y : 2D ndarray
+        Each row is a trace. NaNs are missing points.
+    n_out : int
+        Number of points to keep in each trace, at least 2.
+
+    Returns
+    -------
+    output : 2D int ndarray, shape (len(y), 2 * (n_out // 2))
+        Column indices of the kept points of each row, increasing
+        along rows.
+
+    Notes
+    -----
+    .. The columns are split into n_out // 2 buckets, and in each
+       bucket the minimum and maximum are kept, so that peaks are
+       never lost.
+    """
+    n_rows, n = y.shape
+    n_buckets = n_out // 2
+    width = int(np.ceil(n / n_buckets))
+    n_buckets = int(np.ceil(n / width))
+
+    # Pad to whole buckets
+    y_pad = np.empty((n_rows, n_buckets * width))
+    y_pad[:] = np.nan
+    y_pad[:, :n] = y
+    y_pad = y_pad.reshape((n_rows, n_buckets, width))
+
+    nan = np.isnan(y_pad)
+    i_min = np.argmin(np.where(nan, np.inf, y_pad), axis=2)
+    i_max = np.argmax(np.where(nan, -np.inf, y_pad), axis=2)
+
+    inds = np.sort(np.concatenate((i_min, i_max), axis=1)
+                        + np.tile(np.arange(n_buckets) * width, 2), axis=1)
+
+    return np.minimum(inds, n - 1)
+
+
+def decimate(df, signal='activity', max_points=1000, method='lttb',
+             loc_name='location'):
+    """
+    Reduce the number of time points of each trace for plotting.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame as loaded from parse.load_activity() or returned
+        from parse.resample().
+    signal : string, default 'activity'
+        Column of `df` that is plotted.
+    max_points : int, default 1000
+        Maximum number of points to keep for each well.
+    method : str, default 'lttb'
+        'lttb' for largest-triangle-three-buckets, which keeps the
+        visual shape of each trace, or 'minmax' for the min/max
+        envelope in each of max_points/2 buckets, which keeps all
+        peaks.
+    loc_name : str, default 'location'
+        Name of column containing the "location," i.e., animal location.
+
+    Returns
+    -------
+    output : pandas DataFrame
+        Rows of `df` that are kept, in their original order. Traces
+        with no more than `max_points` points are kept whole.
+
+    Notes
+    -----
+    .. All wells are decimated at once on a wells x time array, so the
+       cost does not grow with a Python loop over wells.
+    .. Different wells keep different time points, so summary traces
+       across wells must not be computed from the result; at each time
+       point only the few wells that kept it would contribute, and
+       those are the extreme points. Summarize the full data and
+       decimate the summary instead.
+    """
+    if method not in ['lttb', 'minmax']:
+        raise RuntimeError("`method` must be 'lttb' or 'minmax'.")
+    if max_points < 3:
+        raise RuntimeError('`max_points` must be at least 3.')
+
+    df_wells, zeit_ind, arrays, (well_code, time_code) = \
+            parse._wells_by_time(df, [signal], loc_name=loc_name)
+    if len(zeit_ind) <= max_points:
+        return df
+
+    # Row of df at each well and time point, -1 if missing
+    row_ind = -np.ones((len(df_wells), len(zeit_ind)), dtype=int)
+    row_ind[well_code, time_code] = np.arange(len(df))
+
+    if method == 'lttb':
+        inds = _lttb_indices(arrays[signal], max_points)
+    else:
+        inds = _minmax_indices(arrays[signal], max_points)
+
+    rows = row_ind[np.arange(len(df_wells))[:, np.newaxis], inds].ravel()
+    rows = np.unique(rows[rows >= 0])
+
+    return df.iloc[rows]
+
+
+def _time_shift(zeit, time_shift):
+    """
+    Amount to shift Zeitgeber times by for plotting.
+    """
+    dt = np.median(np.diff(zeit)) if len(zeit) > 1 else 0
+    if time_shift == 'center':
+        return dt / 2
+    elif time_shift == 'right':
+        return dt
+    elif time_shift in ['left', 'interval']:
+        return 0
+    raise RuntimeError("Invalid `time_shift`: %s" % time_shift)
+
+
+def _summary_trace(df, signal='activity', summary_trace='mean',
+                   max_points=1000, method='lttb'):
+    """
+    Summary over wells at each time point, then decimated.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame with columns 'zeit', 'zeit_ind', and `signal`.
+    signal : string, default 'activity'
+        Column of `df` to summarize.
+    summary_trace : string or float, default 'mean'
+        One of 'mean', 'median', 'max', or 'min', or a float between 0
+        and 1 giving a quantile.
+    max_points : int, default 1000
+        Maximum number of points of the summary trace.
+    method : str, default 'lttb'
+        Decimation method, 'lttb' or 'minmax'.
+
+    Returns
+    -------
+    zeit : ndarray
+        Zeitgeber times of the kept points.
+    y : ndarray
+        Summary at the kept points.
+    """
+    gb = df.groupby('zeit_ind')
+    zeit = gb['zeit'].first().values
+    if summary_trace in ['mean', 'median', 'max', 'min']:
+        y = getattr(gb[signal], summary_trace)().values
+    else:
+        y = gb[signal].quantile(summary_trace).values
+
+    if len(y) > max_points:
+        if method == 'lttb':
+            inds = _lttb_indices(y[np.newaxis, :], max_points)[0]
+        else:
+            inds = np.unique(_minmax_indices(y[np.newaxis, :],
+                                             max_points)[0])
+        zeit, y = zeit[inds], y[inds]
+
+    return zeit, y
+
+
+def _figures(layout):
+    """
+    Figures of a Bokeh layout, in layout order.
+    """
+    if isinstance(layout, bokeh.plotting.Figure):
+        return [layout]
+
+    figs = []
+    for child in getattr(layout, 'children', []):
+        # Children of grids are (figure, row, column) tuples
+        if type(child) == tuple:
+            child = child[0]
+        figs += _figures(child)
+
+    return figs
+
+
+def _overlay_summary(p, dfs, signal, summary_trace, colors, time_shift,
+                     max_points, method):
+    """
+    Draw summary traces of full data sets on the figures of a plot.
+
+    The summary trace of dfs[i] is drawn with color colors[i] on the
+    i-th figure of `p`, or on all figures if `dfs` has one entry.
+    """
+    figs = _figures(p)
+    if len(dfs) == 1:
+        dfs, colors = dfs * len(figs), colors * len(figs)
+
+    for fig, df, color in zip(figs, dfs, colors):
+        zeit, y = _summary_trace(df, signal=signal,
+                                 summary_trace=summary_trace,
+                                 max_points=max_points, method=method)
+        x = zeit + _time_shift(df['zeit'].unique(), time_shift)
+        if time_shift == 'interval':
+            fig.step(x, y, mode='after', line_width=2, color=color)
+        else:
+            fig.line(x, y, line_width=2, color=color)
+
+
+@profiling.profiled(rows='input')
 def all_traces(df, signal='activity', summary_trace='mean', 
                loc_name='location',time_shift='center',
                alpha=0.75, hover_color='#535353', height=350, width=650,
-               colors=None):
+               colors=None, max_points=None, decimation='lttb'):
     """
     Generate a set of plots for each genotype.
 
@@ -198,6 +545,15 @@ def all_traces(df, signal='activity', summary_trace='mean',
             colors[cat][1]: hex value for color of summary trace
         If none, colors are generated using paired ColorBrewer colors,
         with a maximum of six categories.
+    max_points : int, default None
+        If not None, decimate each well's trace to at most this many
+        points before plotting, using decimate(). This keeps the size
+        of the plot manageable for long experiments. The summary trace
+        is computed from all points and then decimated separately,
+        since different wells keep different time points.
+    decimation : str, default 'lttb'
+        Decimation method, 'lttb' or 'minmax'. Ignored if `max_points`
+        is None.
 
     Returns
     -------
@@ -210,30 +566,39 @@ def all_traces(df, signal='activity', summary_trace='mean',
     # Get all instrument/trial pairs
     inst_trial = parse.instrument_trial_pairs(df)
 
+    # Thin out traces; the summary trace is drawn from the full data
+    df_full = df
+    if max_points is not None:
+        df = decimate(df, signal=signal, max_points=max_points,
+                      method=decimation, loc_name=loc_name)
+
     if len(inst_trial) == 1:
         df_in = df
     else:
-        # Be sure it is sorted by zeit
-        df_in = df.sort_values(by=['zeit', 'instrument', 'trial', loc_name])
-
-        # Convert location name to instrument/trial/location tuple
-        df_in['new_loc_name'] = [(r['instrument'], r['trial'], r[loc_name])
-                                     for _, r in df_in.iterrows()]
-        loc_name = 'new_loc_name'
+        df_in, loc_name = _composite_locations(df, loc_name=loc_name)
 
 
     # Make plots
-    p = tsplot.all_traces(
-            df_in, 'zeit', signal, loc_name, time_ind='zeit_ind',
-            light='light', summary_trace='mean', time_shift=time_shift,
-            alpha=0.75, x_axis_label='time (hr)', y_axis_label=y_axis_label)
+    with profiling.stage('tsplot', rows=len(df_in)):
+        p = tsplot.all_traces(
+                df_in, 'zeit', signal, loc_name, time_ind='zeit_ind',
+                light='light',
+                summary_trace='mean' if max_points is None else None,
+                time_shift=time_shift, alpha=0.75, x_axis_label='time (hr)',
+                y_axis_label=y_axis_label)
+
+    if max_points is not None:
+        _overlay_summary(p, [df_full], signal, 'mean', ['#363636'],
+                         time_shift, max_points, decimation)
 
     return p
 
 
+@profiling.profiled(rows='input')
 def grid(df, signal='activity', summary_trace='mean', loc_name='location', 
          gtype_order=None, time_shift='center', alpha=0.75, 
-         hover_color='#535353', height=200, width=650, colors=None):
+         hover_color='#535353', height=200, width=650, colors=None,
+         max_points=None, decimation='lttb'):
     """
     Generate a set of plots for each genotype.
 
@@ -277,6 +642,15 @@ def grid(df, signal='activity', summary_trace='mean', loc_name='location',
             colors[cat][1]: hex value for color of summary trace
         If none, colors are generated using paired ColorBrewer colors,
         with a maximum of six categories.
+    max_points : int, default None
+        If not None, decimate each well's trace to at most this many
+        points before plotting, using decimate(). This keeps the size
+        of the plot manageable for long experiments. The summary trace
+        is computed from all points and then decimated separately,
+        since different wells keep different time points.
+    decimation : str, default 'lttb'
+        Decimation method, 'lttb' or 'minmax'. Ignored if `max_points`
+        is None.
 
     Returns
     -------
@@ -290,28 +664,46 @@ def grid(df, signal='activity', summary_trace='mean', loc_name='location',
     # Get all instrument/trial pairs
     inst_trial = parse.instrument_trial_pairs(df)
 
+    # Thin out traces; summary traces are drawn from the full data
+    df_full = df
+    if max_points is not None:
+        df = decimate(df, signal=signal, max_points=max_points,
+                      method=decimation, loc_name=loc_name)
+
     if len(inst_trial) == 1:
         df_in = df
     else:
-        # Be sure it is sorted by zeit
-        df_in = df.sort_values(by=['zeit', 'instrument', 'trial', loc_name])
-
-        # Convert location name to instrument/trial/location tuple
-        df_in['new_loc_name'] = [(r['instrument'], r['trial'], r[loc_name])
-                                     for _, r in df_in.iterrows()]
-        loc_name = 'new_loc_name'
+        df_in, loc_name = _composite_locations(df, loc_name=loc_name)
 
 
     # Make plots
-    p = tsplot.grid(
-            df_in, 'zeit', signal, 'genotype', loc_name, cats=gtype_order,
-            time_ind='zeit_ind', light='light', summary_trace=summary_trace,
-            time_shift=time_shift, height=height, width=width,
-            x_axis_label='time (hr)', y_axis_label=y_axis_label, colors=colors)
+    with profiling.stage('tsplot', rows=len(df_in)):
+        p = tsplot.grid(
+                df_in, 'zeit', signal, 'genotype', loc_name, cats=gtype_order,
+                time_ind='zeit_ind', light='light',
+                summary_trace=summary_trace if max_points is None else None,
+                time_shift=time_shift, height=height, width=width,
+                x_axis_label='time (hr)', y_axis_label=y_axis_label,
+                colors=colors)
+
+    if max_points is not None and summary_trace is not None:
+        gtypes = gtype_order if gtype_order is not None \
+                             else list(df_in['genotype'].unique())
+        if colors is None:
+            palette = bokeh.palettes.Paired[12]
+            summary_colors = [palette[(2*i + 1) % 12]
+                                for i in range(len(gtypes))]
+        else:
+            summary_colors = [colors[gtype][1] for gtype in gtypes]
+        _overlay_summary(p, [df_full.loc[df_full['genotype'] == gtype]
+                                for gtype in gtypes],
+                         signal, summary_trace, summary_colors, time_shift,
+                         max_points, decimation)
 
     return p
 
 
+@profiling.profiled(rows='input')
 def summary(df, signal='activity', summary_trace='mean', loc_name='location',
             gtype_order=None, time_shift='center', confint=True, 
             ptiles=(2.5, 97.5), n_bs_reps=1000, alpha=0.35, height=350, 
@@ -385,20 +777,412 @@ def summary(df, signal='activity', summary_trace='mean', loc_name='location',
     if len(inst_trial) == 1:
         df_in = df
     else:
-        # Be sure it is sorted by zeit
-        df_in = df.sort_values(by=['zeit', 'instrument', 'trial', loc_name])
-
-        # Convert location name to instrument/trial/location tuple
-        df_in['new_loc_name'] = [(r['instrument'], r['trial'], r[loc_name])
-                                     for _, r in df_in.iterrows()]
-        loc_name = 'new_loc_name'
-
-    p = tsplot.summary(
-            df_in, 'zeit', signal, 'genotype', loc_name, cats=gtype_order,
-            time_ind='zeit_ind', light='light', summary_trace=summary_trace,
-            time_shift=time_shift, confint=confint, ptiles=ptiles,
-            n_bs_reps=n_bs_reps, alpha=0.25, height=height, width=width,
-            x_axis_label='time (hr)', y_axis_label=y_axis_label, 
-            colors=colors, legend=legend)
+        df_in, loc_name = _composite_locations(df, loc_name=loc_name)
+
+    with profiling.stage('tsplot', rows=len(df_in)):
+        p = tsplot.summary(
+                df_in, 'zeit', signal, 'genotype', loc_name, cats=gtype_order,
+                time_ind='zeit_ind', light='light', summary_trace=summary_trace,
+                time_shift=time_shift, confint=confint, ptiles=ptiles,
+                n_bs_reps=n_bs_reps, alpha=0.25, height=height, width=width,
+                x_axis_label='time (hr)', y_axis_label=y_axis_label, 
+                colors=colors, legend=legend)
+
+    return p
+
+
+def _dark_intervals(zeit, light):
+    """
+    Start and end Zeitgeber times of periods of darkness.
+    """
+    if light is None or len(zeit) == 0:
+        return []
+
+    dark = ~np.asarray(light, dtype=bool)
+    switch = np.diff(np.concatenate(((0,), dark.astype(int), (0,))))
+    starts = np.where(switch == 1)[0]
+    ends = np.where(switch == -1)[0]
+    dt = np.median(np.diff(zeit)) if len(zeit) > 1 else 0
+
+    return [(zeit[i], zeit[j-1] + dt) for i, j in zip(starts, ends)]
+
+
+@profiling.profiled(rows='input')
+def aggregate_summary(agg, summary_trace='mean', gtype_order=None,
+                      time_shift='center', confint=True, n_sem=2.0,
+                      ptiles=(2.5, 97.5), alpha=0.35, height=350, width=650,
+                      colors=None, legend=True, y_axis_label=None):
+    """
+    Generate a summary plot from per-genotype aggregates.
+
+    Parameters
+    ----------
+    agg : summarize.TraceAggregator or pandas DataFrame
+        Aggregated signal, or the output of its result() method with
+        the needed quantiles.
+    summary_trace : string or float, default 'mean'
+        Which summary statistic to plot; 'mean', 'median', or a float
+        between 0 and 1 giving a quantile from the sketch.
+    gtype_order : list or tuple, default None
+        A list of the order of the genotypes to use in the plots. If
+        None, genotypes are sorted.
+    time_shift : string, default 'center'
+        One of {'left', 'right', 'center', 'interval'}
+        left: do not perform a time shift
+        right: Align time points to right edge of interval
+        center: Align time points to the center of the interval
+        interval: Plot the signal as a horizontal line segment
+                  over the time interval
+    confint : bool, default True
+        If True, also display a band. For the mean, it is `n_sem`
+        standard errors of the mean on each side. For quantiles, it is
+        between the `ptiles` percentiles of the wells.
+    n_sem : float, default 2.0
+        Number of standard errors of the band around the mean.
+    ptiles : list or tuple of length two, default (2.5, 97.5)
+        Percentiles bounding the band around a quantile.
+    alpha : float, default 0.35
+        alpha value of the band.
+    height : int, default 350
+        Height of plot in pixels.
+    width : int, default 650
+        Width of plot in pixels.
+    colors : dict, default None
+        colors[gtype] is the hex value of the color of genotype
+        `gtype`. If None, Category10 colors are used.
+    legend : bool, default True
+        If True, show legend.
+    y_axis_label : str, default None
+        Label of y-axis. If None, the name of the signal if `agg` is a
+        TraceAggregator.
+
+    Returns
+    -------
+    output : Bokeh plot
+        Bokeh figure with summary plots
+
+    Notes
+    -----
+    .. Only the aggregates, one value per genotype and time point, are
+       used and sent to the browser, unlike summary(), which uses all
+       traces.
+    """
+    # Column of summary statistic and bounds of band
+    if summary_trace == 'mean':
+        col, quantiles = 'mean', []
+    elif summary_trace == 'median':
+        col, quantiles = 'q_0.5', [0.5]
+    elif isinstance(summary_trace, float) and 0 <= summary_trace <= 1:
+        col, quantiles = 'q_%g' % summary_trace, [summary_trace]
+    else:
+        raise RuntimeError("`summary_trace` must be 'mean', 'median', or a "
+                           "quantile.")
+    if col != 'mean':
+        quantiles += [ptiles[0] / 100, ptiles[1] / 100]
+        band_cols = ['q_%g' % q for q in quantiles[1:]]
+
+    if type(agg) == pd.DataFrame:
+        df = agg
+    else:
+        if y_axis_label is None:
+            y_axis_label = agg.signal
+        df = agg.result(quantiles=quantiles if col != 'mean' else None)
+
+    if gtype_order is None:
+        gtype_order = sorted(df['genotype'].unique())
+    if colors is None:
+        palette = bokeh.palettes.Category10[10]
+        colors = {gtype: palette[i % len(palette)]
+                    for i, gtype in enumerate(gtype_order)}
+
+    # Time points and lighting
+    df_time = df.groupby('zeit_ind')[['zeit', 'light']].first()
+    zeit = df_time['zeit'].values
+    shift = _time_shift(zeit, time_shift)
+
+    p = bokeh.plotting.figure(height=height, width=width,
+                              x_axis_label='time (hr)',
+                              y_axis_label=y_axis_label,
+                              tools='pan,box_zoom,wheel_zoom,reset,save')
+    for start, end in _dark_intervals(zeit, df_time['light'].values):
+        p.add_layout(bokeh.models.BoxAnnotation(left=start, right=end,
+                                                fill_color='gray',
+                                                fill_alpha=0.1))
+
+    for gtype in gtype_order:
+        df_g = df.loc[df['genotype'] == gtype]
+        x = df_g['zeit'].values + shift
+        kwargs = {'legend_label': str(gtype)} if legend else {}
+
+        if confint:
+            if col == 'mean':
+                lower = df_g['mean'] - n_sem * df_g['sem']
+                upper = df_g['mean'] + n_sem * df_g['sem']
+            else:
+                lower, upper = df_g[band_cols[0]], df_g[band_cols[1]]
+            p.varea(x=x, y1=lower.values, y2=upper.values,
+                    fill_color=colors[gtype], fill_alpha=alpha)
+
+        if time_shift == 'interval':
+            p.step(x, df_g[col].values, mode='after', line_width=2,
+                   color=colors[gtype], **kwargs)
+        else:
+            p.line(x, df_g[col].values, line_width=2, color=colors[gtype],
+                   **kwargs)
+
+    if legend:
+        p.legend.click_policy = 'hide'
+
+    return p
+
+
+def _bin_rows(img, group, max_rows):
+    """
+    Average adjacent rows of an image within groups.
+
+    Parameters
+    ----------
+    img : 2D ndarray
+        Image with rows sorted by group.
+    group : ndarray of ints
+        Group of each row, nondecreasing.
+    max_rows : int
+        Maximum number of rows to keep. If there are more groups than
+        `max_rows`, one row is kept per group.
+
+    Returns
+    -------
+    img_out : 2D ndarray
+        Image with averaged rows. Rows of different groups are never
+        averaged together.
+    group_out : ndarray
+        Group of each row of `img_out`.
+    """
+    if len(img) <= max_rows:
+        return img, group
+
+    # Position of each row within its group
+    starts = np.concatenate(((0,), np.where(np.diff(group) != 0)[0] + 1))
+    sizes = np.diff(np.concatenate((starts, (len(img),))))
+    pos = np.arange(len(img)) - np.repeat(starts, sizes)
+
+    # Smallest number of rows to average giving at most max_rows rows,
+    # by bisection since the number of rows decreases with k
+    k_lo, k_hi = int(np.ceil(len(img) / max_rows)), sizes.max()
+    while k_lo < k_hi:
+        k = (k_lo + k_hi) // 2
+        if (-(-sizes // k)).sum() <= max_rows:
+            k_hi = k
+        else:
+            k_lo = k + 1
+    k = k_lo
+
+    new_row = np.cumsum(np.concatenate(
+        ((0,), (np.diff(group) != 0) | (np.diff(pos // k) != 0)))).astype(int)
+
+    # New rows are contiguous, so sum with reduceat
+    first = np.concatenate(((0,), np.where(np.diff(new_row) != 0)[0] + 1))
+    finite = np.isfinite(img)
+    sums = np.add.reduceat(np.where(finite, img, 0), first, axis=0)
+    counts = np.add.reduceat(finite.astype(float), first, axis=0)
+    with np.errstate(invalid='ignore'):
+        img_out = sums / counts
+
+    return img_out, group[first]
+
+
+def _actogram_raster(df, signal='activity', sort_by='genotype',
+                     loc_name='location', gtype_order=None, bin_width=None,
+                     max_bins=1000, max_rows=1000, double_plot=False):
+    """
+    Build the image of an actogram.
+
+    Returns
+    -------
+    img : 2D ndarray
+        Rows are wells (or well-days if `double_plot` is True), columns
+        are time bins. Missing data are NaN.
+    x_start : float
+        Zeitgeber time of the left edge of the image.
+    bin_width : float
+        Width of time bins in hours.
+    row_genotypes : ndarray
+        Genotype of each row of `img`.
+    """
+    df_wells, zeit_ind, arrays, (_, time_code) = parse._wells_by_time(
+                                        df, [signal], loc_name=loc_name)
+    y = arrays[signal]
+
+    # Zeitgeber time of each column, from the first row at each point
+    _, first = np.unique(time_code, return_index=True)
+    zeit = df['zeit'].values[first]
+
+    # Order of wells
+    if gtype_order is None:
+        gtype_order = sorted(df_wells['genotype'].unique())
+    gtype_code = pd.Categorical(df_wells['genotype'],
+                                categories=gtype_order).codes
+    if (gtype_code < 0).any():
+        raise RuntimeError('`gtype_order` does not contain all genotypes.')
+    if sort_by is None:
+        order = np.arange(len(df_wells))
+        group = np.zeros(len(df_wells), dtype=int)
+    elif sort_by == 'genotype':
+        order = np.argsort(gtype_code, kind='mergesort')
+        group = gtype_code[order]
+    elif sort_by == 'mean':
+        with np.errstate(invalid='ignore'):
+            means = np.nanmean(y, axis=1)
+        order = np.lexsort((-means, gtype_code))
+        group = gtype_code[order]
+    else:
+        raise RuntimeError(
+                "`sort_by` must be None, 'genotype', or 'mean'.")
+    y = y[order]
+    genotypes = np.asarray(gtype_order)
+
+    # Time bins
+    if double_plot:
+        x_start = 24.0 * np.floor(zeit.min() / 24)
+        span = 24.0
+    else:
+        x_start = zeit.min()
+        span = zeit.max() - x_start + np.median(np.diff(zeit))
+    if bin_width is None:
+        n_cols = max_bins // 2 if double_plot else max_bins
+        dt = np.median(np.diff(zeit))
+        bin_width = dt * max(1, int(np.ceil(span / dt / n_cols)))
+    col_bin = np.floor((zeit - x_start) / bin_width + 1e-9).astype(int)
+
+    # Sum within bins of columns; zeit is sorted, so bins are contiguous
+    finite = np.isfinite(y)
+    starts = np.concatenate(((0,), np.where(np.diff(col_bin) != 0)[0] + 1))
+    sums = np.add.reduceat(np.where(finite, y, 0), starts, axis=1)
+    counts = np.add.reduceat(finite.astype(float), starts, axis=1)
+    n_bins = col_bin[-1] + 1
+    if double_plot:
+        bins_per_day = int(np.round(24.0 / bin_width))
+        n_days = int(np.ceil(n_bins / bins_per_day))
+        n_bins = n_days * bins_per_day
+    img = np.empty((len(y), n_bins))
+    img[:] = np.nan
+    with np.errstate(invalid='ignore'):
+        img[:, col_bin[starts]] = sums / counts
+
+    if double_plot:
+        # Rows are well-days, showing that day and the next
+        days = img.reshape((len(y), n_days, bins_per_day))
+        next_days = np.empty_like(days)
+        next_days[:] = np.nan
+        next_days[:, :-1] = days[:, 1:]
+        img = np.concatenate((days, next_days), axis=2).reshape(
+                                    (len(y) * n_days, 2 * bins_per_day))
+        group = np.repeat(group, n_days)
+
+    img, group = _bin_rows(img, group, max_rows)
+
+    return img, x_start, bin_width, genotypes[group]
+
+
+@profiling.profiled(rows='input')
+def actogram(df, signal='activity', sort_by='genotype', loc_name='location',
+             gtype_order=None, double_plot=False, bin_width=None,
+             max_bins=1000, max_rows=1000, palette=None, height=500,
+             width=800):
+    """
+    Make a rasterized actogram of all wells.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Tidy DataFrame as loaded from parse.load_activity() or returned
+        from parse.resample().
+    signal : string, default 'activity'
+        Column of `df` to show as color.
+    sort_by : str or None, default 'genotype'
+        Order of rows. 'genotype' groups wells by genotype (in the
+        order of `gtype_order`), 'mean' also sorts within genotypes by
+        decreasing mean of `signal`, and None keeps the order of
+        instrument, trial, and location.
+    loc_name : str, default 'location'
+        Name of column containing the "location," i.e., animal location.
+    gtype_order : list or tuple, default None
+        Order of genotypes. If None, genotypes are sorted.
+    double_plot : bool, default False
+        If True, make a double-plotted actogram, where each row is a
+        well on one day and shows 48 hours: that day and the next.
+        Days start at Zeitgeber time zero.
+    bin_width : float, default None
+        Width of time bins in hours. If None, the smallest multiple of
+        the sampling interval giving at most `max_bins` bins.
+    max_bins : int, default 1000
+        Maximum number of time bins if `bin_width` is None.
+    max_rows : int, default 1000
+        Maximum number of rows. If there are more wells (or well-days),
+        adjacent rows of the same genotype are averaged. There is
+        always at least one row per genotype.
+    palette : list of colors, default None
+        Color palette. If None, Viridis256 is used.
+    height : int, default 500
+        Height of plot in pixels.
+    width : int, default 800
+        Width of plot in pixels.
+
+    Returns
+    -------
+    output : Bokeh figure
+        Figure with a single image glyph.
+
+    Notes
+    -----
+    .. The data are binned into an image of at most `max_rows` (or the
+       number of genotypes, if larger) x `max_bins` pixels with
+       vectorized NumPy operations, so the size of the output does not
+       depend on the number of wells.
+    """
+    img, x_start, bin_width, row_gtypes = _actogram_raster(
+            df, signal=signal, sort_by=sort_by, loc_name=loc_name,
+            gtype_order=gtype_order, bin_width=bin_width, max_bins=max_bins,
+            max_rows=max_rows, double_plot=double_plot)
+    n_rows, n_cols = img.shape
+
+    if palette is None:
+        palette = bokeh.palettes.Viridis256
+
+    p = bokeh.plotting.figure(
+            height=height, width=width,
+            x_range=[x_start, x_start + n_cols * bin_width],
+            y_range=[n_rows, 0],
+            x_axis_label='time (hr)',
+            y_axis_label='day' if double_plot and sort_by is None
+                                else 'well',
+            tools='pan,box_zoom,wheel_zoom,reset,save')
+
+    # Row i of the image spans y = i to i + 1, with y increasing downward
+    mapper = bokeh.models.LinearColorMapper(
+            palette=palette, low=np.nanmin(img), high=np.nanmax(img),
+            nan_color='white')
+    p.image(image=[img.astype(np.float32)], x=x_start, y=0,
+            dw=n_cols * bin_width, dh=n_rows, color_mapper=mapper)
+    p.add_layout(bokeh.models.ColorBar(color_mapper=mapper, width=10,
+                                       location=(0, 0), title=signal),
+                 'right')
+
+    # Label genotype groups
+    if sort_by is not None:
+        starts = np.concatenate(
+                ((0,), np.where(row_gtypes[1:] != row_gtypes[:-1])[0] + 1))
+        ends = np.concatenate((starts[1:], (n_rows,)))
+        centers = (starts + ends) / 2
+        p.yaxis.ticker = bokeh.models.FixedTicker(ticks=list(centers))
+        p.yaxis.major_label_overrides = {
+                float(c): str(row_gtypes[i]) for c, i in zip(centers, starts)}
+        for start in starts[1:]:
+            p.add_layout(bokeh.models.Span(location=float(start),
+                                           dimension='width',
+                                           line_color='white',
+                                           line_width=2))
+
+    p.grid.visible = False
 
     return p
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve an interactive explorer of zebrafish activity time series.')
+    parser.add_argument('fname', metavar='data', type=str,
+                        help='Activity file, tidy Parquet/Feather/CSV file, or store directory.')
+    parser.add_argument('gtype_fname', metavar='genotype_file', type=str,
+                        nargs='?', default=None,
+                        help='Name of genotype file, required if `data` is an activity file.')
+    parser.add_argument('--port', '-p', action='store', dest='port',
+                        default=5006,
+                        help='Port to serve on (default 5006)')
+    parser.add_argument('--no-browser', '-n', action='store_true',
+                        dest='no_browser',
+                        help='Do not open the app in a browser.')
+    parser.add_argument('--window', '-w', action='store', dest='ind_win',
+                        default=1,
+                help='Initial number of time points in averages (default 1)')
+    parser.add_argument('--maxpoints', '-m', action='store',
+                        dest='max_points', default=1000,
+                help='Maximum number of points per trace sent to browser (default 1000)')
+    parser.add_argument('--follow', '-f', action='store_true', dest='follow',
+                        help='Monitor an activity file that is still being written.')
+    parser.add_argument('--interval', '-i', action='store', dest='interval',
+                        default=60,
+                help='Seconds between reads of a followed file (default 60)')
+    parser.add_argument('--binwidth', '-B', action='store', dest='bin_width',
+                        default=10,
+                help='Minutes per summary point of a followed file (default 10)')
+    parser.add_argument('--rollover', '-r', action='store', dest='rollover',
+                        default=2000,
+                help='Points per genotype kept in the browser when following (default 2000)')
+    parser.add_argument('--lightson', '-l', action='store', dest='lights_on',
+                        default='9:00:00',
+                help='Time that lights come on, e.g., 9:00:00 (default)')
+    parser.add_argument('--lightsoff', '-d', action='store',
+                          dest='lights_off', default='23:00:00',
+                help='Time that lights go off, e.g., 23:00:00 (default)')
+    parser.add_argument('--startday', '-D', action='store',
+                        dest='day_in_the_life', default=4,
+            help="Day in zebrafish's life that experiment began (default 4)" )
+    args = parser.parse_args()
+
+    # Import after parsing arguments so that --help is fast
+    import fishact
+
+    # Follow a run in progress
+    if args.follow:
+        if args.gtype_fname is None:
+            parser.error('a genotype file is required with --follow')
+        follower = fishact.monitor.ActivityFollower(
+                args.fname, args.gtype_fname,
+                bin_width=float(args.bin_width) / 60,
+                lights_on=args.lights_on, lights_off=args.lights_off,
+                day_in_the_life=int(args.day_in_the_life))
+        fishact.app.serve_monitor(
+                follower, port=int(args.port), show=not args.no_browser,
+                interval=float(args.interval), rollover=int(args.rollover))
+    else:
+        # Load the data once; it is shared by all sessions
+        print('Loading in the data....')
+        if args.gtype_fname is None:
+            data = fishact.app.AppData.load(args.fname)
+        else:
+            data = fishact.app.AppData.load(
+                    args.fname, args.gtype_fname, lights_on=args.lights_on,
+                    lights_off=args.lights_off,
+                    day_in_the_life=int(args.day_in_the_life))
+
+        fishact.app.serve(data, port=int(args.port), show=not args.no_browser,
+                          ind_win=int(args.ind_win),
+                          max_points=int(args.max_points))
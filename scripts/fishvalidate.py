@@ -1,24 +1,62 @@
 #!/usr/bin/env python
 
 import argparse
-
-import fishact
+import os
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='Validate data files.')
     parser.add_argument('activity_fname', metavar='activity_file', type=str,
+                        nargs='?', default=None,
                         help='Name of activity file.')
     parser.add_argument('gtype_fname', metavar='genotype_file', type=str,
+                        nargs='?', default=None,
                         help='Name of genotype file.')
+    parser.add_argument('--stream', '-s', action='store_true', dest='stream',
+                        help='Validate activity file in chunks in a single pass, for very large files.')
+    parser.add_argument('--dir', '-d', action='store', dest='dirname',
+                        default=None,
+                        help='Validate all activity/genotype file pairs in a directory. Genotype file for `exp.csv` is named like `exp_genotype.txt`.')
+    parser.add_argument('--jobs', '-j', action='store', dest='n_jobs',
+                        default=1, type=int,
+                        help='Number of processes to use with --dir (default 1).')
+    parser.add_argument('--summary', '-o', action='store', dest='summary',
+                        default=None,
+                        help='File to write summary of --dir validation to; JSON unless name ends in `.csv`.')
+    parser.add_argument('--nocache', action='store_true', dest='no_cache',
+                        help='With --dir, revalidate file pairs that passed on a previous run.')
 
     args = parser.parse_args()
 
-    print('------------------------------------------------')
-    print('Checking genotype file...')
-    fishact.validate.test_genotype_file(args.gtype_fname)
-    print('------------------------------------------------\n\n\n')
-    print('------------------------------------------------')
-    print('Checking activity file...')
-    fishact.validate.test_activity_file(args.activity_fname, args.gtype_fname)
-    print('------------------------------------------------')
+    # Import after parsing arguments so that --help is fast
+    import fishact.validate
+
+    if args.dirname is not None:
+        if args.no_cache:
+            cache_fname = None
+        else:
+            cache_fname = os.path.join(args.dirname,
+                                       '.fishvalidate_cache.json')
+        results = fishact.validate.validate_directory(
+                        args.dirname, n_jobs=args.n_jobs,
+                        cache_fname=cache_fname)
+        if args.summary is not None:
+            fishact.validate.write_validation_summary(results, args.summary)
+    else:
+        if args.activity_fname is None or args.gtype_fname is None:
+            parser.error('activity_file and genotype_file are required '
+                         + 'unless --dir is given.')
+
+        print('------------------------------------------------')
+        print('Checking genotype file...')
+        fishact.validate.test_genotype_file(args.gtype_fname)
+        print('------------------------------------------------\n\n\n')
+        print('------------------------------------------------')
+        print('Checking activity file...')
+        if args.stream:
+            fishact.validate.stream_activity_file(args.activity_fname,
+                                                  args.gtype_fname)
+        else:
+            fishact.validate.test_activity_file(args.activity_fname,
+                                                args.gtype_fname)
+        print('------------------------------------------------')
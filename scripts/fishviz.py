@@ -2,14 +2,6 @@
 
 import argparse
 
-import numpy as np
-import pandas as pd
-
-import bokeh.io
-
-import fishact
-import tsplot
-
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -28,6 +20,9 @@ if __name__ == '__main__':
                         help='Select to plot minutes of sleep over time.')
     parser.add_argument('--summary', '-s', action='store_true', dest='summary',
                     help='Select to give summary plot, not plot of all fish.')
+    parser.add_argument('--aggregate', '-a', action='store_true',
+                        dest='aggregate',
+                    help='Build summary plot from per-genotype aggregates only; band is +/- 2 s.e.m. for mean, or confidence percentiles of wells for other statistics.')
     parser.add_argument('--svg', '-g', action='store_true', dest='svg',
                     help='Save traces as SVG as well as HTML.')
     parser.add_argument('--confint', '-c', action='store', dest='confint',
@@ -56,6 +51,11 @@ if __name__ == '__main__':
                         help="Ignore genotype information (genotype file still must be provided to determine which fish are analyze-able).")
     args = parser.parse_args()
 
+    # Import after parsing arguments so that --help is fast
+    import bokeh.io
+
+    import fishact
+
     # Specify output
     if args.html_file is not None:
         outfile = args.html_file
@@ -103,7 +103,13 @@ if __name__ == '__main__':
             p = fishact.visualize.all_traces(df, signal=signal,
                 summary_trace=args.summary_trace, time_shift=args.time_shift)
     else:
-        if args.summary:
+        if args.summary and args.aggregate:
+            agg = fishact.summarize.TraceAggregator(signal).update(df)
+            p = fishact.visualize.aggregate_summary(
+                    agg, summary_trace=args.summary_trace,
+                    time_shift=args.time_shift, confint=confint, ptiles=ptiles,
+                    y_axis_label=fishact.visualize.get_y_axis_label(df, signal))
+        elif args.summary:
             p = fishact.visualize.summary(
                     df, signal=signal, summary_trace=args.summary_trace,
                     time_shift=args.time_shift, confint=confint, ptiles=ptiles)
@@ -0,0 +1,87 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+
+def make_activity_frame(n_wells=4, n_times=1320, start='2017-03-30 14:00:00',
+                        interval=60, seed=42):
+    """
+    Make a DataFrame formatted as an activity file from the instrument.
+    """
+    np.random.seed(seed)
+
+    time = pd.date_range(start, periods=n_times, freq='%dS' % interval)
+    start_sec = np.arange(n_times, dtype=float) * interval
+
+    df = pd.DataFrame(
+        {'location': np.repeat(['c1-%03d' % i for i in range(1, n_wells+1)],
+                               n_times),
+         'animal': np.zeros(n_wells*n_times, dtype=int),
+         'user': ['user'] * n_wells*n_times,
+         'sn': np.zeros(n_wells*n_times, dtype=int),
+         'an': np.zeros(n_wells*n_times, dtype=int),
+         'datatype': ['Quantization'] * n_wells*n_times,
+         'start': np.tile(start_sec, n_wells),
+         'end': np.tile(start_sec + interval, n_wells),
+         'startreason': ['Period'] * n_wells*n_times,
+         'endreason': ['Period'] * n_wells*n_times,
+         'frect': np.random.randint(0, 10, n_wells*n_times),
+         'fredur': np.random.uniform(0, 5, n_wells*n_times).round(1),
+         'midct': np.random.randint(0, 10, n_wells*n_times),
+         'middur': (np.random.uniform(0, 10, n_wells*n_times)
+                    * (np.random.uniform(size=n_wells*n_times) < 0.5)).round(1),
+         'burct': np.random.randint(0, 10, n_wells*n_times),
+         'burdur': np.random.uniform(0, 5, n_wells*n_times).round(1),
+         'stdate': np.tile(time.strftime('%d/%m/%Y'), n_wells),
+         'sttime': np.tile(time.strftime('%H:%M:%S'), n_wells)},
+        columns=['location', 'animal', 'user', 'sn', 'an', 'datatype',
+                 'start', 'end', 'startreason', 'endreason', 'frect',
+                 'fredur', 'midct', 'middur', 'burct', 'burdur', 'stdate',
+                 'sttime'])
+
+    # Instrument files are ordered by time, then location
+    return df.sort_values(by=['start', 'location']).reset_index(drop=True)
+
+
+def write_genotype_file(fname, n_wells=4):
+    """
+    Write a genotype file with half of the wells wild type.
+    """
+    wells = np.arange(1, n_wells+1)
+    with open(fname, 'w') as f:
+        f.write('wt,mut\n')
+        for wt, mut in zip(wells[::2], wells[1::2]):
+            f.write('%d,%d\n' % (wt, mut))
+
+
+@pytest.fixture
+def activity_files(tmpdir):
+    """
+    Names of a small activity file and its genotype file.
+    """
+    fname = str(tmpdir.join('activity.csv'))
+    genotype_fname = str(tmpdir.join('genotype.txt'))
+    make_activity_frame().to_csv(fname, index=False)
+    write_genotype_file(genotype_fname)
+
+    return fname, genotype_fname
+
+
+@pytest.fixture
+def experiments(tmpdir):
+    """
+    Three experiments of a small activity file and its genotype file,
+    as dicts with keys 'fname', 'genotype_fname', 'instrument',
+    'trial', and 'kwargs'.
+    """
+    exps = []
+    for i in range(3):
+        fname = str(tmpdir.join('activity_%d.csv' % i))
+        genotype_fname = str(tmpdir.join('genotype_%d.txt' % i))
+        make_activity_frame(seed=i).to_csv(fname, index=False)
+        write_genotype_file(genotype_fname)
+        exps.append({'fname': fname, 'genotype_fname': genotype_fname,
+                     'instrument': 'inst', 'trial': i, 'kwargs': {}})
+
+    return exps
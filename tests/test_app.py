@@ -0,0 +1,51 @@
+import numpy as np
+
+import bokeh.document
+
+import fishact
+
+
+def test_view_data(activity_files, tmpdir):
+    df = fishact.parse.load_activity(*activity_files)
+    data = fishact.app.AppData.from_frame(df)
+    assert data.genotypes == ['mut', 'wt']
+    assert data.arrays['activity'].shape == (4, 1320)
+
+    traces, summary = fishact.app.view_data(data, genotype='mut',
+                                            max_points=5000)
+    assert traces['well'] == [1, 3]
+    assert len(traces['ys'][0]) == 1320
+    df_mut = df.loc[df['location'] == 2].sort_values(by='zeit')
+    assert np.allclose(traces['ys'][0], df_mut['activity'].values)
+
+    # Zoomed and resampled view is summed over windows
+    traces, summary = fishact.app.view_data(
+            data, genotype='mut', zeit_range=(2.0, 3.0), ind_win=10,
+            max_points=5000)
+    assert len(traces['xs'][0]) < 10
+    i = np.searchsorted(data.zeit, traces['xs'][0][1])
+    assert np.isclose(traces['ys'][0][1],
+                      data.arrays['activity'][1, i:i+10].sum())
+    assert np.allclose(summary['y'], np.mean(traces['ys'], axis=0))
+
+    # Decimated views
+    traces, summary = fishact.app.view_data(data, max_points=100)
+    assert len(traces['ys']) == 4
+    assert all(len(y) <= 100 for y in traces['ys'])
+    assert len(summary['x']) == 100
+
+    # Store is read through memmaps
+    store = fishact.store.write_store(df, str(tmpdir.join('store')))
+    data_store = fishact.app.AppData.load(str(tmpdir.join('store')))
+    assert isinstance(data_store.arrays['activity'], np.memmap)
+    traces_store, _ = fishact.app.view_data(data_store, max_points=100)
+    assert np.allclose(np.concatenate(traces_store['ys']),
+                       np.concatenate(traces['ys']))
+
+
+def test_make_document(activity_files):
+    df = fishact.parse.load_activity(*activity_files)
+    data = fishact.app.AppData.from_frame(df)
+    doc = bokeh.document.Document()
+    fishact.app.make_document(doc, data, max_points=200)
+    assert len(doc.roots) == 1
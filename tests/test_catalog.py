@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+import fishact
+
+from conftest import make_activity_frame, write_genotype_file
+
+
+@pytest.fixture
+def catalog(tmpdir):
+    cat = fishact.catalog.Catalog(str(tmpdir.join('catalog.db')))
+    for i in range(2):
+        fname = str(tmpdir.join('activity_%d.csv' % i))
+        genotype_fname = str(tmpdir.join('genotype_%d.txt' % i))
+        make_activity_frame(seed=i).to_csv(fname, index=False)
+        write_genotype_file(genotype_fname)
+        cat.add(fname, genotype_fname, 'inst', i, lights_on='9:00:00')
+
+    yield cat
+    cat.close()
+
+
+def test_experiments(catalog):
+    df = catalog.experiments()
+    assert list(df['trial']) == [0, 1]
+    assert list(df['n_wells']) == [4, 4]
+    assert df['genotypes'][0] == ['mut', 'wt']
+    assert df['interval'][0] == 60.0
+    assert df['n_rows'][0] == 4 * 1320
+    assert df['start_time'][0] == '2017-03-30 14:00:00'
+
+    assert len(catalog.experiments(trial=1)) == 1
+    assert len(catalog.experiments(genotype='het')) == 0
+    assert len(catalog.experiments(start='2017-04-10')) == 0
+    assert len(catalog.experiments(end='2017-03-30 15:00:00')) == 2
+
+    df = catalog.wells(genotype='mut')
+    assert set(df['genotype']) == {'mut'}
+    assert len(df) == 4
+
+
+def test_reindex(catalog, tmpdir):
+    # Nothing changed
+    assert catalog.index() == 0
+
+    # Touched, but same contents
+    fname = str(tmpdir.join('genotype_0.txt'))
+    os.utime(fname, (0, 0))
+    assert catalog.index() == 0
+
+    # Changed contents
+    with open(fname, 'w') as f:
+        f.write('wt\n1\n2\n3\n4\n')
+    assert catalog.index() == 1
+    assert catalog.experiments()['genotypes'][0] == ['wt']
+
+    calls = []
+    assert catalog.index(force=True,
+                         progress=lambda *args: calls.append(args)) == 4
+    size = os.path.getsize(str(tmpdir.join('activity_0.csv')))
+    assert calls[:2] == [('index', 0, 2, None), ('index', 1, 2, size)]
+
+
+def test_dataset(catalog):
+    ds = catalog.dataset(trial=1)
+    assert len(ds) == 1
+    assert ds.experiments[0]['kwargs'] == {'lights_on': '9:00:00'}
+    df = ds.collect()
+    assert set(df['trial']) == {1}
+
+
+def test_acquisition_order(tmpdir):
+    fnames = [str(tmpdir.join('activity_%d.csv' % i)) for i in range(2)]
+    genotype_fname = str(tmpdir.join('genotype.txt'))
+    for i, fname in enumerate(fnames):
+        make_activity_frame(start='2017-03-3%d 14:00:00' % i).to_csv(
+                                                        fname, index=False)
+    write_genotype_file(genotype_fname)
+
+    # Files are listed by acquisition, not by row order in the database
+    with fishact.catalog.Catalog(':memory:') as cat:
+        cat.add(fnames, genotype_fname, 'inst', 1)
+        cat.conn.execute('UPDATE activity_files SET acquisition = 3 - '
+                         'acquisition')
+        assert cat.experiments()['activity_fnames'][0] == fnames[::-1]
+
+
+def test_scan_interval(tmpdir):
+    # First chunk has a different interval than the rest of the file
+    fname = str(tmpdir.join('activity.csv'))
+    df = make_activity_frame(n_wells=1, n_times=100, interval=10)
+    df = df.append(make_activity_frame(n_wells=1, n_times=300,
+                                       start='2017-03-30 14:20:00'))
+    df.to_csv(fname, index=False)
+
+    info = fishact.catalog._scan_activity_file(fname, chunksize=100)
+    assert info['interval'] == 60.0
+    assert info['n_rows'] == 400
+
+    # Even number of rows, halfway between the middle intervals
+    df.iloc[:200].to_csv(fname, index=False)
+    info = fishact.catalog._scan_activity_file(fname, chunksize=100)
+    assert info['interval'] == 35.0
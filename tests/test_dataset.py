@@ -0,0 +1,95 @@
+import pytest
+
+import numpy as np
+
+import fishact
+
+
+@pytest.fixture
+def dataset(experiments):
+    ds = fishact.dataset.ActivityDataset()
+    for exp in experiments:
+        ds.add(exp['fname'], exp['genotype_fname'], exp['instrument'],
+               exp['trial'])
+
+    # Last plate has no mutants
+    with open(experiments[-1]['genotype_fname'], 'w') as f:
+        f.write('wt\n1\n2\n3\n4\n')
+
+    return ds
+
+
+def test_collect(dataset):
+    df = dataset.collect()
+    assert len(dataset) == 3
+    assert fishact.parse.instrument_trial_pairs(df) == [('inst', 0),
+                                                       ('inst', 1),
+                                                       ('inst', 2)]
+
+    exp = dataset.experiments[1]
+    df_1 = fishact.parse.load_activity(exp['fname'], exp['genotype_fname'],
+                                       instrument='inst', trial=1)
+    df_sub = df.loc[df['trial']==1, :].sort_values(by=['location', 'zeit'])
+    assert np.allclose(df_sub['activity'], df_1['activity'])
+
+
+def test_filter(dataset):
+    ds = dataset.filter(genotype='mut', light=False)
+
+    # Filtering is lazy and does not change original dataset
+    assert dataset.filters == {}
+    assert ds.filters == {'genotype': ['mut'], 'light': False}
+
+    df = ds.collect()
+    assert list(df['genotype'].unique()) == ['mut']
+    assert not df['light'].any()
+    assert fishact.parse.instrument_trial_pairs(df) == [('inst', 0),
+                                                       ('inst', 1)]
+
+    df = (dataset.filter(location=[1, 2, 3], zeit_range=(0, 1))
+                 .filter(location=[2, 3, 4], day=5)
+                 .select(['activity', 'frect'])
+                 .collect())
+    assert list(df.columns) == ['instrument', 'trial', 'location',
+                                'genotype', 'zeit', 'zeit_ind', 'activity',
+                                'frect']
+    assert sorted(df['location'].unique()) == [2, 3]
+    assert df['zeit'].min() >= 0 and df['zeit'].max() < 1
+    assert len(df) == 3 * 2 * 60
+
+    with pytest.raises(RuntimeError) as excinfo:
+        dataset.filter(genotype='not a genotype').collect()
+    excinfo.match('No data match the filters.')
+
+
+def test_zeit_range(dataset, monkeypatch):
+    # Zeitgeber time range is read as a clock time range
+    time_ranges = []
+    load_activity = fishact.parse.load_activity
+    def spy(*args, **kwargs):
+        time_ranges.append(kwargs.get('time_range', None))
+        return load_activity(*args, **kwargs)
+    monkeypatch.setattr(fishact.parse, 'load_activity', spy)
+
+    df = dataset.filter(zeit_range=(-2, 1.5)).collect()
+    assert [tuple(str(t) for t in tr) for tr in time_ranges] \
+            == [('2017-03-31 07:00:00', '2017-03-31 10:30:00')] * 3
+
+    # Same rows and Zeitgeber times as filtering a full load
+    df_all = dataset.collect()
+    df_all = df_all.loc[(df_all['zeit'] >= -2) & (df_all['zeit'] < 1.5), :]
+    assert len(df) == len(df_all) == 3 * 4 * 210
+    for col in ['location', 'zeit', 'day', 'light', 'activity']:
+        assert np.allclose(df[col].values, df_all[col].values)
+
+    # Experiments without data in the range are skipped
+    with pytest.raises(RuntimeError) as excinfo:
+        dataset.filter(zeit_range=(100, 101)).collect()
+    excinfo.match('No data match the filters.')
+
+
+def test_add(dataset):
+    exp = dataset.experiments[0]
+    with pytest.raises(RuntimeError) as excinfo:
+        dataset.add(exp['fname'], exp['genotype_fname'], 'inst', 0)
+    excinfo.match('already registered')
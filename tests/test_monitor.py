@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+import bokeh.document
+
+import fishact
+from conftest import make_activity_frame, write_genotype_file
+
+
+def test_follow_growing_file(tmpdir):
+    fname = str(tmpdir.join('activity.csv'))
+    genotype_fname = str(tmpdir.join('genotype.txt'))
+    write_genotype_file(genotype_fname)
+
+    # Write the file in pieces, cutting lines in the middle
+    text = make_activity_frame().to_csv(index=False)
+    cuts = [0, 25, 5000, 5003, 60000, 200000, len(text)]
+
+    follower = fishact.monitor.ActivityFollower(fname, genotype_fname)
+    dfs = []
+    for start, end in zip(cuts[:-1], cuts[1:]):
+        with open(fname, 'a') as f:
+            f.write(text[start:end])
+        dfs.append(follower.poll())
+        assert follower.offset <= end
+        if len(follower.history) > 0:
+            assert follower.history['zeit'].max() \
+                    < follower._max_bin * follower.bin_width
+    dfs.append(follower.poll(final=True))
+    assert follower.offset == len(text)
+
+    df_hist = follower.history
+    assert len(pd.concat(dfs)) == len(df_hist)
+    assert not df_hist.duplicated(subset=['genotype', 'zeit']).any()
+
+    # Same as loading the whole file and binning
+    df = fishact.parse.load_activity(fname, genotype_fname)
+    df['bin'] = np.round(df['zeit'] * 3600).astype(int) // 600
+    df_mean = (df.groupby(['genotype', 'bin', 'location'])['activity', 'sleep']
+                 .sum()
+                 .groupby(level=['genotype', 'bin'])
+                 .mean()
+                 .reset_index())
+    assert len(df_mean) == len(df_hist)
+    df_hist = df_hist.sort_values(by=['genotype', 'zeit'])
+    assert np.allclose(df_hist['activity'].values.astype(float),
+                       df_mean['activity'].values)
+    assert np.allclose(df_hist['sleep'].values.astype(float),
+                       df_mean['sleep'].values)
+    assert np.allclose(df_hist['zeit'].values.astype(float),
+                       df_mean['bin'].values / 6)
+
+    # Restarted file is followed from the start
+    with open(fname, 'w') as f:
+        f.write(text[:50000])
+    follower.poll()
+    assert 0 < len(follower.history) < len(df_hist)
+
+
+def test_monitor_document(tmpdir):
+    fname = str(tmpdir.join('activity.csv'))
+    genotype_fname = str(tmpdir.join('genotype.txt'))
+    write_genotype_file(genotype_fname)
+    text = make_activity_frame().to_csv(index=False)
+    with open(fname, 'w') as f:
+        f.write(text[:100000])
+
+    follower = fishact.monitor.ActivityFollower(fname, genotype_fname)
+    follower.poll()
+    n_hist = len(follower.history)
+    doc = bokeh.document.Document()
+    fishact.app.make_monitor_document(doc, follower, rollover=5)
+    source = doc.roots[0].children[0].renderers[0].data_source
+    assert len(source.data['zeit']) == 5
+
+    with open(fname, 'a') as f:
+        f.write(text[100000:])
+    list(doc.session_callbacks)[0].callback()
+    assert len(follower.history) > n_hist
+    assert len(source.data['zeit']) == 5
+    assert source.data['zeit'][-1] == follower.history.loc[
+                follower.history['genotype'] == 'mut', 'zeit'].values[-1]
@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+
 import pytest
 
 import numpy as np
@@ -6,6 +10,8 @@ from pandas.util.testing import assert_frame_equal
 
 import fishact
 
+from conftest import make_activity_frame, write_genotype_file
+
 def test_sniffer():
     n_header, delimiter, line = fishact.parse._sniff_file_info(
                                                 'tests/single_gtype.txt')
@@ -44,6 +50,19 @@ def test_resample_array():
                 and np.isnan(fishact.parse._resample_array(x, 5)[1])
 
 
+def test_lazy_imports():
+    # Validation does not import Numba or the plotting stack
+    code = ('import sys, fishact; fishact.validate; '
+            'print(",".join(m for m in ["numba", "bokeh", "tsplot"] '
+            'if m in sys.modules))')
+    output = subprocess.check_output([sys.executable, '-c', code])
+    assert output.decode().strip() == ''
+
+    x = np.random.uniform(size=95)
+    assert np.allclose(fishact.parse._resample_array(x, 10),
+                       fishact.parse._resample_array.py_func(x, 10))
+
+
 def test_resample_segment():
     df = pd.DataFrame({'a': np.arange(10),
                        'b': np.arange(10, 20),
@@ -172,3 +191,218 @@ def test_tidy_data():
     excinfo.match("tests/empty_file_for_tests.csv already exists, cowardly refusing to overwrite.")
 
     ## TO DO: integration test: make sure output CSV is as expected.
+
+
+def test_is_lexsorted():
+    assert fishact.parse._is_lexsorted((np.array([0, 1, 2]),))
+    assert not fishact.parse._is_lexsorted((np.array([0, 2, 1]),))
+    assert fishact.parse._is_lexsorted((np.array([0, 1, 0, 1]),
+                                        np.array([0, 0, 1, 1])))
+    assert not fishact.parse._is_lexsorted((np.array([0, 1, 1, 0]),
+                                            np.array([0, 0, 1, 1])))
+    assert fishact.parse._is_lexsorted((np.array([5]), np.array([1])))
+
+
+def test_merge_experiments():
+    def make_df(instrument, trial, zeit_offset):
+        return pd.DataFrame(
+            {'location': np.array([1, 2] * 5),
+             'zeit': np.repeat(np.arange(5), 2).astype(float) + zeit_offset,
+             'activity': np.arange(10, dtype=float),
+             'genotype': ['wt', 'mut'] * 5,
+             'instrument': [instrument] * 10,
+             'trial': [trial] * 10})
+
+    df_1 = make_df(2, 1, 0.0)
+    df_2 = make_df(1, 2, 0.5)
+    df_2_copy = df_2.copy()
+
+    df = fishact.parse.merge_experiments([df_1, df_2])
+    assert list(df.columns) == list(df_1.columns)
+    assert str(df['instrument'].dtype) == 'category'
+    assert str(df['trial'].dtype) == 'category'
+    assert list(df['instrument']) == [1] * 10 + [2] * 10
+    assert list(df['trial']) == [2] * 10 + [1] * 10
+    assert np.allclose(df['zeit'], np.concatenate((df_2['zeit'],
+                                                   df_1['zeit'])))
+    assert fishact.parse.instrument_trial_pairs(df) == [(1, 2), (2, 1)]
+
+    # Inputs are not touched
+    assert_frame_equal(df_2, df_2_copy)
+
+    # Specify instrument and trial
+    with pytest.warns(RuntimeWarning):
+        df = fishact.parse.merge_experiments(
+                [df_1, df_2], instrument_trial=[('a', 1), ('b', 1)])
+    assert list(df['instrument']) == ['a'] * 10 + ['b'] * 10
+    assert list(df['activity']) == list(range(10)) * 2
+    assert list(df_2['instrument']) == [1] * 10
+
+    with pytest.raises(RuntimeError) as excinfo:
+        fishact.parse.merge_experiments(
+                [df_1, df_2], instrument_trial=[('a', 1), ('a', 1)])
+    excinfo.match('instrument, trial pairs are not all unique.')
+
+    with pytest.raises(RuntimeError) as excinfo:
+        fishact.parse.merge_experiments([df_1, df_1])
+    excinfo.match('Nonunique instrument/trial pairs in inputted DataFrames.')
+
+
+@pytest.mark.parametrize('ext', ['.parquet', '.feather', '.csv'])
+def test_write_read_tidy(tmpdir, ext):
+    if ext != '.csv':
+        pytest.importorskip('pyarrow')
+
+    df = pd.DataFrame(
+        {'location': np.tile([1, 2, 3], 4),
+         'genotype': pd.Categorical(np.tile(['wt', 'mut', 'wt'], 4),
+                                    categories=['wt', 'mut', 'het']),
+         'time': pd.date_range('2017-03-30 14:00:00', periods=12,
+                               freq='min'),
+         'activity': np.arange(12, dtype=float),
+         'light': [True, False] * 6,
+         'instrument': [1] * 12,
+         'trial': [1] * 6 + [2] * 6})
+    fname = str(tmpdir.join('tidy' + ext))
+    fishact.parse.write_tidy(df, fname)
+
+    df_read = fishact.parse.read_tidy(fname)
+    df_sorted = df.sort_values(by=['instrument', 'trial', 'location'],
+                               kind='mergesort').reset_index(drop=True)
+    if ext == '.csv':
+        assert np.allclose(df_read['activity'], df['activity'])
+        return
+
+    assert_frame_equal(df_read, df_sorted)
+    assert list(df_read['genotype'].cat.categories) == ['wt', 'mut', 'het']
+
+    df_read = fishact.parse.read_tidy(fname, columns=['activity'], trial=2,
+                                      locations=[1, 3])
+    assert list(df_read.columns) == ['activity']
+    assert list(df_read['activity']) == [6.0, 9.0, 8.0, 11.0]
+
+    if ext == '.parquet':
+        import pyarrow.parquet
+        assert pyarrow.parquet.ParquetFile(fname).num_row_groups == 6
+
+    with pytest.raises(RuntimeError) as excinfo:
+        fishact.parse.write_tidy(df, fname, format='hdf5')
+    excinfo.match("Invalid format 'hdf5'")
+
+
+def test_tidy_directory(tmpdir):
+    for i in range(2):
+        make_activity_frame(seed=i).to_csv(
+                str(tmpdir.join('exp%d.csv' % i)), index=False)
+        write_genotype_file(str(tmpdir.join('exp%d_genotype.txt' % i)))
+    manifest = str(tmpdir.join('manifest.csv'))
+    with open(manifest, 'w') as f:
+        f.write('fname,genotype_fname,lights_on,day_in_the_life\n')
+        f.write('exp0.csv,exp0_genotype.txt,9:00:00,4\n')
+        f.write('exp1.csv,exp1_genotype.txt,,5\n')
+    out_dir = str(tmpdir.join('tidy'))
+
+    results = fishact.parse.tidy_directory(manifest, out_dir, quiet=True)
+    assert [r['status'] for r in results] == ['done', 'done']
+    df = pd.read_csv(results[1]['out_fname'])
+    assert df['day'].min() == 5
+
+    # Outputs are up to date
+    results = fishact.parse.tidy_directory(manifest, out_dir, quiet=True)
+    assert [r['status'] for r in results] == ['skipped', 'skipped']
+
+    # Changed parameters
+    with open(manifest, 'w') as f:
+        f.write('fname,genotype_fname,lights_on,day_in_the_life\n')
+        f.write('exp0.csv,exp0_genotype.txt,9:00:00,4\n')
+        f.write('exp1.csv,exp1_genotype.txt,15:00:00,5\n')
+    results = fishact.parse.tidy_directory(manifest, out_dir, n_jobs=2,
+                                           quiet=True)
+    assert [r['status'] for r in results] == ['skipped', 'done']
+    assert not pd.read_csv(results[1]['out_fname'])['light'].all()
+
+    with open(manifest, 'a') as f:
+        f.write('exp1.csv,exp1_genotype.txt,,5\n')
+    with pytest.raises(RuntimeError) as excinfo:
+        fishact.parse.tidy_directory(manifest, out_dir, quiet=True)
+    excinfo.match('Output file .* is used by more than one experiment.')
+
+
+@pytest.mark.parametrize('ext', ['.gz', '.bz2', '.xz', '.zst'])
+def test_load_compressed(activity_files, ext):
+    fname, genotype_fname = activity_files
+    if ext == '.zst':
+        zstandard = pytest.importorskip('zstandard')
+        with open(fname, 'rb') as f_in, open(fname + ext, 'wb') as f_out:
+            zstandard.ZstdCompressor().copy_stream(f_in, f_out)
+    else:
+        import bz2, gzip, lzma
+        opener = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}[ext]
+        with open(fname, 'rb') as f_in, opener(fname + ext, 'wb') as f_out:
+            f_out.write(f_in.read())
+
+    df = fishact.parse.load_activity(fname, genotype_fname)
+    df_compressed = fishact.parse.load_activity(fname + ext, genotype_fname)
+    assert_frame_equal(df, df_compressed)
+
+    report = fishact.validate.stream_activity_file(
+            fname + ext, genotype_fname, chunksize=1000, quiet=True)
+    assert report.passed
+
+    # Pairing of compressed activity files with genotype files
+    dirname = os.path.dirname(fname)
+    os.remove(fname)
+    os.rename(fname + ext, os.path.join(dirname, 'exp.csv' + ext))
+    os.rename(genotype_fname, os.path.join(dirname, 'exp_genotype.txt'))
+    assert fishact.validate.pair_files(dirname) \
+                == [(os.path.join(dirname, 'exp.csv' + ext),
+                     os.path.join(dirname, 'exp_genotype.txt'))]
+
+
+def test_time_range(activity_files):
+    fname, genotype_fname = activity_files
+    time_range = ('2017-03-31 09:00:00', '2017-03-31 10:30:00')
+
+    df = fishact.parse.load_activity(fname, genotype_fname)
+    df_range = fishact.parse.load_activity(fname, genotype_fname,
+                                           time_range=time_range)
+    assert os.path.isfile(fname + '.tidx')
+    assert df_range['time'].min() == pd.to_datetime(time_range[0])
+    assert len(df_range) == 4 * 90
+
+    inds = (df['time'] >= time_range[0]) & (df['time'] < time_range[1])
+    df_sub = df.loc[inds, :].reset_index(drop=True)
+    for col in ['location', 'time', 'activity', 'zeit', 'zeit_ind', 'day',
+                'light']:
+        assert (df_sub[col].values == df_range[col].values).all()
+
+    # Index is reused, and has one entry per time point
+    df_idx = fishact.parse.load_time_index(fname, build=False)
+    assert len(df_idx) == 1320
+    assert df_idx['offset'].is_monotonic_increasing
+
+    with pytest.raises(RuntimeError) as excinfo:
+        fishact.parse.load_activity(fname, genotype_fname,
+                                    time_range=('2018-01-01', '2018-01-02'))
+    excinfo.match('No data in `time_range`.')
+
+
+def test_build_time_index(tmpdir, monkeypatch):
+    # Comment lines, blank lines, and CRLF line endings
+    fname = str(tmpdir.join('activity.csv'))
+    text = make_activity_frame(n_wells=2, n_times=30).to_csv(index=False)
+    lines = text.splitlines()
+    lines = ['# comment'] + lines[:5] + ['', '# comment'] + lines[5:]
+    with open(fname, 'wb') as f:
+        f.write('\r\n'.join(lines).encode())
+
+    # Small chunks so that lines straddle chunk boundaries
+    monkeypatch.setattr(fishact.parse, '_index_chunk_bytes', 7)
+    df_idx = fishact.parse.build_time_index(fname, write=False)
+    assert len(df_idx) == 30
+    with open(fname, 'rb') as f:
+        data = f.read()
+    for offset, time in zip(df_idx['offset'], df_idx['time']):
+        assert data[offset:].decode().startswith('c1-001,')
+        assert time.strftime('%d/%m/%Y,%H:%M:%S') \
+                in data[offset:].decode().split('\r\n')[0]
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from pandas.util.testing import assert_frame_equal
+
+import fishact
+
+
+def test_prefetcher(experiments):
+    groups = [exp['fname'] for exp in experiments]
+    pf = fishact.prefetch.Prefetcher(groups, max_prefetch=1)
+    contents = [c for _, c in pf]
+    for fname, c in zip(groups, contents):
+        with open(fname, 'rb') as f:
+            assert c == [f.read()]
+    assert pf.stats['n_bytes'] == sum(len(c[0]) for c in contents)
+
+    # Errors in reading are raised in the consumer
+    pf = fishact.prefetch.Prefetcher(groups + ['nonexistent_file.csv'])
+    with pytest.raises(IOError):
+        for _ in pf:
+            pass
+
+
+def test_overlap(experiments):
+    # With a slow consumer, reads are hidden behind the consumer's work
+    reader = fishact.prefetch.ThrottledReader(latency=0.1)
+    pf = fishact.prefetch.Prefetcher([exp['fname'] for exp in experiments],
+                                     read_func=reader, max_prefetch=2)
+    for _ in pf:
+        time.sleep(0.2)
+    assert pf.stats['read_seconds'] >= 0.3
+    assert pf.stats['overlap_efficiency'] > 0.5
+
+    # With a fast consumer, there is little to overlap with
+    pf = fishact.prefetch.Prefetcher([exp['fname'] for exp in experiments],
+                                     read_func=reader, max_prefetch=2)
+    for _ in pf:
+        pass
+    assert pf.stats['overlap_efficiency'] < 0.5
+
+
+def test_load_experiments(experiments):
+    reader = fishact.prefetch.ThrottledReader(latency=0.05)
+    df, stats = fishact.prefetch.load_experiments(
+                    experiments, read_func=reader, return_stats=True)
+    assert stats['overlap_efficiency'] is not None
+
+    ds = fishact.dataset.ActivityDataset()
+    for exp in experiments:
+        ds.add(exp['fname'], exp['genotype_fname'], exp['instrument'],
+               exp['trial'])
+    assert_frame_equal(df, ds.collect())
+    assert_frame_equal(df, ds.collect(max_prefetch=1))
+    assert ds.prefetch_stats['n_bytes'] > 0
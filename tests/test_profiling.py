@@ -0,0 +1,57 @@
+import json
+
+import fishact
+
+
+def test_stages_recorded(activity_files, tmpdir):
+    fname, genotype_fname = activity_files
+
+    with fishact.profiling.profile(memory=True) as prof:
+        df = fishact.parse.load_activity(fname, genotype_fname)
+        df_rs = fishact.parse.resample(df, 10)
+        df_bouts = fishact.summarize.bouts(df, quiet=True)
+
+    stages = [rec['stage'] for rec in prof.records]
+    for name in ['load_activity/read_files',
+                 'load_activity/read_files/read_csv',
+                 'load_activity/read_files/map_genotypes',
+                 'load_activity/read_files/parse_datetime',
+                 'load_activity/sort', 'load_activity/light_and_zeit',
+                 'load_activity/time_indices', 'load_activity', 'resample',
+                 'bouts']:
+        assert name in stages
+
+    # Outer stages complete after the inner ones and include them
+    records = {rec['stage']: rec for rec in prof.records}
+    assert stages.index('load_activity') > stages.index('load_activity/sort')
+    assert records['load_activity']['wall_seconds'] \
+            >= records['load_activity/sort']['wall_seconds']
+    assert records['load_activity']['peak_traced_mb'] \
+            >= records['load_activity/sort']['peak_traced_mb']
+
+    # Rows and bytes
+    assert records['load_activity']['rows'] == len(df)
+    assert records['resample']['rows'] == len(df)
+    assert records['bouts']['rows'] == len(df)
+    assert records['load_activity/read_files/read_csv']['bytes'] > 0
+
+    # Reports
+    fname_json = str(tmpdir.join('profile.json'))
+    prof.to_json(fname_json)
+    with open(fname_json, 'r') as f:
+        report = json.load(f)
+    assert len(report['records']) == len(prof.records)
+    assert [tot['stage'] for tot in report['summary']] \
+            == [tot['stage'] for tot in prof.summary()]
+    assert 'read_csv' in prof.table()
+
+
+def test_inactive(activity_files):
+    fname, genotype_fname = activity_files
+
+    # Nothing is recorded outside of a profile
+    with fishact.profiling.profile() as prof:
+        pass
+    df = fishact.parse.load_activity(fname, genotype_fname)
+    assert prof.records == []
+    assert fishact.profiling.stage('x') is fishact.profiling._null_stage
@@ -0,0 +1,74 @@
+import os
+
+import fishact
+from conftest import make_activity_frame, write_genotype_file
+
+
+class Recorder(object):
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, task, done, total, n_bytes):
+        self.calls.append((task, done, total, n_bytes))
+
+
+def test_progress_callbacks(activity_files, capsys):
+    fname, genotype_fname = activity_files
+
+    rec = Recorder()
+    df = fishact.parse.load_activity(fname, genotype_fname, progress=rec)
+    size = os.path.getsize(fname)
+    assert rec.calls == [('load_activity', 0, 1, None),
+                         ('load_activity', 1, 1, size)]
+
+    # Callbacks are called when quiet, but nothing is printed
+    rec = Recorder()
+    fishact.parse.resample(df, 10, quiet=True, progress=rec)
+    fishact.summarize.bouts(df, quiet=True, progress=rec)
+    n_locs = df['location'].nunique()
+    for task in ['resample', 'bouts']:
+        calls = [call for call in rec.calls if call[0] == task]
+        assert [call[1] for call in calls] == list(range(n_locs + 1))
+        assert all(call[2] == n_locs for call in calls)
+    assert capsys.readouterr().out == ''
+
+    # Summaries are the same with and without a callback
+    rec = Recorder()
+    df_sum = fishact.summarize.daily_summary(df, progress=rec)
+    assert rec.calls[-1] == ('daily_summary', len(df_sum), len(df_sum), None)
+    assert df_sum.equals(fishact.summarize.daily_summary(df))
+
+    rec = Recorder()
+    fishact.summarize.rolling(df, 60, progress=rec)
+    fishact.summarize.event_aligned(df, progress=rec)
+    assert [call[1:3] for call in rec.calls if call[0] == 'rolling'] \
+            == [(i, 3) for i in range(4)]
+    calls = [call for call in rec.calls if call[0] == 'event_aligned']
+    assert calls[-1][1] == calls[-1][2] > 0
+
+    # Throughput
+    tp = fishact.progress.Throughput()
+    fishact.parse.load_activity(fname, genotype_fname, progress=tp)
+    stats = tp.tasks['load_activity']
+    assert stats['done'] == stats['total'] == 1
+    assert stats['bytes'] == size
+    assert stats['bytes_per_second'] > 0
+
+    # No callback and quiet
+    task = fishact.progress.start(None, 'resample', total=10, quiet=True)
+    assert task is fishact.progress._null_task
+
+
+def test_progress_validate_directory(tmpdir):
+    for i in range(2):
+        make_activity_frame(seed=i).to_csv(
+                str(tmpdir.join('exp%d.csv' % i)), index=False)
+        write_genotype_file(str(tmpdir.join('exp%d_genotype.txt' % i)))
+
+    rec = Recorder()
+    fishact.validate.validate_directory(str(tmpdir), quiet=True, progress=rec)
+    sizes = [os.path.getsize(str(tmpdir.join('exp%d.csv' % i)))
+                for i in range(2)]
+    assert rec.calls == [('validate_directory', 0, 2, None),
+                         ('validate_directory', 1, 2, sizes[0]),
+                         ('validate_directory', 2, 2, sum(sizes))]
@@ -0,0 +1,97 @@
+import pytest
+
+import numpy as np
+from pandas.util.testing import assert_frame_equal
+
+import fishact
+
+from conftest import make_activity_frame, write_genotype_file
+
+
+@pytest.fixture
+def df(activity_files):
+    return fishact.parse.load_activity(*activity_files)
+
+
+def test_round_trip(df, tmpdir):
+    dirname = str(tmpdir.join('store'))
+    store = fishact.store.write_store(df, dirname)
+    assert store.shape == (4, 1320)
+    assert set(store.signals) == {'activity', 'sleep'}
+    assert isinstance(store['activity'], np.memmap)
+
+    df_store = store.to_frame()
+    df_sorted = df.sort_values(by=['location', 'zeit_ind']).reset_index(
+                                                                drop=True)
+    for col in ['activity', 'sleep', 'zeit', 'light', 'day', 'time']:
+        assert (df_store[col].values == df_sorted[col].values).all()
+    assert (df_store['genotype'] == df_sorted['genotype']).all()
+
+    with pytest.raises(RuntimeError) as excinfo:
+        fishact.store.write_store(df, dirname)
+    excinfo.match('already contains a store')
+
+
+def test_slicing(df, tmpdir):
+    store = fishact.store.write_store(df, str(tmpdir.join('store')),
+                                      dtype=np.float32)
+    inds = store.well_indices(genotype='mut')
+    assert list(store.wells['location'].values[inds]) == [2, 4]
+
+    time = store.time_slice((2.0, 3.0))
+    view = store['activity'][1:3, time]
+    assert view.base is not None
+    assert view.shape == (2, 60)
+    assert view.dtype == np.float32
+
+    df_sub = store.to_frame(wells=inds, time=time)
+    assert set(df_sub['location']) == {2, 4}
+    assert df_sub['zeit'].min() >= 2.0 and df_sub['zeit'].max() < 3.0
+
+
+def test_apply(df, tmpdir):
+    store = fishact.store.write_store(df, str(tmpdir.join('store')))
+    df_sum = store.apply(fishact.summarize.daily_summary, chunk_wells=3)
+    df_sum_direct = fishact.summarize.daily_summary(df)
+    cols = ['location', 'day', 'light', 'activity', 'sleep']
+    assert_frame_equal(
+        df_sum.sort_values(by=cols[:3]).reset_index(drop=True)[cols],
+        df_sum_direct.sort_values(by=cols[:3]).reset_index(drop=True)[cols],
+        check_dtype=False)
+
+
+def test_offset_plates(tmpdir):
+    # Two plates started 10 s apart share Zeitgeber time indices
+    dfs = []
+    for i, start in enumerate(['2017-03-30 14:00:00', '2017-03-30 14:00:10']):
+        fname = str(tmpdir.join('activity_%d.csv' % i))
+        genotype_fname = str(tmpdir.join('genotype_%d.txt' % i))
+        make_activity_frame(start=start, seed=i).to_csv(fname, index=False)
+        write_genotype_file(genotype_fname)
+        dfs.append(fishact.parse.load_activity(fname, genotype_fname))
+    df = fishact.parse.merge_experiments(dfs, instrument_trial=[(1, 1),
+                                                                (1, 2)])
+
+    store = fishact.store.write_store(df, str(tmpdir.join('store')))
+    assert store.shape == (8, 1320)
+    assert np.isclose(store.axis['zeit_max'] - store.axis['zeit_min'],
+                      10 / 3600).all()
+
+    df_store = store.to_frame()
+    df_sorted = df.sort_values(
+            by=['instrument', 'trial', 'location', 'zeit_ind']).reset_index(
+                                                                drop=True)
+    for col in ['time', 'zeit', 'zeit_ind', 'exp_ind', 'acquisition', 'light',
+                'day', 'activity']:
+        assert (df_store[col].values == df_sorted[col].values).all()
+
+    # Per-well functions see each plate's own times
+    df_rs = store.apply(fishact.parse.resample, chunk_wells=3, ind_win=10,
+                        quiet=True)
+    df_rs_direct = fishact.parse.resample(df, 10, quiet=True)
+    df_rs_direct['trial'] = df_rs_direct['trial'].astype(int)
+    cols = ['trial', 'location', 'zeit', 'activity']
+    assert_frame_equal(
+        df_rs.sort_values(by=cols[:3]).reset_index(drop=True)[cols],
+        df_rs_direct.sort_values(by=cols[:3]).reset_index(drop=True)[cols],
+        check_dtype=False)
@@ -1,3 +1,5 @@
+import collections
+
 import pytest
 
 import numpy as np
@@ -104,3 +106,128 @@ def test_compute_bouts():
     correct_df = correct_df.sort_index(axis=1)
     assert_frame_equal(fishact.summarize._compute_bouts(df).sort_index(axis=1),
                        correct_df, check_dtype=False)
+
+
+def test_event_aligned():
+    df = pd.DataFrame(
+        {'location': np.concatenate((np.ones(20), 2*np.ones(20))).astype(int),
+         'zeit': np.concatenate((np.arange(20), np.arange(20))).astype(float),
+         'zeit_ind': np.concatenate((np.arange(20), np.arange(20))),
+         'activity': np.concatenate((np.arange(20),
+                                     np.arange(20, 40))).astype(float),
+         'light': ([True]*10 + [False]*10) * 2,
+         'genotype': ['wt']*40,
+         'instrument': np.ones(40, dtype=int),
+         'trial': np.ones(40, dtype=int)})
+
+    # Default events are the light switches
+    df_sum, df_traces = fishact.summarize.event_aligned(df, pre=2, post=2)
+    assert list(df_sum['event_label'].unique()) == ['lights off']
+    assert np.allclose(df_sum['rel_time'], [-2, -1, 0, 1, 2])
+    assert np.allclose(df_sum['mean'], [18., 19., 20., 21., 22.])
+    assert np.allclose(df_sum['sem'], 10.)
+    assert np.all(df_sum['n'] == 2)
+    assert len(df_traces) == 10
+    assert np.allclose(df_traces.loc[df_traces['location']==2, 'activity'],
+                       [28., 29., 30., 31., 32.])
+
+    # Windows running off the end are padded with NaN
+    df_sum, df_traces = fishact.summarize.event_aligned(
+            df, events={'stim': [1.0, 18.0]}, pre=2, post=2)
+    assert len(df_traces) == 20
+    assert np.allclose(df_sum['mean'], [26., 18.5, 19.5, 20.5, 13.])
+    assert np.all(df_sum['n'] == [2, 4, 4, 4, 2])
+
+    # Any dict of labels, e.g., an OrderedDict
+    df_sum_od, _ = fishact.summarize.event_aligned(
+            df, events=collections.OrderedDict([('stim', [1.0, 18.0])]),
+            pre=2, post=2)
+    assert_frame_equal(df_sum_od, df_sum)
+
+    # Events outside of the data are ignored
+    df_sum, df_traces = fishact.summarize.event_aligned(
+            df, events=[-5.0, 100.0], pre=2, post=2)
+    assert len(df_traces) == 0
+    assert len(df_sum) == 0
+
+
+def test_rolling():
+    df = pd.DataFrame(
+        {'location': np.concatenate((np.ones(10), 2*np.ones(10))).astype(int),
+         'zeit': np.concatenate((np.arange(10), np.arange(10))).astype(float),
+         'activity': np.array([1., 1., 0., 0., 0., 1., 0., 0., 1., 1.] * 2),
+         'sleep': np.array([0, 0, 1, 1, 1, 0, 1, 1, 0, 0] * 2),
+         'light': ([True]*5 + [False]*5) * 2,
+         'acquisition': np.ones(20, dtype=int),
+         'instrument': np.ones(20, dtype=int),
+         'trial': np.ones(20, dtype=int)})
+
+    # Shuffle to make sure sorting is done
+    df_out = fishact.summarize.rolling(df.iloc[::-1], 3)
+    sleep = np.array([0, 0, 1, 2, 3, 0, 1, 2, 2, 1])
+    assert np.allclose(df_out['rolling_sleep'], np.concatenate((sleep, sleep)))
+
+    bout_freq = np.array([0, 0, 1/3, 1/3, 1/3, 0, 1/2, 1/3, 1/3, 0])
+    assert np.allclose(df_out['rolling_bout_frequency'],
+                       np.concatenate((bout_freq, bout_freq)))
+
+    zscore = df_out['rolling_activity_zscore'].values
+    assert np.isnan(zscore[0]) and np.isnan(zscore[5])
+    assert np.isnan(zscore[1])
+    assert np.isclose(zscore[2], -2 / np.sqrt(3))
+    assert np.isclose(zscore[3], -1 / np.sqrt(3))
+    assert np.isnan(zscore[4])
+
+    df_out = fishact.summarize.rolling(df, 100, metrics=['activity'])
+    act = np.array([1, 2, 2, 2, 2, 1, 1, 1, 2, 3])
+    assert np.allclose(df_out['rolling_activity'], np.concatenate((act, act)))
+    assert 'rolling_sleep' not in df_out.columns
+
+    with pytest.raises(RuntimeError) as excinfo:
+        fishact.summarize.rolling(df, 3, metrics=['latency'])
+    excinfo.match('Invalid metric: latency')
+
+
+def test_trace_aggregator():
+    np.random.seed(3)
+    n_wells, n_times = 40, 50
+    df = pd.DataFrame({'location': np.repeat(np.arange(n_wells), n_times),
+                       'genotype': np.repeat(['wt', 'mut'] * (n_wells // 2),
+                                             n_times),
+                       'zeit_ind': np.tile(np.arange(n_times), n_wells),
+                       'light': np.tile(np.arange(n_times) < 25, n_wells),
+                       'activity': np.random.exponential(
+                                        5, size=n_wells*n_times)})
+    df['zeit'] = df['zeit_ind'] / 60
+    df.loc[::7, 'activity'] = 0.0
+    df.loc[::11, 'activity'] = np.nan
+
+    # Chunks of wells, merged aggregators, and all at once agree
+    agg = fishact.summarize.TraceAggregator()
+    for i in range(0, n_wells, 15):
+        agg.update(df.loc[df['location'].between(i, i+14)])
+    agg_a = fishact.summarize.TraceAggregator().update(
+                df.loc[df['location'] < 10])
+    agg_b = fishact.summarize.TraceAggregator().update(
+                df.loc[df['location'] >= 10])
+    agg_ab = agg_a.merge(agg_b)
+
+    gb = df.dropna().groupby(['genotype', 'zeit_ind'])['activity']
+    for a in [agg, agg_ab]:
+        df_agg = a.result(quantiles=[0.5, 0.9])
+        assert list(df_agg['n']) == list(gb.count())
+        assert np.allclose(df_agg['mean'], gb.mean())
+        assert np.allclose(df_agg['var'], gb.var())
+
+        # Quantiles are within relative accuracy of a measured value
+        for q in [0.5, 0.9]:
+            exact = gb.apply(lambda x: np.sort(x)[int(q * (len(x) - 1))])
+            assert (np.abs(df_agg['q_%g' % q].values - exact.values)
+                        <= 0.01 * exact.values + 1e-12).all()
+
+    with pytest.raises(RuntimeError) as excinfo:
+        agg.merge(fishact.summarize.TraceAggregator(signal='sleep'))
+    excinfo.match('different signals')
+
+    p = fishact.visualize.aggregate_summary(agg, summary_trace='median')
+    assert p.yaxis[0].axis_label == 'activity'
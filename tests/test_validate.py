@@ -0,0 +1,172 @@
+import json
+import os
+
+import pytest
+
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+
+import fishact
+
+from conftest import make_activity_frame, write_genotype_file
+
+
+def test_qc_wells(tmpdir):
+    df = make_activity_frame(n_wells=8)
+
+    # Well 2 is dead, well 3 saturates for two hours, well 4 has a gap
+    df.loc[df['location']=='c1-002', 'middur'] = 0.0
+    inds = (df['location']=='c1-003') & (df['start'] >= 3600) \
+                & (df['start'] < 3*3600)
+    df.loc[inds, 'middur'] = 60.0
+    inds = (df['location']=='c1-004') & (df['start'] >= 3600) \
+                & (df['start'] < 4200)
+    df = df.loc[~inds, :]
+
+    fname = str(tmpdir.join('activity.csv'))
+    genotype_fname = str(tmpdir.join('genotype.txt'))
+    df.to_csv(fname, index=False)
+    write_genotype_file(genotype_fname, n_wells=8)
+
+    df = fishact.parse.load_activity(fname, genotype_fname)
+    df_qc = fishact.validate.qc_wells(df)
+
+    assert list(df_qc['location']) == list(range(1, 9))
+    assert list(df_qc['dead']) == [False, True] + [False]*6
+    assert list(df_qc['saturated']) == [False, False, True] + [False]*5
+    assert np.isclose(df_qc.loc[2, 'saturation_run'], 2.0)
+    assert list(df_qc['gaps']) == [False]*3 + [True] + [False]*4
+    assert np.isclose(df_qc.loc[3, 'max_gap'], 11 / 60)
+    assert list(df_qc['variance_outlier']) == [False, True, True] + [False]*5
+    assert list(df_qc['flagged']) == [False, True, True, True] + [False]*4
+
+    # Loading with QC drops the flagged wells
+    with pytest.warns(RuntimeWarning):
+        df = fishact.parse.load_activity(fname, genotype_fname, qc=True)
+    assert list(df['location'].unique()) == [1, 5, 6, 7, 8]
+
+    # Keyword arguments are passed to qc_wells
+    with pytest.warns(RuntimeWarning):
+        df = fishact.parse.load_activity(
+                fname, genotype_fname,
+                qc={'saturation_hours': 3.0, 'variance_factor': 100.0})
+    assert list(df['location'].unique()) == [1, 3, 5, 6, 7, 8]
+
+
+def test_stream_activity_file(activity_files, tmpdir):
+    fname, genotype_fname = activity_files
+
+    report = fishact.validate.stream_activity_file(
+            fname, genotype_fname, chunksize=1000, quiet=True)
+    assert report.passed
+    assert report.to_dict()['errors'] == []
+
+    # Introduce errors into the file
+    df = make_activity_frame()
+    df.loc[1500, 'middur'] = -1.0
+    df.loc[2500, 'frect'] = np.nan
+    df.loc[3000, 'end'] += 10.0
+    df.loc[4000:4003, 'sttime'] = '12:00:00'
+    df = df.loc[df['location'] != 'c1-004', :]
+    bad_fname = str(tmpdir.join('bad_activity.csv'))
+    df.to_csv(bad_fname, index=False)
+
+    report = fishact.validate.stream_activity_file(
+            bad_fname, genotype_fname, chunksize=1000, quiet=True)
+    assert not report.passed
+    errors = {err['check']: err for err in report.errors}
+    assert set(errors.keys()) == {'null', 'negative middur', 'interval',
+                                  'timestamp', 'genotype'}
+
+    # Row numbers are positions in the file after dropping location 4
+    assert errors['negative middur']['rows'] == [1125]
+    assert errors['null']['rows'] == [1875]
+    assert errors['interval']['rows'] == [2250]
+    assert errors['interval']['n_rows'] == 1
+    assert errors['timestamp']['n_rows'] == 3
+    assert errors['genotype']['message'] == \
+            'location [ 4 ] in genotype file but not in activity file.'
+
+    # Chunk size does not affect results
+    report_big = fishact.validate.stream_activity_file(
+            bad_fname, genotype_fname, chunksize=100000, quiet=True)
+    assert report_big.errors == report.errors
+
+
+def test_load_activity_validate(activity_files, tmpdir):
+    fname, genotype_fname = activity_files
+
+    df, report = fishact.parse.load_activity(fname, genotype_fname,
+                                             validate='report')
+    assert report.passed
+    assert_frame_equal(df, fishact.parse.load_activity(fname, genotype_fname))
+
+    df = make_activity_frame()
+    df.loc[10, 'burdur'] = -1.0
+    bad_fname = str(tmpdir.join('bad_activity.csv'))
+    df.to_csv(bad_fname, index=False)
+
+    with pytest.raises(fishact.validate.ValidationError) as excinfo:
+        fishact.parse.load_activity(bad_fname, genotype_fname, validate=True)
+    assert excinfo.value.report.errors[0]['check'] == 'negative burdur'
+    assert excinfo.value.report.errors[0]['rows'] == [10]
+
+    # Multiple files give a combined report
+    df = make_activity_frame(start='2017-03-31 12:00:00')
+    df.loc[10, 'burdur'] = -1.0
+    df.to_csv(bad_fname, index=False)
+    _, report = fishact.parse.load_activity([fname, bad_fname],
+                                            genotype_fname, validate='report')
+    assert len(report.errors) == 1
+    assert report.errors[0]['message'].startswith(bad_fname)
+
+
+def test_validate_directory(tmpdir):
+    make_activity_frame().to_csv(str(tmpdir.join('exp1.csv')), index=False)
+    write_genotype_file(str(tmpdir.join('exp1_genotype.txt')))
+    df = make_activity_frame()
+    df.loc[5, 'middur'] = -1.0
+    df.to_csv(str(tmpdir.join('exp2.csv')), index=False)
+    write_genotype_file(str(tmpdir.join('exp2_genotypes.csv')))
+    make_activity_frame().to_csv(str(tmpdir.join('exp3.csv')), index=False)
+
+    pairs = fishact.validate.pair_files(str(tmpdir))
+    assert [(os.path.basename(f), g if g is None else os.path.basename(g))
+                for f, g in pairs] == [('exp1.csv', 'exp1_genotype.txt'),
+                                       ('exp2.csv', 'exp2_genotypes.csv'),
+                                       ('exp3.csv', None)]
+
+    cache_fname = str(tmpdir.join('cache.json'))
+    results = fishact.validate.validate_directory(
+            str(tmpdir), n_jobs=2, cache_fname=cache_fname, quiet=True)
+    assert [r['status'] for r in results] == ['passed', 'failed', 'failed']
+    assert results[1]['errors'][0]['rows'] == [5]
+
+    # Passed files are skipped the second time around
+    results = fishact.validate.validate_directory(
+            str(tmpdir), cache_fname=cache_fname, quiet=True)
+    assert [r['status'] for r in results] == ['cached', 'failed', 'failed']
+
+    # Summaries are machine readable
+    summary_fname = str(tmpdir.join('summary.json'))
+    fishact.validate.write_validation_summary(results, summary_fname)
+    with open(summary_fname, 'r') as f:
+        assert json.load(f) == json.loads(json.dumps(results))
+
+    summary_fname = str(tmpdir.join('summary.csv'))
+    fishact.validate.write_validation_summary(results, summary_fname)
+    df = pd.read_csv(summary_fname)
+    assert list(df['status']) == ['cached', 'failed', 'failed']
+
+    # Summaries in the directory are not activity files, and genotype
+    # files of experiments with longer names are not matched
+    make_activity_frame().to_csv(str(tmpdir.join('exp10.csv')), index=False)
+    write_genotype_file(str(tmpdir.join('exp10_genotype.txt')))
+    os.remove(str(tmpdir.join('exp1_genotype.txt')))
+    pairs = fishact.validate.pair_files(str(tmpdir))
+    assert [(os.path.basename(f), g if g is None else os.path.basename(g))
+                for f, g in pairs] == [('exp1.csv', None),
+                                       ('exp10.csv', 'exp10_genotype.txt'),
+                                       ('exp2.csv', 'exp2_genotypes.csv'),
+                                       ('exp3.csv', None)]
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+import bokeh.layouts
+import bokeh.plotting
+
+import fishact
+
+
+def test_composite_locations():
+    dfs = [pd.DataFrame({'location': np.tile([2, 1], 3),
+                         'zeit': np.repeat(np.arange(3), 2) + 0.5 * i,
+                         'activity': np.arange(6, dtype=float) + 10 * i,
+                         'genotype': ['wt', 'mut'] * 3,
+                         'instrument': ['a'] * 6,
+                         'trial': [i] * 6})
+           for i in range(2)]
+    df = fishact.parse.merge_experiments(dfs)
+    df_in, loc_name = fishact.visualize._composite_locations(df)
+
+    assert loc_name == 'new_loc_name'
+    assert list(df_in['zeit']) == sorted(df['zeit'])
+    assert list(df_in[loc_name].cat.categories) == ['a/0/1', 'a/0/2',
+                                                    'a/1/1', 'a/1/2']
+    assert list(df_in[loc_name][:4]) == ['a/0/1', 'a/0/2', 'a/1/1', 'a/1/2']
+    assert list(df_in['activity'][:4]) == [1.0, 0.0, 11.0, 10.0]
+
+    # Cached order is reused, but values are gathered anew
+    df['activity'] += 1
+    df_in, _ = fishact.visualize._composite_locations(df)
+    assert list(df_in['activity'][:4]) == [2.0, 1.0, 12.0, 11.0]
+
+    # Sorting in place invalidates the cached order
+    df.sort_values('zeit', inplace=True)
+    df_in, _ = fishact.visualize._composite_locations(df)
+    assert list(df_in['zeit']) == sorted(df['zeit'])
+    assert list(df_in[loc_name][:4]) == ['a/0/1', 'a/0/2', 'a/1/1', 'a/1/2']
+    assert list(df_in['activity'][:4]) == [2.0, 1.0, 12.0, 11.0]
+
+
+def test_decimate():
+    n_wells, n_times = 5, 1000
+    rg = np.random.RandomState(3)
+    activity = rg.exponential(size=(n_wells, n_times))
+    activity[2, 500] = 100.0
+    df = pd.DataFrame({'location': np.repeat(np.arange(1, n_wells+1), n_times),
+                       'zeit': np.tile(np.arange(n_times) / 60, n_wells),
+                       'zeit_ind': np.tile(np.arange(n_times), n_wells),
+                       'activity': activity.ravel(),
+                       'genotype': 'wt',
+                       'instrument': 1,
+                       'trial': 1})
+
+    # Missing point
+    df = df.drop(1234)
+
+    for method in ['lttb', 'minmax']:
+        df_dec = fishact.visualize.decimate(df, max_points=100, method=method)
+        sizes = df_dec.groupby('location').size()
+        assert (sizes <= 100).all() and (sizes >= 50).all()
+        assert df_dec.index.is_monotonic_increasing
+        assert 100.0 in df_dec['activity'].values
+
+        # Ends are kept by LTTB
+        if method == 'lttb':
+            assert (df_dec.groupby('location')['zeit_ind'].min() == 0).all()
+            assert (df_dec.groupby('location')['zeit_ind'].max()
+                        == n_times - 1).all()
+
+    # Short traces are untouched
+    assert fishact.visualize.decimate(df, max_points=2000) is df
+
+
+def test_summary_overlay():
+    n_wells, n_times = 48, 5000
+    rg = np.random.RandomState(3)
+    df = pd.DataFrame({'location': np.repeat(np.arange(1, n_wells+1), n_times),
+                       'zeit': np.tile(np.arange(n_times) / 60, n_wells),
+                       'zeit_ind': np.tile(np.arange(n_times), n_wells),
+                       'activity': rg.exponential(2.0, n_wells * n_times),
+                       'genotype': np.repeat(['wt', 'mut'],
+                                             n_wells // 2 * n_times)})
+
+    # Summary of all wells, decimated afterwards
+    zeit, y = fishact.visualize._summary_trace(df, max_points=500)
+    assert len(zeit) == len(y) == 500
+    assert np.isclose(y.mean(), 2.0, atol=0.2)
+
+    # One summary trace per figure
+    figs = [bokeh.plotting.figure() for _ in range(2)]
+    p = bokeh.layouts.gridplot([[fig] for fig in figs])
+    fishact.visualize._overlay_summary(
+            p, [df.loc[df['genotype'] == g] for g in ['wt', 'mut']],
+            'activity', 'median', ['red', 'blue'], 'center', 500, 'minmax')
+    assert fishact.visualize._figures(p) == figs
+    for fig in figs:
+        assert len(fig.renderers) == 1
+        assert len(fig.renderers[0].data_source.data['x']) <= 500
+
+
+def test_actogram():
+    n_wells, n_times = 6, 48 * 60
+    zeit = np.arange(n_times) / 60 - 4.0
+    df = pd.DataFrame({'location': np.repeat(np.arange(1, n_wells+1), n_times),
+                       'zeit': np.tile(zeit, n_wells),
+                       'zeit_ind': np.tile(np.arange(n_times), n_wells),
+                       'activity': np.repeat(np.arange(n_wells, dtype=float),
+                                             n_times),
+                       'genotype': np.repeat(['wt', 'mut'] * 3, n_times),
+                       'instrument': 1,
+                       'trial': 1})
+
+    img, x_start, bin_width, row_gtypes = \
+            fishact.visualize._actogram_raster(df, max_bins=100)
+    assert img.shape == (6, 100)
+    assert x_start == -4.0
+    assert np.isclose(bin_width, 29 / 60)
+    assert list(row_gtypes) == ['mut'] * 3 + ['wt'] * 3
+    assert np.allclose(img[:, 0], [1, 3, 5, 0, 2, 4])
+
+    # Rows of the same genotype are averaged, not across genotypes
+    img, _, _, row_gtypes = fishact.visualize._actogram_raster(
+                                df, max_bins=100, max_rows=4, sort_by='mean')
+    assert list(row_gtypes) == ['mut', 'mut', 'wt', 'wt']
+    assert np.allclose(img[:, 0], [4, 1, 3, 0])
+
+    # max_rows is a hard bound
+    for max_rows in range(1, 6):
+        img, _, _, row_gtypes = fishact.visualize._actogram_raster(
+                                df, max_bins=100, max_rows=max_rows)
+        assert len(img) == len(row_gtypes) <= max(max_rows, 2)
+        if max_rows == 3:
+            assert np.allclose(img[:, 0], [3, 2])
+
+    # Double plot: one row per well-day, 48 hours wide
+    img, x_start, bin_width, _ = fishact.visualize._actogram_raster(
+                                df, bin_width=1.0, double_plot=True)
+    assert x_start == -24.0
+    assert img.shape == (6 * 3, 48)
+    assert np.isnan(img[0, :20]).all() and np.allclose(img[0, 20:], 1.0)
+    assert np.isnan(img[2, 20:]).all()
+
+    p = fishact.visualize.actogram(df, double_plot=True)
+    assert len(p.renderers) == 1